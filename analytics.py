@@ -0,0 +1,138 @@
+"""Incrementally maintained rollups for saved test statistics.
+
+test_stats holds one row per test (attempt count, score sum, best and latest
+score) and test_question_stats one row per (test, question). Both are updated
+in the same transaction that completes, changes or deletes an attempt, so the
+test listing and analytics endpoints read them directly instead of grouping
+every attempt and answer on each request. rebuild_test_stats() recomputes them
+from scratch.
+"""
+
+
+def record_attempt(conn, attempt_id):
+    """Add a completed attempt and its answers to the rollups"""
+    attempt = conn.execute('''
+        SELECT test_id, percentage, completed_at FROM test_attempts
+        WHERE id = ? AND completed = 1
+    ''', (attempt_id,)).fetchone()
+    if not attempt:
+        return
+
+    conn.execute('''
+        INSERT INTO test_stats (test_id, attempt_count, score_sum, best_score, latest_score, latest_completed_at)
+        VALUES (?, 1, COALESCE(?, 0), ?, ?, ?)
+        ON CONFLICT(test_id) DO UPDATE SET
+            attempt_count = attempt_count + 1,
+            score_sum = score_sum + excluded.score_sum,
+            best_score = CASE WHEN best_score IS NULL OR excluded.best_score > best_score
+                              THEN excluded.best_score ELSE best_score END,
+            latest_score = CASE WHEN latest_completed_at IS NULL OR excluded.latest_completed_at > latest_completed_at
+                                THEN excluded.latest_score
+                                -- Same second: break the tie by id, as rebuild_test_stats does
+                                WHEN excluded.latest_completed_at = latest_completed_at
+                                THEN (SELECT percentage FROM test_attempts
+                                      WHERE test_id = excluded.test_id AND completed = 1
+                                      ORDER BY completed_at DESC, id DESC LIMIT 1)
+                                ELSE latest_score END,
+            latest_completed_at = CASE WHEN latest_completed_at IS NULL OR excluded.latest_completed_at >= latest_completed_at
+                                       THEN excluded.latest_completed_at ELSE latest_completed_at END
+    ''', (attempt['test_id'], attempt['percentage'], attempt['percentage'], attempt['percentage'],
+          attempt['completed_at']))
+
+    conn.execute('''
+        INSERT INTO test_question_stats (test_id, question_number, correct_count, total_attempts)
+        SELECT ?, question_number, SUM(CASE WHEN is_correct = 1 THEN 1 ELSE 0 END), COUNT(*)
+        FROM test_answers
+        WHERE attempt_id = ?
+        GROUP BY question_number
+        ON CONFLICT(test_id, question_number) DO UPDATE SET
+            correct_count = correct_count + excluded.correct_count,
+            total_attempts = total_attempts + excluded.total_attempts
+    ''', (attempt['test_id'], attempt_id))
+
+
+def forget_attempt(conn, attempt_id):
+    """Remove a completed attempt's contribution (call before changing or deleting it)"""
+    attempt = conn.execute('''
+        SELECT test_id, percentage FROM test_attempts
+        WHERE id = ? AND completed = 1
+    ''', (attempt_id,)).fetchone()
+    if not attempt:
+        return
+    test_id = attempt['test_id']
+
+    conn.execute('''
+        UPDATE test_question_stats
+        SET correct_count = test_question_stats.correct_count - a.correct,
+            total_attempts = test_question_stats.total_attempts - a.total
+        FROM (
+            SELECT question_number,
+                   SUM(CASE WHEN is_correct = 1 THEN 1 ELSE 0 END) AS correct,
+                   COUNT(*) AS total
+            FROM test_answers
+            WHERE attempt_id = ?
+            GROUP BY question_number
+        ) AS a
+        WHERE test_question_stats.test_id = ? AND test_question_stats.question_number = a.question_number
+    ''', (attempt_id, test_id))
+    conn.execute('DELETE FROM test_question_stats WHERE test_id = ? AND total_attempts <= 0', (test_id,))
+
+    # Best and latest can't be decremented; re-read them from the remaining attempts of this test only
+    conn.execute('''
+        UPDATE test_stats SET
+            attempt_count = attempt_count - 1,
+            score_sum = score_sum - COALESCE(?, 0),
+            best_score = (SELECT MAX(percentage) FROM test_attempts
+                          WHERE test_id = ? AND completed = 1 AND id != ?),
+            latest_score = (SELECT percentage FROM test_attempts
+                            WHERE test_id = ? AND completed = 1 AND id != ?
+                            ORDER BY completed_at DESC, id DESC LIMIT 1),
+            latest_completed_at = (SELECT MAX(completed_at) FROM test_attempts
+                                   WHERE test_id = ? AND completed = 1 AND id != ?)
+        WHERE test_id = ?
+    ''', (attempt['percentage'], test_id, attempt_id, test_id, attempt_id, test_id, attempt_id, test_id))
+    conn.execute('DELETE FROM test_stats WHERE test_id = ? AND attempt_count <= 0', (test_id,))
+
+
+def forget_test(conn, test_id):
+    conn.execute('DELETE FROM test_stats WHERE test_id = ?', (test_id,))
+    conn.execute('DELETE FROM test_question_stats WHERE test_id = ?', (test_id,))
+
+
+def rebuild_test_stats(conn):
+    """Recompute both rollup tables from test_attempts and test_answers"""
+    conn.execute('DELETE FROM test_stats')
+    conn.execute('DELETE FROM test_question_stats')
+
+    conn.execute('''
+        INSERT INTO test_stats (test_id, attempt_count, score_sum, best_score, latest_score, latest_completed_at)
+        SELECT ta.test_id,
+               COUNT(*),
+               COALESCE(SUM(ta.percentage), 0),
+               MAX(ta.percentage),
+               (SELECT latest.percentage FROM test_attempts latest
+                WHERE latest.test_id = ta.test_id AND latest.completed = 1
+                ORDER BY latest.completed_at DESC, latest.id DESC LIMIT 1),
+               MAX(ta.completed_at)
+        FROM test_attempts ta
+        WHERE ta.completed = 1
+        GROUP BY ta.test_id
+    ''')
+
+    conn.execute('''
+        INSERT INTO test_question_stats (test_id, question_number, correct_count, total_attempts)
+        SELECT ta.test_id, ans.question_number,
+               SUM(CASE WHEN ans.is_correct = 1 THEN 1 ELSE 0 END),
+               COUNT(*)
+        FROM test_answers ans
+        JOIN test_attempts ta ON ta.id = ans.attempt_id
+        WHERE ta.completed = 1
+        GROUP BY ta.test_id, ans.question_number
+    ''')
+
+
+def snapshot_test_stats(conn):
+    """Current rollup contents, for comparing before and after a rebuild"""
+    tests = conn.execute('SELECT * FROM test_stats ORDER BY test_id').fetchall()
+    questions = conn.execute('SELECT * FROM test_question_stats ORDER BY test_id, question_number').fetchall()
+    return [tuple(row) for row in tests], [tuple(row) for row in questions]
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_file, redirect
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory, redirect
 from flask_cors import CORS
 import sqlite3
 import json
@@ -6,31 +6,62 @@ from datetime import datetime
 import os
 import requests
 from werkzeug.utils import secure_filename
-import PyPDF2
-from docx import Document
-from pptx import Presentation
-import io
-from ollama import Client
+import functools
+import shutil
+import tempfile
 import time
-from pywhispercpp.model import Model
+from db import connection, get_db_connection, init_db_app
+from material_cache import evict_material, extract_with_cache, list_materials
+from migrations import apply_migrations
+from backup import current_watermark, gzip_stream, iter_ndjson, legacy_backup, parse_watermark, write_snapshot
+from batch import BatchError, grade_percentage, run_batch
+from chunked_generation import GENERATION_MODES, chunk_materials, iter_chunk_results, merge_parts, needs_chunking
+from etag import conditional
+from extraction import format_page_selection, parse_page_selection
+import llm_cache
+from llm_gateway import LLMUnavailable
+from ollama_client import (ENHANCE_OPTIONS, OLLAMA_HOST, OLLAMA_MODEL, build_enhance_prompt,
+                           enhance_transcript_with_ai, generate_text, llm, stream_ollama)
+from jobs import (JobFailed, enqueue, finish_job, get_job, job_handler, report_progress, start_dispatcher,
+                  start_inline_job, wait_for_job)
+from sse import sse_event, sse_response, sse_retry
+from transcription import (AUDIO_FOLDER, LIVE_FINISH_KIND, LIVE_QUEUE, LIVE_SEGMENT_KIND, TRANSCRIBE_KIND, TRANSCRIBE_MODE,
+                           TRANSCRIBE_MODES, TRANSCRIBE_QUEUE, TRANSCRIBER_STALE_SECONDS, resolve_options,
+                           segments_to_text, stitch)
+from live_notes import (COMPLETE, FINISHING, LIVE_SEGMENT_SECONDS, RECORDING, add_segment, create_live_note,
+                        delete_segments, get_live_note, get_segment, segment_counts, segments_after,
+                        set_live_status)
+from transcript_segments import (MAX_WINDOW_SEGMENTS, delete_transcript_segments, next_segment_start,
+                                 position_for_offset, segments_in_window, transcript_timing)
+from static_assets import CachedAsset
+from sync import changes_since, parse_sync_tables
+from analytics import forget_attempt, forget_test, rebuild_test_stats, record_attempt, snapshot_test_stats
+from questions import (attempt_question_count, attempt_score, count_questions, get_questions, grade_answers,
+                       store_questions)
+from pagination import PaginationError, date_filters, keyset_page, page_response, parse_bool, projection
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
-
-# Ollama Configuration
-OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'https://ollama.com')
-OLLAMA_API_KEY = os.getenv('OLLAMA_API_KEY', '1728cbe73f944db7afa1a3c8f52d2f41.GzEVZ8ADdcDHwIxdbvKnqbXy')
-OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'gpt-oss:120b-cloud')  # Cloud model
-
-# Initialize Ollama client
-ollama_client = Client(
-    host=OLLAMA_HOST,
-    headers={'Authorization': f'Bearer {OLLAMA_API_KEY}'}
-)
+init_db_app(app)  # Release pooled SQLite connections at the end of every request
+
+TEST_GENERATION_OPTIONS = {
+    'temperature': 0.7,
+    'num_predict': 16000  # Large limit for 100+ questions (~16k tokens)
+}
+# How often a streaming request refreshes its job's heartbeat
+STREAM_HEARTBEAT_SECONDS = 10
+
+def llm_cache_requested(data=None):
+    """False when the client sent cache=false (form field, query string or JSON body)"""
+    value = request.values.get('cache')
+    if value is None and data:
+        value = data.get('cache')
+    if value is None:
+        return True
+    return bool(parse_bool(str(value)))
 
 # File Upload Configuration
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
-AUDIO_FOLDER = os.path.join(os.path.dirname(__file__), 'audio_storage')
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx', 'doc', 'md', 'pptx', 'ppt'}
 ALLOWED_AUDIO_EXTENSIONS = {'mp3', 'wav', 'webm', 'm4a', 'ogg', 'flac'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -41,102 +72,12 @@ app.config['MAX_CONTENT_LENGTH'] = 200 * 1024 * 1024  # 200 MB max file size
 if not os.path.exists(AUDIO_FOLDER):
     os.makedirs(AUDIO_FOLDER)
 
-# Initialize Whisper model (lazy load)
-whisper_model = None
-
-def get_whisper_model():
-    """Lazy load Whisper model"""
-    global whisper_model
-    if whisper_model is None:
-        print("Loading Whisper model (this may take a moment on first run)...")
-        # Force CPU mode by setting environment variables
-        os.environ['GGML_CUDA_NO_PINNED'] = '1'
-        os.environ['WHISPER_NO_GPU'] = '1'
-        # Initialize with minimal parameters to avoid GPU
-        whisper_model = Model('base', n_threads=4, print_progress=False)
-        print("Whisper model loaded successfully!")
-    return whisper_model
-
-# Database setup
-# Database configuration
-DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
-DATABASE = os.path.join(DATA_DIR, 'nursing_app.db')
-
-# Ensure data directory exists
-os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
-
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_pdf(file_stream):
-    """Extract text from PDF file"""
-    try:
-        pdf_reader = PyPDF2.PdfReader(file_stream)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n\n"
-        return text
-    except Exception as e:
-        return f"Error extracting PDF: {str(e)}"
-
-def extract_text_from_docx(file_stream):
-    """Extract text from DOCX file"""
-    try:
-        doc = Document(file_stream)
-        text = "\n\n".join([paragraph.text for paragraph in doc.paragraphs])
-        return text
-    except Exception as e:
-        return f"Error extracting DOCX: {str(e)}"
-
-def extract_text_from_pptx(file_stream):
-    """Extract text from PowerPoint file"""
-    try:
-        prs = Presentation(file_stream)
-        text_content = []
-
-        for slide_num, slide in enumerate(prs.slides, 1):
-            slide_text = [f"--- Slide {slide_num} ---"]
-
-            # Extract text from shapes
-            for shape in slide.shapes:
-                if hasattr(shape, "text") and shape.text:
-                    slide_text.append(shape.text)
-
-                # Extract text from tables
-                if shape.has_table:
-                    for row in shape.table.rows:
-                        row_text = " | ".join([cell.text for cell in row.cells])
-                        slide_text.append(row_text)
-
-            text_content.append("\n".join(slide_text))
-
-        return "\n\n".join(text_content)
-    except Exception as e:
-        return f"Error extracting PowerPoint: {str(e)}"
-
-def extract_text_from_file(file):
-    """Extract text from uploaded file based on extension"""
-    filename = secure_filename(file.filename)
-    file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-
-    if file_ext == 'pdf':
-        return extract_text_from_pdf(file)
-    elif file_ext in ['docx', 'doc']:
-        return extract_text_from_docx(file)
-    elif file_ext in ['pptx', 'ppt']:
-        return extract_text_from_pptx(file)
-    elif file_ext in ['txt', 'md']:
-        return file.read().decode('utf-8')
-    else:
-        return "Unsupported file type"
-
 def init_database():
     """Initialize the database with required tables"""
     conn = get_db_connection()
@@ -311,18 +252,70 @@ def init_database():
     ''')
 
     conn.commit()
+
+    # Bring the schema up to date (indexes, constraints, later tables)
+    apply_migrations(conn)
     conn.close()
 
 # API Routes
 
+# Server-side filters accepted by the list endpoints (see pagination.build_filters)
+ASSIGNMENT_FILTERS = {
+    'course': ('course = ?', str),
+    'status': ('status = ?', str),
+    'completed': ('completed = ?', parse_bool),
+    **date_filters('due_date'),
+}
+GRADE_FILTERS = {
+    'course': ('course = ?', str),
+    'type': ('type = ?', str),
+    **date_filters('date'),
+}
+STRESS_LOG_FILTERS = date_filters('date')
+FLASHCARD_FILTERS = date_filters('created_at', timestamp=True)
+AUDIO_NOTE_FILTERS = {
+    'course': ('course = ?', str),
+    **date_filters('lecture_date'),
+}
+TEST_FILTERS = date_filters('st.created_at', timestamp=True)
+
+# Fields selectable with ?fields= on the heavy listings; view=summary skips the text bodies
+AUDIO_NOTE_FIELDS = {
+    **{name: name for name in ('id', 'title', 'audio_file_path', 'transcript', 'enhanced_notes',
+                               'duration_seconds', 'file_size_mb', 'transcription_time_seconds',
+                               'lecture_date', 'course', 'is_enhanced', 'live_status', 'created_at')},
+    'transcript_length': 'length(transcript)',
+    'enhanced_notes_length': 'length(enhanced_notes)',
+    'transcript_preview': 'substr(transcript, 1, 200)',
+}
+AUDIO_NOTE_SUMMARY = ('id', 'title', 'course', 'lecture_date', 'created_at', 'audio_file_path',
+                      'duration_seconds', 'file_size_mb', 'transcription_time_seconds', 'is_enhanced', 'live_status',
+                      'transcript_length', 'enhanced_notes_length', 'transcript_preview')
+TEST_FIELDS = {
+    **{name: f'st.{name}' for name in ('id', 'title', 'test_content', 'solutions_content',
+                                       'question_count', 'created_at')},
+    'attempt_count': 'COALESCE(ts.attempt_count, 0)',
+    'best_score': 'ts.best_score',
+    'test_length': 'length(st.test_content)',
+    'solutions_length': 'length(st.solutions_content)',
+}
+TEST_SUMMARY = ('id', 'title', 'question_count', 'created_at', 'attempt_count', 'best_score',
+                'test_length', 'solutions_length')
+
+@app.errorhandler(PaginationError)
+def pagination_error(e):
+    return jsonify({'error': str(e)}), 400
+
 @app.route('/api/assignments', methods=['GET', 'POST'])
+@conditional('assignments')
 def assignments():
     conn = get_db_connection()
     
     if request.method == 'GET':
-        assignments = conn.execute('SELECT * FROM assignments ORDER BY due_date ASC').fetchall()
+        assignments, next_cursor = keyset_page(conn, 'SELECT * FROM assignments', 'due_date',
+                                               request.args, filters=ASSIGNMENT_FILTERS)
         conn.close()
-        return jsonify([dict(row) for row in assignments])
+        return jsonify(page_response(assignments, next_cursor, request.args))
     
     elif request.method == 'POST':
         data = request.json
@@ -361,6 +354,7 @@ def assignment_detail(assignment_id):
         return jsonify({'success': True})
 
 @app.route('/api/clinical-shifts', methods=['GET', 'POST'])
+@conditional('clinical_shifts')
 def clinical_shifts():
     conn = get_db_connection()
     
@@ -404,6 +398,7 @@ def clinical_shift_detail(shift_id):
         return jsonify({'success': True})
 
 @app.route('/api/requirements', methods=['GET', 'POST'])
+@conditional('requirements')
 def requirements():
     conn = get_db_connection()
     
@@ -447,6 +442,7 @@ def requirement_detail(req_id):
         return jsonify({'success': True})
 
 @app.route('/api/goals', methods=['GET', 'POST'])
+@conditional('goals')
 def goals():
     conn = get_db_connection()
     
@@ -491,17 +487,19 @@ def goal_detail(goal_id):
         return jsonify({'success': True})
 
 @app.route('/api/grades', methods=['GET', 'POST'])
+@conditional('grades')
 def grades():
     conn = get_db_connection()
     
     if request.method == 'GET':
-        grades = conn.execute('SELECT * FROM grades ORDER BY date DESC').fetchall()
+        grades, next_cursor = keyset_page(conn, 'SELECT * FROM grades', 'date', request.args,
+                                          descending=True, filters=GRADE_FILTERS)
         conn.close()
-        return jsonify([dict(row) for row in grades])
+        return jsonify(page_response(grades, next_cursor, request.args))
     
     elif request.method == 'POST':
         data = request.json
-        percentage = round((float(data['grade']) / float(data['maxPoints'])) * 100)
+        percentage = grade_percentage(data['grade'], data['maxPoints'])
         cursor = conn.execute('''
             INSERT INTO grades (course, assessment, type, grade, max_points, weight, date, percentage)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
@@ -522,13 +520,15 @@ def grade_detail(grade_id):
     return jsonify({'success': True})
 
 @app.route('/api/flashcards', methods=['GET', 'POST'])
+@conditional('flashcards')
 def flashcards():
     conn = get_db_connection()
     
     if request.method == 'GET':
-        flashcards = conn.execute('SELECT * FROM flashcards ORDER BY created_at DESC').fetchall()
+        flashcards, next_cursor = keyset_page(conn, 'SELECT * FROM flashcards', 'created_at', request.args,
+                                              descending=True, filters=FLASHCARD_FILTERS)
         conn.close()
-        return jsonify([dict(row) for row in flashcards])
+        return jsonify(page_response(flashcards, next_cursor, request.args))
     
     elif request.method == 'POST':
         data = request.json
@@ -550,23 +550,29 @@ def flashcard_detail(card_id):
     return jsonify({'success': True})
 
 @app.route('/api/stress-logs', methods=['GET', 'POST'])
+@conditional('stress_logs')
 def stress_logs():
     conn = get_db_connection()
     
     if request.method == 'GET':
-        logs = conn.execute('SELECT * FROM stress_logs ORDER BY date DESC').fetchall()
+        logs, next_cursor = keyset_page(conn, 'SELECT * FROM stress_logs', 'date', request.args,
+                                        descending=True, filters=STRESS_LOG_FILTERS)
         conn.close()
-        return jsonify([dict(row) for row in logs])
+        return jsonify(page_response(logs, next_cursor, request.args))
     
     elif request.method == 'POST':
         data = request.json
-        cursor = conn.execute('''
-            INSERT OR REPLACE INTO stress_logs (date, stress_level, mood, notes, study_hours, sleep_hours)
+        # Upsert rather than REPLACE so the day's row keeps its id (sync clients track rows by id)
+        conn.execute('''
+            INSERT INTO stress_logs (date, stress_level, mood, notes, study_hours, sleep_hours)
             VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(date) DO UPDATE SET
+                stress_level = excluded.stress_level, mood = excluded.mood, notes = excluded.notes,
+                study_hours = excluded.study_hours, sleep_hours = excluded.sleep_hours
         ''', (data['date'], data['stress_level'], data.get('mood'),
               data.get('notes'), data.get('study_hours'), data.get('sleep_hours')))
         conn.commit()
-        log_id = cursor.lastrowid
+        log_id = conn.execute('SELECT id FROM stress_logs WHERE date = ?', (data['date'],)).fetchone()['id']
         conn.close()
         return jsonify({'id': log_id}), 201
 
@@ -579,6 +585,7 @@ def stress_log_detail(log_id):
     return jsonify({'success': True})
 
 @app.route('/api/settings', methods=['GET', 'POST'])
+@conditional('settings')
 def settings():
     conn = get_db_connection()
     
@@ -591,13 +598,42 @@ def settings():
         data = request.json
         for key, value in data.items():
             conn.execute('''
-                INSERT OR REPLACE INTO settings (key, value, updated_at)
+                INSERT INTO settings (key, value, updated_at)
                 VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+                WHERE value IS NOT excluded.value
             ''', (key, str(value)))
         conn.commit()
         conn.close()
         return jsonify({'success': True})
 
+@app.route('/api/batch', methods=['POST'])
+def batch_mutations():
+    """Apply an ordered list of create/update/delete operations in a single transaction"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object', 'index': None}), 400
+    conn = get_db_connection()
+
+    try:
+        results = run_batch(conn, data.get('operations'))
+    except BatchError as e:
+        return jsonify({'error': str(e), 'index': e.index}), e.status
+
+    return jsonify({'success': True, 'results': results})
+
+@app.route('/api/sync', methods=['GET'])
+def sync_changes():
+    """Rows created, changed or deleted since the client's last sync token (?since=<token>)"""
+    try:
+        since = int(request.args.get('since', 0))
+        tables = parse_sync_tables(request.args.get('tables'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = get_db_connection()
+    return jsonify(changes_since(conn, max(since, 0), tables))
+
 @app.route('/api/initialize', methods=['POST'])
 def initialize_data():
     """Initialize database with default requirements"""
@@ -626,8 +662,9 @@ def initialize_data():
         
         # Set default current semester
         conn.execute('''
-            INSERT OR REPLACE INTO settings (key, value)
+            INSERT INTO settings (key, value)
             VALUES ('currentSemester', '1')
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
         ''')
         
         conn.commit()
@@ -635,96 +672,114 @@ def initialize_data():
     conn.close()
     return jsonify({'success': True})
 
+# Frontend document, kept in memory with precompressed variants (reloaded when the file changes)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTEND = CachedAsset(os.path.join(BASE_DIR, 'database_enabled_frontend.html'), 'text/html')
+FAVICON_MAX_AGE = 7 * 24 * 3600  # one week
+
 @app.route('/')
 def index():
     """Serve the main application HTML file"""
-    with open('database_enabled_frontend.html', 'r', encoding='utf-8') as f:
-        return f.read()
+    return FRONTEND.response()
 
 @app.route('/favicon_io/<path:filename>')
 def favicon_files(filename):
     """Serve favicon files"""
-    from flask import send_from_directory
-    return send_from_directory('favicon_io', filename)
+    return send_from_directory(os.path.join(BASE_DIR, 'favicon_io'), filename, max_age=FAVICON_MAX_AGE)
 
 @app.route('/favicon.ico')
 def favicon():
     """Serve favicon.ico from root"""
-    from flask import send_from_directory
-    return send_from_directory('favicon_io', 'favicon.ico')
+    return send_from_directory(os.path.join(BASE_DIR, 'favicon_io'), 'favicon.ico', max_age=FAVICON_MAX_AGE)
 
 @app.route('/cert.pem')
 def serve_certificate():
     """Serve SSL certificate for manual installation on iOS"""
-    from flask import send_from_directory
     return send_from_directory('ssl', 'cert.pem', mimetype='application/x-pem-file')
 
 @app.route('/api/backup', methods=['GET'])
 def backup_data():
-    """Export all data as JSON for backup"""
-    conn = get_db_connection()
-    
-    backup = {
-        'assignments': [dict(row) for row in conn.execute('SELECT * FROM assignments').fetchall()],
-        'clinical_shifts': [dict(row) for row in conn.execute('SELECT * FROM clinical_shifts').fetchall()],
-        'requirements': [dict(row) for row in conn.execute('SELECT * FROM requirements').fetchall()],
-        'goals': [dict(row) for row in conn.execute('SELECT * FROM goals').fetchall()],
-        'grades': [dict(row) for row in conn.execute('SELECT * FROM grades').fetchall()],
-        'flashcards': [dict(row) for row in conn.execute('SELECT * FROM flashcards').fetchall()],
-        'settings': {row['key']: row['value'] for row in conn.execute('SELECT * FROM settings').fetchall()},
-        'backup_date': datetime.now().isoformat()
-    }
-    
-    conn.close()
-    return jsonify(backup)
-
-@app.route('/api/generate-test', methods=['POST'])
-def generate_test():
-    """Generate practice test and solution sheet from uploaded study materials using Ollama AI"""
+    """Export all data for backup.
+
+    ?format=json (default) returns one JSON document, ?format=ndjson streams one
+    row per line (add &gzip=1 to compress) and ?format=sqlite returns a database
+    snapshot. ?since=<X-Backup-Watermark of the last run> limits any format to
+    rows created or changed since then.
+    """
+    backup_format = request.args.get('format', 'json')
     try:
-        print("=== Starting test generation ===")
-
-        # Check if files were uploaded
-        if 'files' not in request.files:
-            print("ERROR: No files in request")
-            return jsonify({'error': 'No files uploaded'}), 400
-
-        files = request.files.getlist('files')
-        prompt = request.form.get('prompt', 'Generate a comprehensive practice test')
-        print(f"Received {len(files)} files")
-
-        if not files or all(file.filename == '' for file in files):
-            print("ERROR: No files selected or empty filenames")
-            return jsonify({'error': 'No files selected'}), 400
-
-        # Extract text from all uploaded files
-        study_materials = []
-        for file in files:
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                print(f"Extracting text from: {filename}")
-                text = extract_text_from_file(file)
-                print(f"Extracted {len(text)} characters from {filename}")
-                study_materials.append({
-                    'filename': filename,
-                    'content': text
-                })
+        since = parse_watermark(request.args.get('since'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-        if not study_materials:
-            print("ERROR: No valid files after processing")
-            return jsonify({'error': 'No valid files uploaded'}), 400
-
-        print(f"Successfully processed {len(study_materials)} files")
-
-        # Combine all study materials
-        combined_content = "\n\n---\n\n".join([
-            f"File: {mat['filename']}\n\n{mat['content']}"
-            for mat in study_materials
-        ])
-        print(f"Total content length: {len(combined_content)} characters")
-
-        # Build the prompt for Ollama
-        system_prompt = f"""You are a nursing education assistant. Based on the provided study materials, create a comprehensive practice test and separate solution sheet.
+    conn = get_db_connection()
+    # Taken before reading anything, so the next incremental run can't miss a row
+    watermark = current_watermark(conn)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    if backup_format == 'json':
+        response = jsonify(legacy_backup(conn, since))
+    elif backup_format == 'ndjson':
+        lines = iter_ndjson(since, watermark)
+        if request.args.get('gzip', 'false').lower() in ('1', 'true'):
+            response = Response(gzip_stream(lines), mimetype='application/gzip')
+            response.headers['Content-Disposition'] = f'attachment; filename=nursing_backup_{stamp}.ndjson.gz'
+        else:
+            response = Response(lines, mimetype='application/x-ndjson')
+            response.headers['Content-Disposition'] = f'attachment; filename=nursing_backup_{stamp}.ndjson'
+    elif backup_format == 'sqlite':
+        path = write_snapshot(since)
+        snapshot = open(path, 'rb')
+        os.remove(path)  # the open handle keeps the data until the response is sent
+        response = send_file(snapshot, mimetype='application/vnd.sqlite3', as_attachment=True,
+                             download_name=f'nursing_backup_{stamp}.db')
+    else:
+        return jsonify({'error': f'Unknown backup format: {backup_format}'}), 400
+
+    response.headers['X-Backup-Watermark'] = watermark
+    return response
+
+class GenerationError(Exception):
+    """The LLM call failed; carries the JSON error body returned to the client"""
+
+    def __init__(self, body, status=500):
+        super().__init__(body.get('error'))
+        self.body = body
+        self.status = status
+
+def extract_study_materials(files):
+    """Extract the allowed (filename, bytes, page ranges) entries, from the material cache or in parallel.
+
+    Returns (materials, timings). Uses its own connection since job threads have no app context.
+    """
+    with connection() as conn:
+        return extract_with_cache(conn, (entry for entry in files if allowed_file(entry[0])))
+
+def requested_page_selections(files):
+    """Page ranges per uploaded file from the pages= form field.
+
+    One value applies to every file; otherwise there must be one value per
+    file (an empty value means the whole file). Raises ValueError.
+    """
+    values = request.form.getlist('pages')
+    if not values:
+        return [None] * len(files)
+    if len(values) == 1:
+        values = values * len(files)
+    elif len(values) != len(files):
+        raise ValueError('pages must be given once, or once per uploaded file')
+    return [parse_page_selection(value) for value in values]
+
+def build_test_prompt(prompt, study_materials):
+    """Build the test generation prompt for Ollama"""
+    # Combine all study materials
+    combined_content = "\n\n---\n\n".join([
+        f"File: {mat['filename']}\n\n{mat['content']}"
+        for mat in study_materials
+    ])
+    print(f"Total content length: {len(combined_content)} characters")
+
+    return f"""You are a nursing education assistant. Based on the provided study materials, create a comprehensive practice test and separate solution sheet.
 
 IMPORTANT USER REQUEST: {prompt}
 
@@ -754,84 +809,222 @@ Format your response as JSON:
 
 Respond ONLY with valid JSON. Make sure to honor the user's requested number of questions."""
 
-        # Call Ollama Cloud API
-        print(f"Calling Ollama Cloud at: {OLLAMA_HOST}")
-        print(f"Using model: {OLLAMA_MODEL}")
-        print(f"Prompt length: {len(system_prompt)} characters")
-
-        # Try with retry logic for cloud API
-        max_retries = 2
-        for attempt in range(max_retries):
-            try:
-                print(f"Attempt {attempt + 1} of {max_retries}")
-
-                # Use ollama client library to generate response
-                response = ollama_client.generate(
-                    model=OLLAMA_MODEL,
-                    prompt=system_prompt,
-                    options={
-                        'temperature': 0.7,
-                        'num_predict': 16000  # Large limit for 100+ questions (~16k tokens)
-                    }
-                )
-
-                generated_text = response['response']
-                print(f"✓ Received response: {len(generated_text)} characters")
-                break  # Success, exit retry loop
-
-            except Exception as e:
-                error_msg = str(e)
-                print(f"✗ Attempt {attempt + 1} failed: {error_msg}")
-
-                if attempt < max_retries - 1:
-                    print(f"Retrying in 3 seconds...")
-                    import time
-                    time.sleep(3)
-                else:
-                    # Last attempt failed
-                    print(f"All {max_retries} attempts failed")
-
-                    # Provide helpful error message
-                    if '502' in error_msg or 'upstream' in error_msg:
-                        return jsonify({
-                            'error': 'Ollama Cloud is temporarily overloaded',
-                            'details': 'The cloud service returned a 502 error. This usually happens with large requests. Try: 1) Uploading fewer files, 2) Requesting fewer questions (e.g., 50 instead of 100), or 3) Waiting a few minutes and trying again.',
-                            'technical_details': error_msg
-                        }), 500
-                    else:
-                        return jsonify({
-                            'error': 'Failed to connect to Ollama Cloud',
-                            'details': str(e),
-                            'host': OLLAMA_HOST
-                        }), 500
+def call_ollama_for_test(system_prompt, use_cache=True):
+    """Run the generation (the gateway retries overloads); raises GenerationError if it fails"""
+    print(f"Calling Ollama Cloud at: {OLLAMA_HOST}")
+    print(f"Using model: {OLLAMA_MODEL}")
+    print(f"Prompt length: {len(system_prompt)} characters")
+
+    try:
+        generated_text = generate_text(system_prompt, TEST_GENERATION_OPTIONS, use_cache)
+        print(f"✓ Received response: {len(generated_text)} characters")
+        return generated_text
+
+    except LLMUnavailable as e:
+        print(f"✗ Ollama Cloud unavailable: {e}")
+        raise GenerationError({
+            'error': 'Ollama Cloud is temporarily unavailable',
+            'details': f'{e}. Please try again in a minute.',
+            'retry_after': e.retry_after
+        }, status=503)
+    except Exception as e:
+        error_msg = str(e)
+        print(f"✗ Generation failed: {error_msg}")
+
+        # Provide helpful error message
+        if '502' in error_msg or 'upstream' in error_msg:
+            raise GenerationError({
+                'error': 'Ollama Cloud is temporarily overloaded',
+                'details': 'The cloud service returned a 502 error. This usually happens with large requests. Try: 1) Uploading fewer files, 2) Requesting fewer questions (e.g., 50 instead of 100), or 3) Waiting a few minutes and trying again.',
+                'technical_details': error_msg
+            })
+        raise GenerationError({
+            'error': 'Failed to connect to Ollama Cloud',
+            'details': str(e),
+            'host': OLLAMA_HOST
+        })
+
+def parse_generated_test(generated_text):
+    """Split the model output into {'test', 'solutions'}"""
+    try:
+        # Look for JSON in the response
+        json_start = generated_text.find('{')
+        json_end = generated_text.rfind('}') + 1
+        if json_start != -1 and json_end > json_start:
+            json_text = generated_text[json_start:json_end]
+            return json.loads(json_text)
+        else:
+            # If no JSON found, split the response manually
+            parts = generated_text.split('SOLUTION SHEET')
+            test_content = parts[0].replace('TEST DOCUMENT', '').strip()
+            solution_content = parts[1].strip() if len(parts) > 1 else "Solutions not generated properly."
+
+            return {
+                'test': test_content,
+                'solutions': solution_content
+            }
+    except (json.JSONDecodeError, IndexError):
+        # If all parsing fails, return raw response
+        return {
+            'test': generated_text,
+            'solutions': 'Please review the test document above for answers.',
+            'note': 'AI response format was not as expected'
+        }
+
+def generate_test_part(system_prompt, use_cache=True):
+    return parse_generated_test(call_ollama_for_test(system_prompt, use_cache))
+
+def iter_chunked_test(prompt, materials, use_cache=True):
+    """Map-reduce generation: yields ('part', progress) as each chunk finishes, then ('done', merged test)"""
+    chunks = chunk_materials(materials)
+    print(f"Generating test in {len(chunks)} parts")
+    results, failed, last_error = [], [], None
+    generate = functools.partial(generate_test_part, use_cache=use_cache)
+    for chunk, result, error in iter_chunk_results(chunks, prompt, generate, build_test_prompt):
+        if error is None:
+            results.append((chunk, result))
+        else:
+            print(f"✗ Part {chunk.index + 1} failed: {error}")
+            failed.append(chunk.label)
+            last_error = error
+        yield 'part', {
+            'part': chunk.index + 1,
+            'parts': len(chunks),
+            'completed': len(results) + len(failed),
+            'label': chunk.label,
+            'status': 'ok' if error is None else 'failed'
+        }
+
+    if not results:
+        if isinstance(last_error, GenerationError):
+            raise last_error
+        raise GenerationError({'error': 'Failed to generate test', 'details': str(last_error)})
+
+    merged = merge_parts(results)
+    merged['parts'] = len(chunks)
+    if failed:
+        merged['note'] = 'Some parts of the study materials could not be turned into questions: ' + '; '.join(failed)
+    yield 'done', merged
+
+def generate_test_from_materials(prompt, materials, mode=None, on_part=None, use_cache=True):
+    """One generation call, or map-reduce over chunks when the materials are too large (see GENERATION_MODE)"""
+    if not needs_chunking(materials, mode):
+        return generate_test_part(build_test_prompt(prompt, materials), use_cache)
+    for event, data in iter_chunked_test(prompt, materials, use_cache):
+        if event == 'part' and on_part:
+            on_part(data)
+        elif event == 'done':
+            return data
+
+def save_job_uploads(files, selections):
+    """Copy uploads to disk so a queued job can read them after the request (and a restart)"""
+    job_dir = tempfile.mkdtemp(prefix='job_', dir=UPLOAD_FOLDER)
+    saved = []
+    for index, (file, ranges) in enumerate(zip(files, selections)):
+        filename = secure_filename(file.filename)
+        if allowed_file(filename):
+            path = os.path.join(job_dir, f'{index}_{filename}')
+            file.save(path)
+            saved.append({'filename': filename, 'path': path,
+                          'pages': format_page_selection(ranges) if ranges else None})
+    return job_dir, saved
+
+@job_handler('generate_test')
+def generate_test_job(job):
+    """Background version of /api/generate-test; the result is the same {'test', 'solutions'} body"""
+    try:
+        job.progress(0.05, 'Extracting text from study materials')
+        uploads = []
+        for upload in job.payload['files']:
+            with open(upload['path'], 'rb') as stream:
+                uploads.append((upload['filename'], stream.read(), parse_page_selection(upload.get('pages'))))
+        materials, timings = extract_study_materials(uploads)
+        if not materials:
+            raise JobFailed({'error': 'No valid files uploaded'})
+
+        job.progress(0.2, 'Generating test with AI')
+
+        def on_part(part):
+            job.progress(0.2 + 0.8 * part['completed'] / part['parts'],
+                         f"Generated part {part['completed']} of {part['parts']}")
 
-        # Try to parse as JSON first
         try:
-            # Look for JSON in the response
-            json_start = generated_text.find('{')
-            json_end = generated_text.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                json_text = generated_text[json_start:json_end]
-                test_data = json.loads(json_text)
-                return jsonify(test_data)
-            else:
-                # If no JSON found, split the response manually
-                parts = generated_text.split('SOLUTION SHEET')
-                test_content = parts[0].replace('TEST DOCUMENT', '').strip()
-                solution_content = parts[1].strip() if len(parts) > 1 else "Solutions not generated properly."
-
-                return jsonify({
-                    'test': test_content,
-                    'solutions': solution_content
-                })
-        except (json.JSONDecodeError, IndexError):
-            # If all parsing fails, return raw response
-            return jsonify({
-                'test': generated_text,
-                'solutions': 'Please review the test document above for answers.',
-                'note': 'AI response format was not as expected'
+            result = generate_test_from_materials(job.payload['prompt'], materials, job.payload.get('mode'),
+                                                  on_part, job.payload.get('use_cache', True))
+        except GenerationError as e:
+            raise JobFailed(e.body)
+        return {**result, 'extraction': timings}
+    finally:
+        shutil.rmtree(job.payload['job_dir'], ignore_errors=True)
+
+@app.route('/api/generate-test', methods=['POST'])
+def generate_test():
+    """Generate practice test and solution sheet from uploaded study materials using Ollama AI.
+
+    With async=true (form field or query string) the files are saved, a job is
+    queued and 202 {job_id, status_url} is returned; poll /api/jobs/<id>.
+    mode=auto|single|chunked picks one prompt or map-reduce over chunks.
+    pages=4-6,10 limits PDFs and slide decks to those pages (once for all
+    files, or once per file).
+    """
+    try:
+        print("=== Starting test generation ===")
+
+        # Check if files were uploaded
+        if 'files' not in request.files:
+            print("ERROR: No files in request")
+            return jsonify({'error': 'No files uploaded'}), 400
+
+        files = request.files.getlist('files')
+        prompt = request.form.get('prompt', 'Generate a comprehensive practice test')
+        print(f"Received {len(files)} files")
+
+        if not files or all(file.filename == '' for file in files):
+            print("ERROR: No files selected or empty filenames")
+            return jsonify({'error': 'No files selected'}), 400
+
+        mode = request.values.get('mode')
+        if mode and mode not in GENERATION_MODES:
+            return jsonify({'error': f"mode must be one of: {', '.join(GENERATION_MODES)}"}), 400
+
+        try:
+            selections = requested_page_selections(files)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if parse_bool(request.values.get('async', 'false')):
+            job_dir, saved = save_job_uploads(files, selections)
+            if not saved:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                return jsonify({'error': 'No valid files uploaded'}), 400
+
+            conn = get_db_connection()
+            job_id = enqueue(conn, 'generate_test', {
+                'prompt': prompt,
+                'mode': mode,
+                'use_cache': llm_cache_requested(),
+                'files': saved,
+                'job_dir': job_dir
             })
+            print(f"Queued test generation job {job_id} with {len(saved)} files")
+            return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': f'/api/jobs/{job_id}'}), 202
 
+        # Extract text from all uploaded files
+        study_materials, timings = extract_study_materials(
+            (secure_filename(file.filename), file.read(), ranges) for file, ranges in zip(files, selections) if file
+        )
+
+        if not study_materials:
+            print("ERROR: No valid files after processing")
+            return jsonify({'error': 'No valid files uploaded'}), 400
+
+        print(f"Successfully processed {len(study_materials)} files")
+
+        result = generate_test_from_materials(prompt, study_materials, mode, use_cache=llm_cache_requested())
+        return jsonify({**result, 'extraction': timings})
+
+    except GenerationError as e:
+        return jsonify(e.body), e.status
     except requests.exceptions.RequestException as e:
         return jsonify({
             'error': 'Failed to connect to Ollama',
@@ -841,6 +1034,152 @@ Respond ONLY with valid JSON. Make sure to honor the user's requested number of
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/generate-test/stream', methods=['POST'])
+def generate_test_stream():
+    """Same input as /api/generate-test, streamed as Server-Sent Events.
+
+    Events: job {job_id, status_url}, extraction [timings], token {text} for
+    each piece the model emits (or, when the materials are generated in
+    chunks, part {part, parts, completed, label, status} per finished chunk),
+    then done {test, solutions} or error {error, details}. The final result is
+    stored on the job, so it can be fetched from /api/jobs/<id> if the
+    connection drops after generation finished.
+    """
+    if 'files' not in request.files:
+        return jsonify({'error': 'No files uploaded'}), 400
+
+    files = request.files.getlist('files')
+    prompt = request.form.get('prompt', 'Generate a comprehensive practice test')
+    mode = request.values.get('mode')
+    if mode and mode not in GENERATION_MODES:
+        return jsonify({'error': f"mode must be one of: {', '.join(GENERATION_MODES)}"}), 400
+    try:
+        selections = requested_page_selections(files)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    study_materials, timings = extract_study_materials(
+        (secure_filename(file.filename), file.read(), ranges)
+        for file, ranges in zip(files, selections) if file and file.filename
+    )
+    if not study_materials:
+        return jsonify({'error': 'No valid files uploaded'}), 400
+
+    chunked = needs_chunking(study_materials, mode)
+    use_cache = llm_cache_requested()
+    job_id = start_inline_job(get_db_connection(), 'generate_test_stream', {
+        'prompt': prompt,
+        'files': [material['filename'] for material in study_materials]
+    })
+
+    def events():
+        finished = False
+        try:
+            yield sse_event('job', {'job_id': job_id, 'status_url': f'/api/jobs/{job_id}'})
+            yield sse_event('extraction', timings)
+            if chunked:
+                for event, data in iter_chunked_test(prompt, study_materials, use_cache):
+                    if event == 'part':
+                        report_progress(job_id, data['completed'] / data['parts'], f"Generated part {data['completed']} of {data['parts']}")
+                        yield sse_event('part', data)
+                    else:
+                        result = data
+                finish_job(job_id, 'succeeded', result=result)
+                finished = True
+                yield sse_event('done', result)
+                return
+
+            pieces = []
+            received = 0
+            last_heartbeat = time.monotonic()
+            for text in stream_ollama(build_test_prompt(prompt, study_materials), TEST_GENERATION_OPTIONS, use_cache):
+                pieces.append(text)
+                received += len(text)
+                yield sse_event('token', {'text': text})
+                if time.monotonic() - last_heartbeat >= STREAM_HEARTBEAT_SECONDS:
+                    report_progress(job_id, 0.5, f'Received {received} characters')
+                    last_heartbeat = time.monotonic()
+
+            result = parse_generated_test(''.join(pieces))
+            finish_job(job_id, 'succeeded', result=result)
+            finished = True
+            yield sse_event('done', result)
+        except Exception as e:
+            print(f"ERROR in generate_test_stream: {str(e)}")
+            error = e.body if isinstance(e, GenerationError) else {'error': 'Failed to generate test', 'details': str(e)}
+            finish_job(job_id, 'failed', error=error)
+            finished = True
+            yield sse_event('error', error)
+        finally:
+            if not finished:
+                finish_job(job_id, 'failed', error={'error': 'Client disconnected before the test was generated'})
+
+    return sse_response(events())
+
+@app.route('/api/materials', methods=['GET'])
+def get_cached_materials():
+    """List the extracted study materials in the cache, most recently used first"""
+    return jsonify(list_materials(get_db_connection()))
+
+@app.route('/api/materials', methods=['DELETE'])
+def clear_cached_materials():
+    """Empty the extracted material cache"""
+    removed = evict_material(get_db_connection())
+    return jsonify({'success': True, 'removed': removed})
+
+@app.route('/api/materials/<sha256>', methods=['DELETE'])
+def evict_cached_material(sha256):
+    """Drop one material from the cache so its next upload is parsed again"""
+    removed = evict_material(get_db_connection(), sha256.lower())
+    if not removed:
+        return jsonify({'error': 'Material not found'}), 404
+    return jsonify({'success': True, 'removed': removed})
+
+@app.route('/api/llm-cache', methods=['GET'])
+def get_llm_cache_stats():
+    """Entries, size and hit/miss counters of the LLM response cache"""
+    return jsonify(llm_cache.stats(get_db_connection()))
+
+@app.route('/api/llm-cache', methods=['DELETE'])
+def clear_llm_cache():
+    """Empty the LLM response cache and reset its counters"""
+    removed = llm_cache.clear(get_db_connection())
+    return jsonify({'success': True, 'removed': removed})
+
+@app.route('/api/llm/metrics', methods=['GET'])
+def get_llm_metrics():
+    """In-flight requests, circuit state, retries, latency percentiles and token counts for this worker"""
+    return jsonify(llm.metrics())
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Status, progress and (when finished) result or error of a background job.
+
+    ?wait=<seconds> (max 30) holds the request until the job finishes.
+    """
+    conn = get_db_connection()
+    try:
+        wait = min(float(request.args.get('wait', 0)), 30)
+    except ValueError:
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+
+    job = wait_for_job(conn, job_id, wait) if wait > 0 else get_job(conn, job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+# Set RUN_JOB_DISPATCHER=false for processes that should only enqueue
+RUN_JOB_DISPATCHER = parse_bool(os.getenv('RUN_JOB_DISPATCHER', 'true'))
+
+@app.before_request
+def ensure_job_dispatcher():
+    """Start this worker's job dispatcher on its first request.
+
+    Not at import time, so `flask` CLI commands don't claim jobs they would abandon.
+    Jobs queued before a restart are picked up as soon as the first request arrives.
+    """
+    if RUN_JOB_DISPATCHER:
+        start_dispatcher()
+
 # Saved Tests API Routes
 
 @app.route('/api/tests/save', methods=['POST'])
@@ -859,13 +1198,18 @@ def save_test():
             INSERT INTO saved_tests (title, test_content, solutions_content, question_count)
             VALUES (?, ?, ?, ?)
         ''', (data['title'], data['test'], data['solutions'], data.get('questionCount', 0)))
+        test_id = cursor.lastrowid
+
+        # Parse once here so taking and grading the test never needs the markdown again
+        question_count = store_questions(conn, test_id, data['test'], data['solutions'])
+        if not data.get('questionCount'):
+            conn.execute('UPDATE saved_tests SET question_count = ? WHERE id = ?', (question_count, test_id))
 
         conn.commit()
-        test_id = cursor.lastrowid
         conn.close()
 
-        print(f"Successfully saved test with ID: {test_id}")
-        return jsonify({'id': test_id, 'success': True}), 201
+        print(f"Successfully saved test with ID: {test_id} ({question_count} questions parsed)")
+        return jsonify({'id': test_id, 'success': True, 'questionCount': question_count}), 201
     except Exception as e:
         print(f"ERROR in save_test: {str(e)}")
         import traceback
@@ -873,26 +1217,32 @@ def save_test():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/tests', methods=['GET'])
+@conditional('saved_tests', 'test_stats')
 def get_tests():
-    """Get all saved tests"""
+    """Get all saved tests (?view=summary omits the test and solution bodies)"""
     try:
+        columns = projection(request.args, TEST_FIELDS, TEST_SUMMARY, required=('id', 'created_at')) or '''
+            st.*,
+            COALESCE(ts.attempt_count, 0) as attempt_count,
+            ts.best_score as best_score
+        '''
         conn = get_db_connection()
-        tests = conn.execute('''
-            SELECT st.*,
-                   COUNT(DISTINCT ta.id) as attempt_count,
-                   MAX(ta.percentage) as best_score
+        # Attempt counts and best scores come from the test_stats rollup, one row per test
+        tests, next_cursor = keyset_page(conn, f'''
+            SELECT {columns}
             FROM saved_tests st
-            LEFT JOIN test_attempts ta ON st.id = ta.test_id AND ta.completed = 1
-            GROUP BY st.id
-            ORDER BY st.created_at DESC
-        ''').fetchall()
+            LEFT JOIN test_stats ts ON ts.test_id = st.id
+        ''', 'st.created_at', request.args, descending=True, filters=TEST_FILTERS, id_col='st.id')
         conn.close()
 
-        return jsonify([dict(row) for row in tests])
+        return jsonify(page_response(tests, next_cursor, request.args))
+    except PaginationError:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/tests/<int:test_id>', methods=['GET', 'DELETE'])
+@conditional('saved_tests')
 def test_detail(test_id):
     """Get or delete a specific test"""
     conn = get_db_connection()
@@ -914,7 +1264,9 @@ def test_detail(test_id):
             # Delete test and all related attempts/answers (cascade)
             conn.execute('DELETE FROM test_answers WHERE attempt_id IN (SELECT id FROM test_attempts WHERE test_id = ?)', (test_id,))
             conn.execute('DELETE FROM test_attempts WHERE test_id = ?', (test_id,))
+            conn.execute('DELETE FROM questions WHERE test_id = ?', (test_id,))
             conn.execute('DELETE FROM saved_tests WHERE id = ?', (test_id,))
+            forget_test(conn, test_id)
             conn.commit()
             conn.close()
 
@@ -922,6 +1274,42 @@ def test_detail(test_id):
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+def question_number_arg(name):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise PaginationError(f'{name} must be a question number')
+    if number < 1:
+        raise PaginationError(f'{name} must be a question number')
+    return number
+
+@app.route('/api/tests/<int:test_id>/questions', methods=['GET'])
+@conditional('saved_tests')
+def test_questions(test_id):
+    """Parsed questions of a saved test.
+
+    ?start=/?end= select a range of question numbers (inclusive);
+    ?answers=true adds each question's answer and explanation.
+    """
+    start, end = question_number_arg('start'), question_number_arg('end')
+    with_answers = parse_bool(request.args.get('answers', 'false'))
+    try:
+        conn = get_db_connection()
+        if not conn.execute('SELECT 1 FROM saved_tests WHERE id = ?', (test_id,)).fetchone():
+            conn.close()
+            return jsonify({'error': 'Test not found'}), 404
+
+        total = count_questions(conn, test_id)
+        questions = get_questions(conn, test_id, start, end, with_answers)
+        conn.close()
+
+        return jsonify({'test_id': test_id, 'total': total, 'questions': questions})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Test Attempts API Routes
 
 @app.route('/api/tests/<int:test_id>/start', methods=['POST'])
@@ -954,6 +1342,7 @@ def start_test_attempt(test_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/tests/attempts/<int:attempt_id>', methods=['GET', 'PUT', 'DELETE'])
+@conditional('test_attempts', 'test_answers')
 def test_attempt_detail(attempt_id):
     """Get, update, or delete a test attempt (for practice mode resume)"""
     conn = get_db_connection()
@@ -981,21 +1370,35 @@ def test_attempt_detail(attempt_id):
             data = request.json
 
             # Save/update answer
+            result = {'success': True}
             if 'answer' in data:
-                conn.execute('''
-                    INSERT OR REPLACE INTO test_answers (attempt_id, question_number, user_answer, correct_answer, is_correct)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (attempt_id, data['questionNumber'], data['answer'], data.get('correctAnswer'), data.get('isCorrect')))
+                # Changing an answer of a completed attempt must also move its rollup contribution
+                forget_attempt(conn, attempt_id)
+                if attempt_question_count(conn, attempt_id):
+                    grade_answers(conn, attempt_id, [(data['questionNumber'], data['answer'])])
+                    graded = conn.execute('''
+                        SELECT correct_answer, is_correct FROM test_answers
+                        WHERE attempt_id = ? AND question_number = ?
+                    ''', (attempt_id, data['questionNumber'])).fetchone()
+                    result.update(correctAnswer=graded['correct_answer'],
+                                  isCorrect=None if graded['is_correct'] is None else bool(graded['is_correct']))
+                else:
+                    conn.execute('''
+                        INSERT OR REPLACE INTO test_answers (attempt_id, question_number, user_answer, correct_answer, is_correct)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (attempt_id, data['questionNumber'], data['answer'], data.get('correctAnswer'), data.get('isCorrect')))
+                record_attempt(conn, attempt_id)
 
             conn.commit()
             conn.close()
 
-            return jsonify({'success': True})
+            return jsonify(result)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
     elif request.method == 'DELETE':
         try:
+            forget_attempt(conn, attempt_id)
             # Delete all answers for this attempt
             conn.execute('DELETE FROM test_answers WHERE attempt_id = ?', (attempt_id,))
             # Delete the attempt
@@ -1008,6 +1411,7 @@ def test_attempt_detail(attempt_id):
             return jsonify({'error': str(e)}), 500
 
 @app.route('/api/tests/<int:test_id>/attempts', methods=['GET'])
+@conditional('test_attempts')
 def get_test_attempts(test_id):
     """Get all attempts for a test"""
     try:
@@ -1024,6 +1428,7 @@ def get_test_attempts(test_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/tests/attempts/<int:attempt_id>/answers', methods=['GET'])
+@conditional('test_answers')
 def get_attempt_answers(attempt_id):
     """Get all saved answers for an attempt"""
     try:
@@ -1041,40 +1446,54 @@ def get_attempt_answers(attempt_id):
 
 @app.route('/api/tests/attempts/<int:attempt_id>/submit', methods=['POST'])
 def submit_test_attempt(attempt_id):
-    """Submit a completed test attempt"""
+    """Submit a completed test attempt.
+
+    Tests with parsed questions are graded here: only questionNumber and
+    userAnswer are needed per answer, and score/total are computed. Tests
+    without parsed questions keep the client's score and grading, if it sent any.
+    """
     try:
         data = request.json
         conn = get_db_connection()
 
-        # Calculate score
-        score = data['score']
-        total = data['total']
+        # A re-submitted attempt replaces its earlier contribution to the rollups
+        forget_attempt(conn, attempt_id)
+
+        total = attempt_question_count(conn, attempt_id)
+        if total:
+            # Save all answers if not already saved (for exam mode), graded against the stored questions
+            grade_answers(conn, attempt_id, [(answer['questionNumber'], answer.get('userAnswer'))
+                                             for answer in data.get('answers', [])])
+            score = attempt_score(conn, attempt_id)
+        else:
+            score = data.get('score', 0)
+            total = data.get('total', 0)
+            if 'answers' in data:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO test_answers (attempt_id, question_number, user_answer, correct_answer, is_correct)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [(attempt_id, answer['questionNumber'], answer.get('userAnswer'),
+                       answer.get('correctAnswer'), answer.get('isCorrect')) for answer in data['answers']])
         percentage = round((score / total) * 100) if total > 0 else 0
 
         # Update attempt
         conn.execute('''
             UPDATE test_attempts
-            SET score = ?, percentage = ?, time_spent_seconds = ?, completed = 1, completed_at = CURRENT_TIMESTAMP
+            SET score = ?, total_questions = ?, percentage = ?, time_spent_seconds = ?, completed = 1,
+                completed_at = CURRENT_TIMESTAMP
             WHERE id = ?
-        ''', (score, percentage, data.get('timeSpent', 0), attempt_id))
-
-        # Save all answers if not already saved (for exam mode)
-        if 'answers' in data:
-            for answer in data['answers']:
-                conn.execute('''
-                    INSERT OR REPLACE INTO test_answers (attempt_id, question_number, user_answer, correct_answer, is_correct)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (attempt_id, answer['questionNumber'], answer['userAnswer'],
-                      answer['correctAnswer'], answer['isCorrect']))
+        ''', (score, total, percentage, data.get('timeSpent', 0), attempt_id))
 
+        record_attempt(conn, attempt_id)
         conn.commit()
         conn.close()
 
-        return jsonify({'success': True, 'score': score, 'percentage': percentage})
+        return jsonify({'success': True, 'score': score, 'total': total, 'percentage': percentage})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/tests/<int:test_id>/history', methods=['GET'])
+@conditional('test_attempts')
 def get_test_history(test_id):
     """Get all attempts and scores for a test"""
     try:
@@ -1091,6 +1510,7 @@ def get_test_history(test_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/tests/<int:test_id>/analytics', methods=['GET'])
+@conditional('test_attempts', 'test_stats', 'test_question_stats')
 def get_test_analytics(test_id):
     """Get analytics data for a test"""
     try:
@@ -1103,25 +1523,18 @@ def get_test_analytics(test_id):
             ORDER BY completed_at ASC
         ''', (test_id,)).fetchall()
 
-        if not attempts:
+        stats = conn.execute('SELECT * FROM test_stats WHERE test_id = ?', (test_id,)).fetchone()
+
+        if not attempts or not stats:
             conn.close()
             return jsonify({'error': 'No completed attempts found'}), 404
 
-        # Calculate statistics
-        scores = [a['percentage'] for a in attempts]
-        best_score = max(scores)
-        avg_score = sum(scores) / len(scores)
-        latest_score = scores[-1]
-
-        # Get performance by question
+        # Get performance by question (precomputed per question in test_question_stats)
         question_performance = conn.execute('''
-            SELECT question_number,
-                   SUM(CASE WHEN is_correct = 1 THEN 1 ELSE 0 END) as correct_count,
-                   COUNT(*) as total_attempts,
-                   ROUND(SUM(CASE WHEN is_correct = 1 THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 2) as accuracy
-            FROM test_answers
-            WHERE attempt_id IN (SELECT id FROM test_attempts WHERE test_id = ? AND completed = 1)
-            GROUP BY question_number
+            SELECT question_number, correct_count, total_attempts,
+                   ROUND(correct_count * 100.0 / total_attempts, 2) as accuracy
+            FROM test_question_stats
+            WHERE test_id = ?
             ORDER BY accuracy ASC
         ''', (test_id,)).fetchall()
 
@@ -1130,21 +1543,45 @@ def get_test_analytics(test_id):
         return jsonify({
             'attempts': [dict(row) for row in attempts],
             'statistics': {
-                'bestScore': best_score,
-                'averageScore': round(avg_score, 1),
-                'latestScore': latest_score,
-                'totalAttempts': len(attempts)
+                'bestScore': stats['best_score'],
+                'averageScore': round(stats['score_sum'] / stats['attempt_count'], 1),
+                'latestScore': stats['latest_score'],
+                'totalAttempts': stats['attempt_count']
             },
             'questionPerformance': [dict(row) for row in question_performance]
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.cli.command('rebuild-test-stats')
+def rebuild_test_stats_command():
+    """Recompute test_stats/test_question_stats from scratch and report any drift"""
+    conn = get_db_connection()
+    before = snapshot_test_stats(conn)
+    rebuild_test_stats(conn)
+    after = snapshot_test_stats(conn)
+    conn.commit()
+    conn.close()
+
+    if before == after:
+        print(f"Test statistics verified: {len(after[0])} tests, {len(after[1])} questions, no drift")
+    else:
+        print(f"Test statistics rebuilt: rollups had drifted "
+              f"({len(before[0])} -> {len(after[0])} tests, {len(before[1])} -> {len(after[1])} questions)")
+
 # Audio-to-Notes API Routes
 
 @app.route('/api/audio/transcribe', methods=['POST'])
 def transcribe_audio():
-    """Transcribe uploaded audio file"""
+    """Queue an uploaded audio file for transcription.
+
+    Returns 202 {job_id, status_url} at once; the transcription worker does
+    the work and the job result is the saved note ({id, transcript,
+    enhanced_notes, transcription_time_seconds, file_size_mb}). ?wait=<seconds>
+    (max 30) holds the request until the job finishes and returns the job.
+    Optional form fields mode (draft, standard, accurate) and language
+    override the engine's defaults for this upload.
+    """
     try:
         if 'audio' not in request.files:
             return jsonify({'error': 'No audio file provided'}), 400
@@ -1158,6 +1595,10 @@ def transcribe_audio():
         course = request.form.get('course', '')
         lecture_date = request.form.get('lecture_date', '')
         enhance = request.form.get('enhance', 'false') == 'true'
+        try:
+            options = resolve_options(request.form.get('mode'), request.form.get('language'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         # Save audio file
         filename = secure_filename(f"{int(time.time())}_{audio_file.filename}")
@@ -1167,64 +1608,28 @@ def transcribe_audio():
         # Get file size in MB
         file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
 
-        print(f"=== Starting transcription of {filename} ({file_size_mb:.2f} MB) ===")
-
-        # Transcribe audio
-        start_time = time.time()
-        model = get_whisper_model()
-        transcript_segments = model.transcribe(file_path)
-
-        # Convert segments to string (pywhispercpp returns a list of segments)
-        if isinstance(transcript_segments, list):
-            # Extract just the text from each segment, ignoring timestamps
-            transcript_parts = []
-            for seg in transcript_segments:
-                if isinstance(seg, dict):
-                    transcript_parts.append(seg.get('text', '').strip())
-                else:
-                    # If it's a string with timestamps (e.g., "t0=0, t1=600, text=..."), extract just the text
-                    seg_str = str(seg)
-                    if 'text=' in seg_str:
-                        text_part = seg_str.split('text=')[-1].strip()
-                        transcript_parts.append(text_part)
-                    else:
-                        transcript_parts.append(seg_str.strip())
-            transcript = ' '.join(transcript_parts)
-        else:
-            transcript = str(transcript_segments)
-
-        transcription_time = int(time.time() - start_time)
-
-        print(f"✓ Transcription completed in {transcription_time}s")
-        print(f"Transcript length: {len(transcript)} characters")
-
-        # Enhance with AI if requested
-        enhanced_notes = None
-        if enhance:
-            print("Enhancing notes with AI...")
-            enhanced_notes = enhance_transcript_with_ai(transcript, course)
-
-        # Save to database
         conn = get_db_connection()
-        cursor = conn.execute('''
-            INSERT INTO audio_notes (title, audio_file_path, transcript, enhanced_notes,
-                                    file_size_mb, transcription_time_seconds, lecture_date,
-                                    course, is_enhanced)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (title, filename, transcript, enhanced_notes, file_size_mb, transcription_time,
-              lecture_date, course, enhance))
-        conn.commit()
-        note_id = cursor.lastrowid
-        conn.close()
+        job_id = enqueue(conn, TRANSCRIBE_KIND, {
+            'file_path': file_path,
+            'filename': filename,
+            'file_size_mb': file_size_mb,
+            'title': title,
+            'course': course,
+            'lecture_date': lecture_date,
+            'enhance': enhance,
+            'options': options
+        }, queue=TRANSCRIBE_QUEUE)
+        print(f"Queued transcription job {job_id} for {filename} ({file_size_mb:.2f} MB)")
 
-        return jsonify({
-            'id': note_id,
-            'transcript': transcript,
-            'enhanced_notes': enhanced_notes,
-            'transcription_time_seconds': transcription_time,
-            'file_size_mb': round(file_size_mb, 2),
-            'success': True
-        })
+        try:
+            wait = min(float(request.args.get('wait', 0)), 30)
+        except ValueError:
+            return jsonify({'error': 'wait must be a number of seconds'}), 400
+        if wait > 0:
+            job = wait_for_job(conn, job_id, wait)
+            return jsonify(job), 200 if job['status'] in ('succeeded', 'failed') else 202
+
+        return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': f'/api/jobs/{job_id}'}), 202
 
     except Exception as e:
         print(f"ERROR in transcribe_audio: {str(e)}")
@@ -1232,18 +1637,218 @@ def transcribe_audio():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/audio/transcribe/<int:job_id>', methods=['GET'])
+def transcription_progress(job_id):
+    """A transcription job with the text of the parts finished so far (in order, gaps skipped)"""
+    conn = get_db_connection()
+    job = get_job(conn, job_id)
+    if job is None or job['kind'] != TRANSCRIBE_KIND:
+        return jsonify({'error': 'Transcription job not found'}), 404
+
+    chunks = conn.execute('''
+        SELECT chunk_index, start_seconds, end_seconds, segments FROM transcription_chunks
+        WHERE job_id = ? ORDER BY chunk_index
+    ''', (job_id,)).fetchall()
+    parts = {row['chunk_index']: (row['start_seconds'], row['end_seconds'], json.loads(row['segments']))
+             for row in chunks}
+    job['parts'] = [{'index': row['chunk_index'], 'start_seconds': row['start_seconds'],
+                     'end_seconds': row['end_seconds']} for row in chunks]
+    job['partial_transcript'] = segments_to_text(stitch(parts)) if parts else ''
+    return jsonify(job)
+
+# Live transcription: the browser uploads the recording in segments while it is still recording
+
+# How long EventSource waits before reconnecting to the events stream for more segments
+LIVE_EVENTS_RETRY_SECONDS = 2
+
+@app.route('/api/audio/live', methods=['POST'])
+def start_live_note():
+    """Start a live note; segments are then posted to segments_url as they are recorded.
+
+    Optional mode and language apply to every segment, as for /api/audio/transcribe.
+    """
+    data = request.json or {}
+    try:
+        options = resolve_options(data.get('mode'), data.get('language'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    conn = get_db_connection()
+    note_id = create_live_note(conn, data.get('title') or 'Untitled Lecture', data.get('course', ''),
+                               data.get('lecture_date', ''), options)
+    conn.commit()
+    return jsonify({
+        'note_id': note_id,
+        'live_status': RECORDING,
+        'options': options,
+        'segment_seconds': LIVE_SEGMENT_SECONDS,
+        'segments_url': f'/api/audio/live/{note_id}/segments',
+        'events_url': f'/api/audio/live/{note_id}/events',
+    }), 201
+
+@app.route('/api/audio/live/<int:note_id>', methods=['GET'])
+def live_note_status(note_id):
+    """A live note's status, transcript so far and segment counts"""
+    conn = get_db_connection()
+    note = get_live_note(conn, note_id)
+    if note is None:
+        return jsonify({'error': 'Live note not found'}), 404
+    note = dict(note)
+    note['live_options'] = json.loads(note['live_options']) if note['live_options'] else None
+    return jsonify({**note, 'segments': segment_counts(conn, note_id)})
+
+@app.route('/api/audio/live/<int:note_id>/segments', methods=['POST'])
+def upload_live_segment(note_id):
+    """Queue one recorded segment for transcription.
+
+    Form fields: audio (a self-contained recording), seq (0, 1, 2, ... in
+    recording order) and start_seconds (where it starts in the lecture).
+    Re-sending a segment that was already received is a no-op.
+    """
+    conn = get_db_connection()
+    note = get_live_note(conn, note_id)
+    if note is None:
+        return jsonify({'error': 'Live note not found'}), 404
+    if note['live_status'] != RECORDING:
+        return jsonify({'error': 'This recording has already been finished'}), 409
+
+    audio_file = request.files.get('audio')
+    if audio_file is None or audio_file.filename == '':
+        return jsonify({'error': 'No audio segment provided'}), 400
+    try:
+        seq = int(request.form['seq'])
+        start_seconds = float(request.form.get('start_seconds', 0))
+    except (KeyError, ValueError):
+        return jsonify({'error': 'seq must be an integer and start_seconds a number'}), 400
+    if seq < 0 or start_seconds < 0:
+        return jsonify({'error': 'seq and start_seconds cannot be negative'}), 400
+
+    existing = get_segment(conn, note_id, seq)
+    if existing is not None:
+        return jsonify({'note_id': note_id, 'seq': seq, 'job_id': existing['job_id'],
+                        'status': existing['status']})
+
+    extension = os.path.splitext(secure_filename(audio_file.filename))[1] or '.webm'
+    file_path = os.path.join(app.config['AUDIO_FOLDER'], f'live_{note_id}_{seq:05d}{extension}')
+    audio_file.save(file_path)
+
+    # The job and the segment row are committed together: if a concurrent upload of the same seq
+    # got there first, both are rolled back and that upload's job answers for this one
+    job_id = enqueue(conn, LIVE_SEGMENT_KIND, {
+        'note_id': note_id,
+        'seq': seq,
+        'start_seconds': start_seconds,
+        'file_path': file_path,
+        'options': json.loads(note['live_options']) if note['live_options'] else None,
+    }, queue=LIVE_QUEUE, commit=False)
+    try:
+        add_segment(conn, note_id, seq, start_seconds, file_path, job_id)
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        existing = get_segment(conn, note_id, seq)
+        return jsonify({'note_id': note_id, 'seq': seq, 'job_id': existing['job_id'],
+                        'status': existing['status']})
+    conn.commit()
+    return jsonify({'note_id': note_id, 'seq': seq, 'job_id': job_id, 'status': 'queued'}), 202
+
+@app.route('/api/audio/live/<int:note_id>/events', methods=['GET'])
+def live_note_events(note_id):
+    """Partial transcripts as Server-Sent Events.
+
+    Events: segment {seq, start_seconds, duration_seconds, status, text} for
+    each transcribed segment in order (the event id is its seq), then done
+    {note_id, transcript} once the note is complete. Each response only sends
+    what is ready and ends, so no server thread waits on a lecture;
+    EventSource reconnects after LIVE_EVENTS_RETRY_SECONDS and resumes after
+    Last-Event-ID (or ?after=<seq>).
+    """
+    if get_live_note(get_db_connection(), note_id) is None:
+        return jsonify({'error': 'Live note not found'}), 404
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.args.get('after', -1))
+    except ValueError:
+        return jsonify({'error': 'after must be a segment number'}), 400
+
+    def events():
+        yield sse_retry(LIVE_EVENTS_RETRY_SECONDS * 1000)
+        # The request's connection is gone once streaming starts; use one of our own
+        with connection() as conn:
+            segments = segments_after(conn, note_id, after)
+            note = get_live_note(conn, note_id)
+        for segment in segments:
+            yield sse_event('segment', dict(segment), event_id=segment['seq'])
+        if note is None or note['live_status'] == COMPLETE:
+            yield sse_event('done', {'note_id': note_id, 'transcript': note['transcript'] if note else None})
+
+    return sse_response(events())
+
+@app.route('/api/audio/live/<int:note_id>/finish', methods=['POST'])
+def finish_live_note(note_id):
+    """Stop accepting segments and queue the note's completion.
+
+    JSON: title, course, lecture_date (replace the values given at the start
+    when present) and enhance. Returns 202 {job_id, status_url}; the job runs
+    after the segments already queued and its result has the same shape as a
+    whole-file transcription. ?wait=<seconds> (max 30) holds the request.
+    """
+    data = request.json or {}
+    conn = get_db_connection()
+    note = get_live_note(conn, note_id)
+    if note is None:
+        return jsonify({'error': 'Live note not found'}), 404
+    if note['live_status'] != RECORDING:
+        return jsonify({'error': 'This recording has already been finished'}), 409
+    try:
+        wait = min(float(request.args.get('wait', 0)), 30)
+    except ValueError:
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+
+    conn.execute('''
+        UPDATE audio_notes SET title = ?, course = ?, lecture_date = ? WHERE id = ?
+    ''', (data.get('title') or note['title'], data.get('course', note['course']),
+          data.get('lecture_date', note['lecture_date']), note_id))
+    set_live_status(conn, note_id, FINISHING)
+    job_id = enqueue(conn, LIVE_FINISH_KIND, {
+        'note_id': note_id,
+        'enhance': bool(data.get('enhance', False)),
+    }, queue=LIVE_QUEUE, commit=False)
+    conn.commit()
+
+    if wait > 0:
+        job = wait_for_job(conn, job_id, wait)
+        return jsonify(job), 200 if job['status'] in ('succeeded', 'failed') else 202
+    return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': f'/api/jobs/{job_id}'}), 202
+
+@app.route('/api/audio/engine', methods=['GET'])
+def transcription_engine_status():
+    """Readiness of the transcription workers: 200 once one has its models loaded and warmed up, else 503"""
+    rows = get_db_connection().execute(f'''
+        SELECT worker, state, config, started_at, ready_at, heartbeat_at FROM transcription_workers
+        WHERE heartbeat_at >= datetime('now', '-{TRANSCRIBER_STALE_SECONDS} seconds')
+        ORDER BY started_at
+    ''').fetchall()
+    workers = [{**dict(row), 'config': json.loads(row['config']) if row['config'] else None} for row in rows]
+    ready = [worker for worker in workers if worker['state'] == 'ready']
+    return jsonify({
+        'ready': bool(ready),
+        'workers': workers,
+        'engine': ready[0]['config'] if ready else None,
+        'modes': list(TRANSCRIBE_MODES),
+        'default_mode': TRANSCRIBE_MODE,
+    }), 200 if ready else 503
+
 @app.route('/api/audio/notes', methods=['GET', 'POST'])
+@conditional('audio_notes')
 def audio_notes():
-    """Get all audio notes or create a new one"""
+    """Get all audio notes (?view=summary omits transcripts) or create a new one"""
     conn = get_db_connection()
 
     try:
         if request.method == 'GET':
-            notes = conn.execute('''
-                SELECT * FROM audio_notes
-                ORDER BY created_at DESC
-            ''').fetchall()
-            return jsonify([dict(row) for row in notes])
+            columns = projection(request.args, AUDIO_NOTE_FIELDS, AUDIO_NOTE_SUMMARY,
+                                 required=('id', 'created_at')) or '*'
+            notes, next_cursor = keyset_page(conn, f'SELECT {columns} FROM audio_notes', 'created_at', request.args,
+                                             descending=True, filters=AUDIO_NOTE_FILTERS)
+            return jsonify(page_response(notes, next_cursor, request.args))
 
         elif request.method == 'POST':
             # For saving manually created notes
@@ -1257,6 +1862,8 @@ def audio_notes():
             conn.commit()
             note_id = cursor.lastrowid
             return jsonify({'id': note_id, 'success': True}), 201
+    except PaginationError:
+        raise
     except Exception as e:
         print(f"ERROR in audio_notes: {str(e)}")
         import traceback
@@ -1266,13 +1873,15 @@ def audio_notes():
         conn.close()
 
 @app.route('/api/audio/notes/<int:note_id>', methods=['GET', 'PUT', 'DELETE'])
+@conditional('audio_notes')
 def audio_note_detail(note_id):
-    """Get, update, or delete a specific audio note"""
+    """Get (?view=summary or ?fields=.. as for the list), update, or delete a specific audio note"""
     conn = get_db_connection()
 
     try:
         if request.method == 'GET':
-            note = conn.execute('SELECT * FROM audio_notes WHERE id = ?', (note_id,)).fetchone()
+            columns = projection(request.args, AUDIO_NOTE_FIELDS, AUDIO_NOTE_SUMMARY) or '*'
+            note = conn.execute(f'SELECT {columns} FROM audio_notes WHERE id = ?', (note_id,)).fetchone()
             if note:
                 return jsonify(dict(note))
             else:
@@ -1280,6 +1889,10 @@ def audio_note_detail(note_id):
 
         elif request.method == 'PUT':
             data = request.json
+            current = conn.execute('SELECT transcript FROM audio_notes WHERE id = ?', (note_id,)).fetchone()
+            if current and current['transcript'] != data.get('transcript'):
+                # The segments' character offsets describe the old text
+                delete_transcript_segments(conn, note_id)
             conn.execute('''
                 UPDATE audio_notes
                 SET title = ?, transcript = ?, enhanced_notes = ?,
@@ -1298,10 +1911,14 @@ def audio_note_detail(note_id):
                 file_path = os.path.join(app.config['AUDIO_FOLDER'], note['audio_file_path'])
                 if os.path.exists(file_path):
                     os.remove(file_path)
+            delete_segments(conn, note_id)
+            delete_transcript_segments(conn, note_id)
 
             conn.execute('DELETE FROM audio_notes WHERE id = ?', (note_id,))
             conn.commit()
             return jsonify({'success': True})
+    except PaginationError:
+        raise
     except Exception as e:
         print(f"ERROR in audio_note_detail: {str(e)}")
         import traceback
@@ -1310,6 +1927,76 @@ def audio_note_detail(note_id):
     finally:
         conn.close()
 
+# Window /segments returns when no end is given
+TRANSCRIPT_WINDOW_SECONDS = 300
+
+def seconds_arg(name, default=None):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        raise PaginationError(f'{name} must be a number of seconds')
+    if seconds < 0:
+        raise PaginationError(f'{name} cannot be negative')
+    return seconds
+
+@app.route('/api/audio/notes/<int:note_id>/segments', methods=['GET'])
+@conditional('audio_notes')
+def audio_note_segments(note_id):
+    """Timestamped transcript segments overlapping ?start=..&end=.. (seconds).
+
+    end defaults to start + TRANSCRIPT_WINDOW_SECONDS. next_start is where
+    the following window begins (None at the end), so a player can load a
+    long transcript a window at a time. Notes transcribed before segments
+    were kept return no segments; use the note's transcript instead.
+    """
+    conn = get_db_connection()
+    if conn.execute('SELECT 1 FROM audio_notes WHERE id = ?', (note_id,)).fetchone() is None:
+        return jsonify({'error': 'Note not found'}), 404
+
+    start = seconds_arg('start', 0.0)
+    end = seconds_arg('end', start + TRANSCRIPT_WINDOW_SECONDS)
+    if end <= start:
+        raise PaginationError('end must be after start')
+    try:
+        limit = min(int(request.args.get('limit', MAX_WINDOW_SEGMENTS)), MAX_WINDOW_SEGMENTS)
+    except ValueError:
+        raise PaginationError('limit must be a whole number')
+    if limit < 1:
+        raise PaginationError('limit must be at least 1')
+
+    start_cs, end_cs = int(start * 100), int(end * 100)
+    segments = segments_in_window(conn, note_id, start_cs, end_cs, limit)
+    if len(segments) == limit:
+        next_start = segments[-1]['t1']
+    else:
+        next_start = next_segment_start(conn, note_id, end_cs)
+    count, last_t1 = transcript_timing(conn, note_id)
+    return jsonify({
+        'note_id': note_id,
+        'start': start,
+        'end': end,
+        'segments': segments,
+        'next_start': next_start / 100 if next_start is not None else None,
+        'segment_count': count,
+        'duration_seconds': last_t1 / 100 if last_t1 is not None else None,
+    })
+
+@app.route('/api/audio/notes/<int:note_id>/position', methods=['GET'])
+@conditional('audio_notes')
+def audio_note_position(note_id):
+    """Playback position (seconds) of character ?offset= of the note's transcript"""
+    try:
+        offset = int(request.args['offset'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'offset must be a character position in the transcript'}), 400
+    position = position_for_offset(get_db_connection(), note_id, max(0, offset))
+    if position is None:
+        return jsonify({'error': 'This note has no timestamped transcript'}), 404
+    return jsonify({'note_id': note_id, 'offset': offset, **position})
+
 @app.route('/api/audio/enhance', methods=['POST'])
 def enhance_notes():
     """Enhance existing transcript with AI"""
@@ -1322,7 +2009,7 @@ def enhance_notes():
         if not transcript:
             return jsonify({'error': 'No transcript provided'}), 400
 
-        enhanced = enhance_transcript_with_ai(transcript, course)
+        enhanced = enhance_transcript_with_ai(transcript, course, use_cache=llm_cache_requested(data))
 
         # Update database if note_id provided
         note_id = data.get('note_id')
@@ -1346,6 +2033,58 @@ def enhance_notes():
         if conn:
             conn.close()
 
+@app.route('/api/audio/enhance/stream', methods=['POST'])
+def enhance_notes_stream():
+    """Enhance a transcript, streaming the notes as Server-Sent Events.
+
+    Takes the same JSON as /api/audio/enhance; with only note_id the note's
+    stored transcript (and course) is used. Events: token {text}, then done
+    {enhanced_notes, note_id} once the notes are saved, or error {error}.
+    """
+    data = request.json or {}
+    transcript = data.get('transcript', '')
+    course = data.get('course', '')
+    note_id = data.get('note_id')
+
+    if note_id and not transcript:
+        note = get_db_connection().execute(
+            'SELECT transcript, course FROM audio_notes WHERE id = ?', (note_id,)
+        ).fetchone()
+        if note is None:
+            return jsonify({'error': 'Note not found'}), 404
+        transcript = note['transcript']
+        course = course or note['course'] or ''
+
+    if not transcript:
+        return jsonify({'error': 'No transcript provided'}), 400
+
+    prompt = build_enhance_prompt(transcript, course)
+    use_cache = llm_cache_requested(data)
+
+    def events():
+        try:
+            pieces = []
+            for text in stream_ollama(prompt, ENHANCE_OPTIONS, use_cache):
+                pieces.append(text)
+                yield sse_event('token', {'text': text})
+
+            enhanced = ''.join(pieces)
+            if note_id:
+                # The request's connection is gone by now; use one of our own
+                with connection() as conn:
+                    conn.execute('''
+                        UPDATE audio_notes
+                        SET enhanced_notes = ?, is_enhanced = 1
+                        WHERE id = ?
+                    ''', (enhanced, note_id))
+                    conn.commit()
+            yield sse_event('done', {'enhanced_notes': enhanced, 'note_id': note_id, 'success': True})
+        except Exception as e:
+            print(f"ERROR in enhance_notes_stream: {str(e)}")
+            yield sse_event('error', {'error': str(e)})
+
+    return sse_response(events())
+
 @app.route('/api/audio/files/<filename>', methods=['GET'])
 def serve_audio_file(filename):
     """Serve audio file for playback"""
@@ -1358,51 +2097,10 @@ def serve_audio_file(filename):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def enhance_transcript_with_ai(transcript, course=''):
-    """Use Ollama to clean up and format transcript into readable notes"""
-    try:
-        course_context = f" from the {course} lecture" if course else ""
-
-        prompt = f"""You are a helpful transcript editor. Clean up and format this audio transcript{course_context} to make it easy to read.
-
-RAW TRANSCRIPT:
-{transcript}
-
-Your task:
-1. Remove timestamps and technical markers (t0=, t1=, etc.)
-2. Fix spelling errors and grammar mistakes
-3. Add proper punctuation and capitalization
-4. Break into clear paragraphs based on topic changes (use double line breaks between paragraphs)
-5. Use markdown formatting for better readability:
-   - Use **bold** for important terms and key concepts
-   - Use ## headings for major sections
-   - Use - bullet points for lists
-   - Use `code` formatting for technical terms, commands, or code
-   - Use ```code blocks``` for multi-line code examples
-6. Keep the original meaning and content intact
-7. Make it look professional and well-organized
-
-Return ONLY the cleaned, formatted transcript with markdown. No extra commentary or meta-text."""
-
-        response = ollama_client.generate(
-            model=OLLAMA_MODEL,
-            prompt=prompt,
-            options={
-                'num_predict': 8000,
-                'temperature': 0.7
-            }
-        )
-
-        return response['response']
-
-    except Exception as e:
-        print(f"Error enhancing transcript: {str(e)}")
-        return None
+# Initialize database on startup (at import time so every gunicorn worker runs migrations too)
+init_database()
 
 if __name__ == '__main__':
-    # Initialize database on startup
-    init_database()
-
     # SSL Configuration - Try Tailscale cert first, then self-signed
     ssl_dir = os.path.join(os.path.dirname(__file__), 'ssl')
     tailscale_cert = os.path.join(ssl_dir, 'tailscale-cert.pem')
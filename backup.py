@@ -0,0 +1,191 @@
+"""Complete, streaming and incremental backups.
+
+Two modes sit next to the legacy single-JSON /api/backup:
+
+- NDJSON (optionally gzip'd): one header line, then one line per row, one
+  table at a time, read straight from the cursor inside a single read
+  transaction. Memory stays flat regardless of database size.
+- SQLite snapshot: SQLite's online backup API copies the live database into
+  a temporary file that is sent as-is.
+
+Both accept a "since" watermark (the X-Backup-Watermark header returned by
+the previous run) and then carry only rows created or changed at or after it
+(updated_at is maintained by the change-tracking triggers, see sync.py),
+plus the tombstones of rows deleted since.
+"""
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import zlib
+from datetime import datetime
+
+from db import connection, open_connection
+
+BACKUP_FORMAT_VERSION = 2
+GZIP_CHUNK_SIZE = 64 * 1024
+
+# Every user table, and the condition (one ? per use of the watermark) that a
+# row was created or changed since the watermark
+BACKUP_TABLES = {
+    'assignments': 'updated_at >= ?',
+    'clinical_shifts': 'updated_at >= ?',
+    'requirements': 'updated_at >= ?',
+    'goals': 'updated_at >= ?',
+    'grades': 'updated_at >= ?',
+    'settings': 'updated_at >= ?',
+    'flashcards': 'updated_at >= ?',
+    'stress_logs': 'updated_at >= ?',
+    'weekly_activities': 'updated_at >= ?',
+    'saved_tests': 'updated_at >= ?',
+    'test_attempts': 'updated_at >= ?',
+    'test_answers': 'answered_at >= ?',
+    'audio_notes': 'updated_at >= ?',
+    # Parsed once when a test is saved, so they change only with their test
+    'questions': 'test_id IN (SELECT id FROM saved_tests WHERE updated_at >= ?)',
+    # Rewritten together with their note's transcript
+    'transcript_segments': 'note_id IN (SELECT id FROM audio_notes WHERE updated_at >= ?)',
+    # A live recording's segments, changed when uploaded and when transcribed
+    'live_segments': 'created_at >= ? OR transcribed_at >= ?',
+    # Deletions, so an incremental restore can replay them
+    'sync_tombstones': 'deleted_at >= ?',
+}
+
+# Row order in a backup, for tables without an id column
+BACKUP_ORDER = {'live_segments': 'note_id, seq'}
+
+# Caches, job state and worker status are rebuilt on demand, so an incremental
+# snapshot leaves them empty. The remaining tables (schema_migrations,
+# sync_state, table_versions, the test_stats rollups) are small and kept whole.
+SNAPSHOT_SKIPPED_TABLES = ('material_cache', 'llm_cache', 'jobs', 'transcription_chunks', 'transcription_workers')
+
+
+WATERMARK_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?$')
+
+
+def current_watermark(conn):
+    """Database clock in the same format as CURRENT_TIMESTAMP columns"""
+    return conn.execute('SELECT CURRENT_TIMESTAMP').fetchone()[0]
+
+
+def parse_watermark(value):
+    """Validate a ?since= value; accepts a date or a UTC 'YYYY-MM-DD HH:MM:SS' timestamp"""
+    if not value:
+        return None
+    if not WATERMARK_PATTERN.match(value):
+        raise ValueError(f'Invalid since watermark: {value}')
+    return value.replace('T', ' ')
+
+
+def _changed_since(table):
+    # IFNULL so a NULL timestamp reads as "not changed" rather than unknown
+    condition = BACKUP_TABLES[table]
+    return f'IFNULL(({condition}), 0)', condition.count('?')
+
+
+def iter_table_rows(conn, table, since=None):
+    """Yield a table's rows as dicts, all of them or only those changed since the watermark"""
+    sql, params = f'SELECT * FROM {table}', []
+    if since:
+        condition, count = _changed_since(table)
+        sql += f' WHERE {condition}'
+        params = [since] * count
+    for row in conn.execute(f"{sql} ORDER BY {BACKUP_ORDER.get(table, 'id')}", params):
+        yield dict(row)
+
+
+def legacy_backup(conn, since=None):
+    """The original single-document backup, now covering every table"""
+    backup = {}
+    for table in BACKUP_TABLES:
+        if table == 'settings':
+            backup[table] = {row['key']: row['value'] for row in iter_table_rows(conn, table, since)}
+        else:
+            backup[table] = list(iter_table_rows(conn, table, since))
+    backup['backup_date'] = datetime.now().isoformat()
+    return backup
+
+
+def iter_ndjson(since, watermark):
+    """NDJSON backup lines; owns its connection so it can outlive the request"""
+    with connection() as conn:
+        # One read transaction gives every table the same WAL snapshot
+        conn.execute('BEGIN')
+        yield json.dumps({
+            'type': 'backup',
+            'version': BACKUP_FORMAT_VERSION,
+            'backup_date': datetime.now().isoformat(),
+            'since': since,
+            'watermark': watermark,
+        }) + '\n'
+
+        counts = {}
+        for table in BACKUP_TABLES:
+            yield json.dumps({'type': 'table', 'name': table}) + '\n'
+            count = 0
+            for row in iter_table_rows(conn, table, since):
+                yield json.dumps({'table': table, 'row': row}, default=str) + '\n'
+                count += 1
+            counts[table] = count
+
+        conn.rollback()
+        yield json.dumps({'type': 'end', 'counts': counts}) + '\n'
+
+
+def gzip_stream(lines):
+    """Compress an iterator of text lines into gzip chunks of roughly GZIP_CHUNK_SIZE"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= GZIP_CHUNK_SIZE:
+            chunk = compressor.compress(b''.join(buffer))
+            buffer, size = [], 0
+            if chunk:
+                yield chunk
+    yield compressor.compress(b''.join(buffer)) + compressor.flush()
+
+
+def write_snapshot(since=None):
+    """Copy the database into a temporary file with the online backup API.
+
+    With a watermark, rows unchanged since then are removed from the copy, the
+    SNAPSHOT_SKIPPED_TABLES are emptied and it is vacuumed. Returns the path;
+    the caller deletes it.
+    """
+    fd, path = tempfile.mkstemp(prefix='nursing_backup_', suffix='.db')
+    os.close(fd)
+
+    target = sqlite3.connect(path)
+    try:
+        with connection() as conn:
+            conn.backup(target)
+        target.close()
+
+        # Reopen with the regular pragmas to trim the copy, then drop WAL so it is a single file
+        target = open_connection(path)
+        if since:
+            # The trim fires the sync delete triggers; remember where the real
+            # tombstones and version end so its own can be taken back out
+            last_tombstone = target.execute('SELECT IFNULL(MAX(id), 0) FROM sync_tombstones').fetchone()[0]
+            version = target.execute('SELECT version FROM sync_state WHERE id = 1').fetchone()[0]
+            for table in BACKUP_TABLES:
+                condition, count = _changed_since(table)
+                target.execute(f'DELETE FROM {table} WHERE NOT ({condition})', [since] * count)
+            for table in SNAPSHOT_SKIPPED_TABLES:
+                target.execute(f'DELETE FROM {table}')
+            target.execute('DELETE FROM sync_tombstones WHERE id > ?', (last_tombstone,))
+            target.execute('UPDATE sync_state SET version = ? WHERE id = 1', (version,))
+            target.commit()
+            target.execute('VACUUM')
+        target.execute('PRAGMA journal_mode=DELETE')
+    except Exception:
+        target.close()
+        os.remove(path)
+        raise
+    target.discard()
+    return path
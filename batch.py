@@ -0,0 +1,278 @@
+"""Transactional batch mutations for /api/batch.
+
+The SPA sends an ordered list of create/update/delete operations; they are
+applied in one transaction (one commit, one fsync) and either all succeed or
+none do. Runs of consecutive creates, updates or deletes on the same resource
+and columns are sent to SQLite with a single executemany(), so a bulk import
+is one statement per run rather than one per row.
+"""
+import os
+import sqlite3
+
+BATCH_MAX_OPERATIONS = int(os.getenv('BATCH_MAX_OPERATIONS', '1000'))
+
+
+class BatchError(Exception):
+    """An operation was rejected; the whole batch is rolled back"""
+
+    def __init__(self, index, message, status=400):
+        super().__init__(message)
+        self.index = index
+        self.status = status
+
+
+def _field(column, *keys, required=False, default=None):
+    """column <- first present JSON key (the API mixes camelCase and snake_case)"""
+    return {'column': column, 'keys': keys or (column,), 'required': required, 'default': default}
+
+
+def grade_percentage(grade, max_points):
+    """The percentage stored with a grade, for the single-item route and batches alike"""
+    return round((float(grade) / float(max_points)) * 100)
+
+
+def _grade_percentage(values):
+    values['percentage'] = grade_percentage(values['grade'], values['max_points'])
+    return values
+
+
+def _regrade(conn, ids):
+    """Recompute percentage for updated grades (in Python, so it rounds like grade_percentage)"""
+    placeholders = ', '.join('?' for _ in ids)
+    rows = conn.execute(f'''
+        SELECT id, grade, max_points FROM grades WHERE id IN ({placeholders}) AND max_points != 0
+    ''', ids).fetchall()
+    conn.executemany('UPDATE grades SET percentage = ? WHERE id = ?',
+                     [(grade_percentage(row['grade'], row['max_points']), row['id']) for row in rows])
+
+
+# Same JSON keys and defaults as the single-item routes
+RESOURCES = {
+    'assignments': {
+        'table': 'assignments',
+        'fields': [
+            _field('title', required=True),
+            _field('course', required=True),
+            _field('due_date', 'dueDate', 'due_date', required=True),
+            _field('weight'),
+            _field('status', default='not-started'),
+            _field('completed', default=False),
+        ],
+    },
+    'clinical_shifts': {
+        'table': 'clinical_shifts',
+        'fields': [
+            _field('date', required=True),
+            _field('start_time', 'startTime', 'start_time'),
+            _field('end_time', 'endTime', 'end_time'),
+            _field('location', required=True),
+            _field('unit'),
+            _field('hours', required=True),
+        ],
+    },
+    'requirements': {
+        'table': 'requirements',
+        'fields': [
+            _field('name', required=True),
+            _field('deadline', required=True),
+            _field('status', default='pending'),
+            _field('renewal_months', 'renewalMonths', 'renewal_months', default=12),
+        ],
+    },
+    'goals': {
+        'table': 'goals',
+        'fields': [
+            _field('title', required=True),
+            _field('description'),
+            _field('target_date', 'targetDate', 'target_date', required=True),
+            _field('category', default='academic'),
+            _field('completed', default=False),
+            _field('created_date', 'createdDate', 'created_date'),
+        ],
+    },
+    'grades': {
+        'table': 'grades',
+        'fields': [
+            _field('course', required=True),
+            _field('assessment', required=True),
+            _field('type', default='assignment'),
+            _field('grade', required=True),
+            _field('max_points', 'maxPoints', 'max_points', required=True),
+            _field('weight'),
+            _field('date'),
+        ],
+        'prepare': _grade_percentage,
+        'after_update': _regrade,
+    },
+    'flashcards': {
+        'table': 'flashcards',
+        'fields': [
+            _field('question', required=True),
+            _field('answer', required=True),
+        ],
+    },
+    'stress_logs': {
+        'table': 'stress_logs',
+        'fields': [
+            _field('date', required=True),
+            _field('stress_level', 'stress_level', 'stressLevel', required=True),
+            _field('mood'),
+            _field('notes'),
+            _field('study_hours', 'study_hours', 'studyHours'),
+            _field('sleep_hours', 'sleep_hours', 'sleepHours'),
+        ],
+        # One log per day: creating an existing date updates it, like POST /api/stress-logs
+        'upsert_key': 'date',
+    },
+}
+RESOURCES['clinical-shifts'] = RESOURCES['clinical_shifts']
+RESOURCES['stress-logs'] = RESOURCES['stress_logs']
+
+
+def _values(index, spec, data, creating):
+    """Map an operation's JSON data to column values.
+
+    Creates fill defaults and enforce required fields; updates only touch the
+    columns present in data.
+    """
+    if not isinstance(data, dict):
+        raise BatchError(index, 'data must be an object')
+
+    values = {}
+    for field in spec['fields']:
+        key = next((k for k in field['keys'] if k in data), None)
+        if key is not None:
+            values[field['column']] = data[key]
+        elif creating:
+            if field['required']:
+                raise BatchError(index, f"Missing required field: {field['keys'][0]}")
+            values[field['column']] = field['default']
+
+    if creating and 'prepare' in spec:
+        try:
+            values = spec['prepare'](values)
+        except (TypeError, ValueError, ZeroDivisionError) as e:
+            raise BatchError(index, f'Invalid data: {e}')
+    if not creating and not values:
+        raise BatchError(index, 'No updatable fields in data')
+    return values
+
+
+def _parse(operations):
+    """Validate the request into a list of (index, op, spec, row_id, values)"""
+    if not isinstance(operations, list) or not operations:
+        raise BatchError(None, 'operations must be a non-empty list')
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise BatchError(None, f'At most {BATCH_MAX_OPERATIONS} operations per batch')
+
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise BatchError(index, 'operation must be an object')
+        op = operation.get('op')
+        spec = RESOURCES.get(operation.get('resource'))
+        if spec is None:
+            raise BatchError(index, f"Unknown resource: {operation.get('resource')}")
+        if op not in ('create', 'update', 'delete'):
+            raise BatchError(index, f'Unknown op: {op}')
+
+        row_id = operation.get('id')
+        if op != 'create' and not isinstance(row_id, int):
+            raise BatchError(index, 'update and delete need an integer id')
+
+        values = _values(index, spec, operation.get('data', {}), op == 'create') if op != 'delete' else {}
+        parsed.append((index, op, spec, row_id, values))
+    return parsed
+
+
+def _groups(parsed):
+    """Split into runs that can share one statement (same op, table and columns).
+
+    Upserting creates stay on their own: each needs its row id looked up.
+    """
+    group, key = [], None
+    for item in parsed:
+        index, op, spec, row_id, values = item
+        item_key = (op, spec['table'], tuple(values))
+        if group and (item_key != key or (op == 'create' and 'upsert_key' in spec)):
+            yield group
+            group = []
+        group.append(item)
+        key = item_key
+    if group:
+        yield group
+
+
+def run_batch(conn, operations):
+    """Apply the operations in one transaction and return per-operation results.
+
+    Raises BatchError (after rolling back) if any operation is invalid or
+    targets a missing row.
+    """
+    parsed = _parse(operations)
+    results = [None] * len(parsed)
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for group in _groups(parsed):
+            try:
+                _apply_group(conn, group, results)
+            except sqlite3.Error as e:
+                raise BatchError(group[0][0], f'{type(e).__name__}: {e}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return results
+
+
+def _apply_group(conn, group, results):
+    index, op, spec, _, values = group[0]
+    table = spec['table']
+
+    if op == 'create':
+        columns = ', '.join(values)
+        placeholders = ', '.join('?' for _ in values)
+        sql = f'INSERT INTO {table} ({columns}) VALUES ({placeholders})'
+        key = spec.get('upsert_key')
+        if key:
+            updates = ', '.join(f'{column} = excluded.{column}' for column in values if column != key)
+            sql += f' ON CONFLICT({key}) DO UPDATE SET {updates}'
+            conn.execute(sql, tuple(values.values()))
+            # lastrowid is not set when the upsert took the UPDATE path
+            row_ids = [conn.execute(f'SELECT id FROM {table} WHERE {key} = ?', (values[key],)).fetchone()['id']]
+        else:
+            conn.executemany(sql, [tuple(item_values.values()) for _, _, _, _, item_values in group])
+            # New rows get ids above every existing one, and the batch holds the write lock
+            rows = conn.execute(f'SELECT id FROM {table} ORDER BY id DESC LIMIT ?', (len(group),)).fetchall()
+            row_ids = [row['id'] for row in reversed(rows)]
+        for (item_index, _, _, _, _), row_id in zip(group, row_ids):
+            results[item_index] = {'index': item_index, 'op': op, 'id': row_id, 'status': 201}
+        return
+
+    ids = [row_id for _, _, _, row_id, _ in group]
+    placeholders = ', '.join('?' for _ in ids)
+    found = {row['id'] for row in conn.execute(f'SELECT id FROM {table} WHERE id IN ({placeholders})', ids)}
+    for item_index, _, _, row_id, _ in group:
+        if row_id not in found:
+            raise BatchError(item_index, f'{table} {row_id} not found', status=404)
+        if op == 'delete':
+            # Deleting the same row twice: the second finds nothing, as it would in its own group
+            found.discard(row_id)
+
+    if op == 'update':
+        assignments = ', '.join(f'{column}=?' for column in values)
+        conn.executemany(f'UPDATE {table} SET {assignments} WHERE id=?',
+                         [tuple(item_values.values()) + (row_id,)
+                          for _, _, _, row_id, item_values in group])
+        if 'after_update' in spec:
+            try:
+                spec['after_update'](conn, ids)
+            except (TypeError, ValueError) as e:
+                raise BatchError(index, f'Invalid data: {e}')
+    else:
+        conn.executemany(f'DELETE FROM {table} WHERE id = ?', [(row_id,) for row_id in ids])
+
+    for item_index, _, _, row_id, _ in group:
+        results[item_index] = {'index': item_index, 'op': op, 'id': row_id, 'status': 200}
+
@@ -0,0 +1,226 @@
+"""Map-reduce test generation for study materials larger than one prompt.
+
+Materials are packed into chunks of at most GENERATION_CHUNK_CHARS, split
+only on file, slide and page boundaries (a single oversized unit is split on
+paragraphs). The requested number of questions is shared between chunks in
+proportion to their size, chunks are generated concurrently (at most
+GENERATION_PARALLELISM at a time), and the partial tests are merged: questions
+renumbered from 1, duplicates dropped together with their solutions.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+GENERATION_CHUNK_CHARS = int(os.getenv('GENERATION_CHUNK_CHARS', '60000'))
+GENERATION_PARALLELISM = int(os.getenv('GENERATION_PARALLELISM', '3'))
+# 'auto' chunks only when the materials don't fit in one chunk; 'single' never, 'chunked' always
+GENERATION_MODE = os.getenv('GENERATION_MODE', 'auto')
+GENERATION_MODES = ('auto', 'single', 'chunked')
+
+# Used when the prompt doesn't say how many questions it wants
+DEFAULT_QUESTIONS_PER_CHUNK = 10
+
+QUESTION_COUNT_PATTERN = re.compile(r'(\d+)\s*(?:practice\s+|test\s+|exam\s+)?questions?\b', re.IGNORECASE)
+# "1. ...", "1) ...", "**1.** ...", "Q1. ..."
+NUMBERED_LINE_PATTERN = re.compile(r'^(\s*(?:\*\*)?\s*(?:Q(?:uestion)?\s*)?)(\d+)([.):])(\*\*)?(\s+)', re.IGNORECASE)
+QUESTION_RANGE_PATTERN = re.compile(r'\s*\((?:Questions?|Q)\s*\d+\s*[-–]\s*(?:\d+|X|Y|Z)\)', re.IGNORECASE)
+
+
+class Chunk:
+    def __init__(self, index):
+        self.index = index
+        self.parts = []     # (filename, unit_type, first unit number, last unit number, text)
+        self.size = 0
+
+    def add(self, filename, unit_type, number, text):
+        last = self.parts[-1] if self.parts else None
+        if last and last[0] == filename and last[3] == number - 1:
+            self.parts[-1] = (filename, unit_type, last[2], number, last[4] + '\n\n' + text)
+        else:
+            self.parts.append((filename, unit_type, number, number, text))
+        self.size += len(text)
+
+    @staticmethod
+    def _part_label(part):
+        filename, unit_type, first, last, _ = part
+        if unit_type == 'document':
+            return filename
+        if first == last:
+            return f'{filename} ({unit_type} {first})'
+        return f'{filename} ({unit_type}s {first}-{last})'
+
+    @property
+    def label(self):
+        return ', '.join(self._part_label(part) for part in self.parts)
+
+    def materials(self):
+        """The chunk as study materials for build_test_prompt()"""
+        return [{'filename': self._part_label(part), 'content': part[4]} for part in self.parts]
+
+
+def _split_oversized(text, max_chars):
+    """Split one unit that is larger than a chunk on paragraph (then hard) boundaries"""
+    pieces, current = [], []
+    size = 0
+    for paragraph in text.split('\n\n'):
+        while len(paragraph) > max_chars:
+            pieces.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if size + len(paragraph) > max_chars and current:
+            pieces.append('\n\n'.join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += len(paragraph) + 2
+    if current:
+        pieces.append('\n\n'.join(current))
+    return pieces
+
+
+def chunk_materials(materials, max_chars=None):
+    """Pack extracted materials (with units) into chunks of at most max_chars characters"""
+    max_chars = max_chars or GENERATION_CHUNK_CHARS
+    chunks = [Chunk(0)]
+    for material in materials:
+        units = material.get('units') or [material['content']]
+        numbers = material.get('unit_numbers') or range(1, len(units) + 1)
+        for number, unit in zip(numbers, units):
+            for piece in (_split_oversized(unit, max_chars) if len(unit) > max_chars else [unit]):
+                if chunks[-1].size and chunks[-1].size + len(piece) > max_chars:
+                    chunks.append(Chunk(len(chunks)))
+                chunks[-1].add(material['filename'], material.get('unit_type', 'document'), number, piece)
+    return [chunk for chunk in chunks if chunk.size]
+
+
+def requested_question_count(prompt):
+    match = QUESTION_COUNT_PATTERN.search(prompt or '')
+    return int(match.group(1)) if match else None
+
+
+def allocate_questions(chunks, total):
+    """Share `total` questions between chunks by size (largest remainder), at least one each"""
+    if total is None:
+        return [DEFAULT_QUESTIONS_PER_CHUNK] * len(chunks)
+    total = max(total, len(chunks))
+    size = sum(chunk.size for chunk in chunks)
+    shares = [total * chunk.size / size for chunk in chunks]
+    counts = [max(1, int(share)) for share in shares]
+    by_remainder = sorted(range(len(chunks)), key=lambda i: shares[i] - int(shares[i]), reverse=True)
+    i = 0
+    while sum(counts) < total:
+        counts[by_remainder[i % len(chunks)]] += 1
+        i += 1
+    while sum(counts) > total:
+        largest = max(range(len(chunks)), key=lambda i: counts[i])
+        counts[largest] -= 1
+    return counts
+
+
+def chunk_prompt(prompt, chunk, total_chunks, questions):
+    return (f"{prompt}\n\n"
+            f"NOTE: The study materials are split into {total_chunks} parts that are processed separately. "
+            f"This is part {chunk.index + 1} ({chunk.label}). Ignore any total question count above and "
+            f"write exactly {questions} questions covering only this part.")
+
+
+def needs_chunking(materials, mode=None):
+    mode = mode or GENERATION_MODE
+    if mode == 'chunked':
+        return True
+    if mode == 'single':
+        return False
+    return sum(len(material['content']) for material in materials) > GENERATION_CHUNK_CHARS
+
+
+def iter_chunk_results(chunks, prompt, generate, build_prompt):
+    """Generate every chunk concurrently; yields (chunk, result, error) as they complete.
+
+    generate(prompt_text) returns {'test', 'solutions'}; build_prompt(prompt,
+    materials) is the regular single-call prompt builder.
+    """
+    counts = allocate_questions(chunks, requested_question_count(prompt))
+    with ThreadPoolExecutor(max_workers=max(1, GENERATION_PARALLELISM), thread_name_prefix='chunk') as executor:
+        futures = {
+            executor.submit(generate, build_prompt(chunk_prompt(prompt, chunk, len(chunks), count), chunk.materials())): chunk
+            for chunk, count in zip(chunks, counts)
+        }
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                yield chunk, future.result(), None
+            except Exception as e:
+                yield chunk, None, e
+
+
+def _blocks(markdown):
+    """Split markdown into ('heading', text) and ('item', number, lines) blocks; leading text is kept as 'text'"""
+    blocks = []
+    for line in markdown.splitlines():
+        match = NUMBERED_LINE_PATTERN.match(line)
+        if match:
+            blocks.append(['item', int(match.group(2)), [line]])
+        elif line.lstrip().startswith('#'):
+            blocks.append(['heading', None, [line]])
+        elif blocks and blocks[-1][0] == 'item':
+            blocks[-1][2].append(line)
+        elif line.strip():
+            blocks.append(['text', None, [line]])
+    return blocks
+
+
+def _renumber(line, number):
+    return NUMBERED_LINE_PATTERN.sub(lambda m: f'{m.group(1)}{number}{m.group(3)}{m.group(4) or ""}{m.group(5)}', line, count=1)
+
+
+def _question_key(lines):
+    """Normalised question with its options, for spotting the same question from two chunks.
+
+    The stem alone isn't enough: "Which of the following is correct?" opens
+    many different questions.
+    """
+    text = '\n'.join([NUMBERED_LINE_PATTERN.sub('', lines[0], count=1)] + lines[1:])
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+
+def merge_parts(results):
+    """Merge [(chunk, {'test', 'solutions'})] in chunk order into one renumbered, deduplicated test"""
+    test_lines = ['# Practice Test', '']
+    solution_lines = ['# Solution Sheet', '']
+    seen = set()
+    number = 0
+    duplicates = 0
+
+    for chunk, result in sorted(results, key=lambda item: item[0].index):
+        solutions = {block[1]: block[2] for block in _blocks(result.get('solutions', '')) if block[0] == 'item'}
+        part_heading = f'## Part {chunk.index + 1}: {chunk.label}'
+        test_lines += [part_heading, '']
+        solution_lines += [part_heading, '']
+
+        for kind, old_number, lines in _blocks(result.get('test', '')):
+            if kind == 'heading':
+                if lines[0].lstrip().startswith('# '):
+                    continue  # each part's own "# Practice Test" title
+                test_lines += ['#' + QUESTION_RANGE_PATTERN.sub('', lines[0]), '']
+                continue
+            if kind == 'text':
+                test_lines += lines
+                continue
+
+            key = _question_key(lines)
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            number += 1
+            test_lines += [_renumber(lines[0], number)] + lines[1:]
+            if old_number in solutions:
+                solution = solutions[old_number]
+                solution_lines += [_renumber(solution[0], number)] + solution[1:]
+        test_lines.append('')
+        solution_lines.append('')
+
+    return {
+        'test': '\n'.join(test_lines).strip() + '\n',
+        'solutions': '\n'.join(solution_lines).strip() + '\n',
+        'question_count': number,
+        'duplicates_removed': duplicates,
+    }
@@ -0,0 +1,220 @@
+"""SQLite connection management for the Nursing School Organizer.
+
+Connections are opened once with the tuning pragmas below and then reused,
+either from a shared pool or one per thread (SQLITE_POOL_MODE). Inside a Flask
+request the connection is bound to the app context and handed back to the pool
+on teardown, so a route that raises before conn.close() can no longer leak it.
+Only the teardown releases a request's connection: conn.close() in a route is
+a no-op, so the connection can't be handed to another thread while the
+request still holds it.
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+
+# Database configuration
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+DATABASE = os.getenv('DATABASE_PATH', os.path.join(DATA_DIR, 'nursing_app.db'))
+
+# Connection reuse: 'pool' (shared LIFO pool), 'thread' (one per thread) or 'none' (open/close per use)
+POOL_MODE = os.getenv('SQLITE_POOL_MODE', 'pool').lower()
+POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', '8'))
+
+# Pragmas applied to every new connection
+JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # 256 MB
+CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', str(16 * 1024)))  # 16 MB per connection
+
+# Ensure data directory exists
+os.makedirs(os.path.dirname(os.path.abspath(DATABASE)), exist_ok=True)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool instead of closing it"""
+
+    _pool = None
+    _released = True
+    # Bound to a request's app context; released by its teardown, not by close()
+    _request_bound = False
+    # Opened for a nested use in a thread that already holds its thread-local connection
+    _temporary = False
+
+    def close(self):
+        if self._pool is None:
+            super().close()
+        elif not self._released and not self._request_bound:
+            self._pool.release(self)
+
+    def discard(self):
+        """Really close the underlying SQLite handle"""
+        self._pool = None
+        super().close()
+
+
+def open_connection(path=None):
+    """Open a new connection to the database with the configured pragmas"""
+    conn = sqlite3.connect(
+        path or DATABASE,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        factory=PooledConnection
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA journal_mode={JOURNAL_MODE}')
+    conn.execute(f'PRAGMA synchronous={SYNCHRONOUS}')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size={-CACHE_SIZE_KB}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    # Lets REPLACE fire delete triggers, so replaced rows leave sync tombstones too
+    conn.execute('PRAGMA recursive_triggers=ON')
+    return conn
+
+
+class _BasePool:
+    def __init__(self):
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        # gunicorn forks workers; connections must never cross a fork
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._reset()
+
+    def _reset(self):
+        pass
+
+    def acquire(self):
+        self._check_fork()
+        conn = self._acquire()
+        conn._pool = self
+        conn._released = False
+        return conn
+
+    def release(self, conn):
+        conn._released = True
+        conn._request_bound = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.discard()
+            return
+        self._release(conn)
+
+
+class ConnectionPool(_BasePool):
+    """Bounded LIFO pool of connections shared by all threads in the process"""
+
+    def __init__(self, size):
+        super().__init__()
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def _reset(self):
+        self._idle = queue.LifoQueue()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return open_connection()
+
+    def _release(self, conn):
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.discard()
+
+
+class ThreadLocalPool(_BasePool):
+    """One long-lived connection per thread"""
+
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    def _reset(self):
+        self._local = threading.local()
+
+    def _acquire(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = open_connection()
+        elif not conn._released:
+            # Nested use (e.g. connection() inside a request): a connection of its own,
+            # so releasing it can't roll back the outer transaction
+            conn = open_connection()
+            conn._temporary = True
+        return conn
+
+    def _release(self, conn):
+        if conn._temporary:
+            conn.discard()
+
+
+class NullPool(_BasePool):
+    """No reuse: every acquire opens a connection and every release closes it"""
+
+    def _acquire(self):
+        return open_connection()
+
+    def _release(self, conn):
+        conn.discard()
+
+
+def _create_pool():
+    if POOL_MODE == 'thread':
+        return ThreadLocalPool()
+    if POOL_MODE == 'none':
+        return NullPool()
+    return ConnectionPool(POOL_SIZE)
+
+
+pool = _create_pool()
+
+
+def get_db_connection():
+    """Get a database connection.
+
+    Within a request this returns the connection bound to the app context; it
+    is released automatically on teardown. Outside a request the caller owns
+    the connection and must close() it.
+    """
+    if not has_app_context():
+        return pool.acquire()
+
+    conn = g.get('_db_conn')
+    if conn is None or conn._released:
+        conn = g._db_conn = pool.acquire()
+        conn._request_bound = True
+    return conn
+
+
+@contextmanager
+def connection():
+    """A pooled connection not tied to the request, for background threads and streamed responses"""
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def close_db_connection(exception=None):
+    """Return the request's connection to the pool, rolling back anything uncommitted"""
+    conn = g.pop('_db_conn', None)
+    if conn is not None and conn._request_bound:
+        conn._request_bound = False
+        conn.close()
+
+
+def init_db_app(app):
+    """Tie connection release to the Flask request lifecycle"""
+    app.teardown_appcontext(close_db_connection)
@@ -0,0 +1,347 @@
+"""Text extraction from uploaded study materials.
+
+Files are parsed in a process pool: different files in parallel, and long
+PDFs split into page ranges that are parsed in parallel too. Every file has a
+deadline (EXTRACT_TIMEOUT_SECONDS); a file that misses it is reported as timed
+out and the shared pool is replaced, so a pathological PDF can't pin a worker.
+Requests still waiting on the old pool finish there before it is shut down.
+
+Each file yields its text as a list of units (PDF pages, PowerPoint slides,
+or the whole document), joined once at the end. A page selection such as
+"4-6,10" limits PDFs (and slide decks) to those pages; PDF pages outside it
+are never parsed, and pages are read one at a time from a generator.
+
+A PDF is written to a temporary file once and its tasks (counting the pages,
+then each page group) open that file, so the bytes are not pickled to every
+task and even counting pages is bound by the deadline.
+"""
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import PyPDF2
+from docx import Document
+from pptx import Presentation
+
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', str(min(4, os.cpu_count() or 1))))
+EXTRACT_TIMEOUT_SECONDS = float(os.getenv('EXTRACT_TIMEOUT_SECONDS', '120'))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '20'))
+# Platform default (fork on Linux): workers only parse bytes, they never touch SQLite or app threads,
+# and unlike spawn it doesn't re-import app.py in every worker
+EXTRACT_START_METHOD = os.getenv('EXTRACT_START_METHOD') or None
+
+UNIT_SEPARATOR = '\n\n'
+
+# Bump whenever extraction output changes, so cached text from older code is ignored
+EXTRACTOR_VERSION = 2
+
+PAGE_RANGE_PATTERN = re.compile(r'^(\d+)?\s*(?:(-)\s*(\d+)?)?$')
+
+
+def file_extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def parse_page_selection(value):
+    """'4-6, 10, 20-' -> [(4, 6), (10, 10), (20, None)] (1-based, inclusive); None for everything"""
+    if not value or not value.strip():
+        return None
+    ranges = []
+    for part in value.split(','):
+        match = PAGE_RANGE_PATTERN.match(part.strip())
+        if not part.strip() or not match or not (match.group(1) or match.group(3)):
+            raise ValueError(f'Invalid page range: {part.strip() or value}')
+        start = int(match.group(1) or 1)
+        end = (int(match.group(3)) if match.group(3) else None) if match.group(2) else start
+        if start < 1 or (end is not None and end < start):
+            raise ValueError(f'Invalid page range: {part.strip()}')
+        ranges.append((start, end))
+    return ranges
+
+
+def format_page_selection(ranges):
+    return ','.join(str(start) if start == end else f"{start}-{end or ''}" for start, end in ranges)
+
+
+def selected_pages(ranges, page_count):
+    """Sorted 1-based page numbers of the selection that exist in the document"""
+    if ranges is None:
+        return list(range(1, page_count + 1))
+    pages = set()
+    for start, end in ranges:
+        pages.update(range(start, min(end or page_count, page_count) + 1))
+    return sorted(pages)
+
+
+def _pdf_reader(source):
+    """A reader for PDF bytes or the path of a PDF file"""
+    return PyPDF2.PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+
+
+def pdf_page_count(source):
+    return len(_pdf_reader(source).pages)
+
+
+def iter_pdf_pages(source, page_numbers=None):
+    """Yield (page number, text) one page at a time, parsing only the requested pages"""
+    reader = _pdf_reader(source)
+    for number in page_numbers or range(1, len(reader.pages) + 1):
+        yield number, reader.pages[number - 1].extract_text() or ''
+
+
+def extract_pdf_pages(source, page_numbers=None):
+    """Text of the given (1-based) pages of a PDF (bytes or a path)"""
+    return [text for _, text in iter_pdf_pages(source, page_numbers)]
+
+
+def extract_docx_units(data):
+    doc = Document(io.BytesIO(data))
+    return [UNIT_SEPARATOR.join(paragraph.text for paragraph in doc.paragraphs)]
+
+
+def extract_pptx_units(data):
+    """One unit per slide, including table rows"""
+    prs = Presentation(io.BytesIO(data))
+    slides = []
+
+    for slide_num, slide in enumerate(prs.slides, 1):
+        slide_text = [f"--- Slide {slide_num} ---"]
+
+        # Extract text from shapes
+        for shape in slide.shapes:
+            if hasattr(shape, "text") and shape.text:
+                slide_text.append(shape.text)
+
+            # Extract text from tables
+            if shape.has_table:
+                for row in shape.table.rows:
+                    row_text = " | ".join([cell.text for cell in row.cells])
+                    slide_text.append(row_text)
+
+        slides.append("\n".join(slide_text))
+
+    return slides
+
+
+def extract_units(filename, data, ranges=None):
+    """(unit_type, unit numbers, units) for a whole file; runs in a pool worker"""
+    file_ext = file_extension(filename)
+    if file_ext == 'pdf':
+        pages = list(iter_pdf_pages(data))
+        return 'page', [number for number, _ in pages], [text for _, text in pages]
+    elif file_ext in ['pptx', 'ppt']:
+        slides = extract_pptx_units(data)
+        numbers = selected_pages(ranges, len(slides))
+        return 'slide', numbers, [slides[number - 1] for number in numbers]
+    elif file_ext in ['docx', 'doc']:
+        return 'document', [1], extract_docx_units(data)
+    elif file_ext in ['txt', 'md']:
+        return 'document', [1], [data.decode('utf-8')]
+    else:
+        return 'document', [1], ["Unsupported file type"]
+
+
+def _timed(func, *args):
+    """Run func in the worker and also return how long it took there"""
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def _error_text(filename, error):
+    # Same wording the extractors always used, so the prompt still mentions the broken file
+    kind = {'pdf': 'PDF', 'docx': 'DOCX', 'doc': 'DOCX', 'pptx': 'PowerPoint', 'ppt': 'PowerPoint'}
+    return f"Error extracting {kind.get(file_extension(filename), filename)}: {error}"
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# Number of extract_files() calls still waiting on each pool
+_pool_users = {}
+
+
+def _current_pool():
+    """The pool in service, created on first use (and again after a fork); call with _pool_lock held"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        if _pool_pid != os.getpid():
+            _pool_users.clear()  # the parent's pools are not ours to track
+        _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS,
+                                    mp_context=multiprocessing.get_context(EXTRACT_START_METHOD))
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def get_pool():
+    with _pool_lock:
+        return _current_pool()
+
+
+def _checkout_pool():
+    with _pool_lock:
+        pool = _current_pool()
+        _pool_users[pool] = _pool_users.get(pool, 0) + 1
+        return pool
+
+
+def _checkin_pool(pool, retire=False):
+    """Done waiting on pool. retire takes a stuck or broken pool out of service.
+
+    Later calls get a fresh pool right away, while calls still waiting on the
+    retired one keep their results; its processes (and the task stuck in one)
+    are killed once the last of them checks in.
+    """
+    global _pool
+    with _pool_lock:
+        _pool_users[pool] -= 1
+        if retire and _pool is pool:
+            _pool = None
+        retired = _pool is not pool
+        idle = _pool_users[pool] == 0
+        if idle:
+            del _pool_users[pool]
+    if retired and idle:
+        _kill_pool(pool)
+
+
+def _kill_pool(pool):
+    # ProcessPoolExecutor has no public way to stop a running task
+    processes = list((getattr(pool, '_processes', None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def _submit(pool, filename, data, ranges, paths):
+    """(PDF path or None, futures) for one file. A PDF is saved to a temporary file
+    (added to paths) and only its page count is queued; anything else is one task."""
+    if file_extension(filename) == 'pdf':
+        fd, path = tempfile.mkstemp(prefix='extract_', suffix='.pdf')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        paths.append(path)
+        return path, [pool.submit(_timed, pdf_page_count, path)]
+    return None, [pool.submit(_timed, extract_units, filename, data, ranges)]
+
+
+def _submit_pages(pool, path, ranges, count_future, deadline):
+    """(page numbers, futures, seconds spent counting) for a PDF whose page count was queued;
+    the selected pages are parsed in groups of PDF_PAGES_PER_TASK"""
+    seconds, page_count = count_future.result(timeout=max(0, deadline - time.monotonic()))
+    pages = selected_pages(ranges, page_count)
+    groups = [pages[i:i + PDF_PAGES_PER_TASK] for i in range(0, len(pages), PDF_PAGES_PER_TASK)]
+    return pages, [pool.submit(_timed, extract_pdf_pages, path, group) for group in groups], seconds
+
+
+def range_counts(ranges, numbers, units):
+    """Characters extracted per requested page range (or for the whole file)"""
+    if ranges is None:
+        pages = f'{numbers[0]}-{numbers[-1]}' if numbers else ''
+        return [{'pages': pages, 'characters': sum(len(unit) for unit in units)}]
+    counts = []
+    for start, end in ranges:
+        characters = sum(len(unit) for number, unit in zip(numbers, units)
+                         if number >= start and (end is None or number <= end))
+        counts.append({'pages': format_page_selection([(start, end)]), 'characters': characters})
+    return counts
+
+
+def extract_files(files, timeout=None):
+    """Extract every (filename, bytes[, page ranges]) entry in parallel.
+
+    Returns (materials, timings) in upload order: materials are
+    {'filename', 'content', 'unit_type', 'unit_numbers', 'units'} and timings
+    {'filename', 'seconds', 'finished_after', 'characters', 'units', 'ranges', 'status'}
+    where seconds is parsing time summed over the file's tasks,
+    finished_after the wall time until its text was ready and ranges the
+    characters per requested page range. The timeout is measured from the
+    start of the batch.
+    """
+    files = [(entry[0], entry[1], entry[2] if len(entry) > 2 else None) for entry in files]
+    timeout = EXTRACT_TIMEOUT_SECONDS if timeout is None else timeout
+    if not files:
+        return [], []
+
+    pool, retire = _checkout_pool(), False
+    try:
+        materials, timings, retire = _collect(pool, files, timeout)
+    finally:
+        _checkin_pool(pool, retire)
+    return materials, timings
+
+
+def _collect(pool, files, timeout):
+    """Submit the files to pool and wait for them; also returns whether the pool must be retired"""
+    started = time.monotonic()
+    deadline = started + timeout
+    paths = []
+    try:
+        submitted = [(filename, ranges, *_submit(pool, filename, data, ranges, paths))
+                     for filename, data, ranges in files]
+
+        # Every file is queued before any is waited on; a PDF's page groups follow its page count
+        planned = []
+        for filename, ranges, path, futures in submitted:
+            pages, counting, failure = None, 0.0, None
+            if path is not None:
+                try:
+                    pages, futures, counting = _submit_pages(pool, path, ranges, futures[0], deadline)
+                except Exception as e:
+                    failure = e
+            planned.append((filename, ranges, pages, futures, counting, failure))
+        return _wait(planned, started, deadline, timeout)
+    finally:
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _wait(planned, started, deadline, timeout):
+    """Wait for each file's tasks in upload order; (materials, timings, whether to retire the pool)"""
+    materials, timings, retire = [], [], False
+    for filename, ranges, pages, futures, counting, failure in planned:
+        status, seconds = 'ok', counting
+        try:
+            if failure is not None:
+                raise failure
+            timed_parts = [future.result(timeout=max(0, deadline - time.monotonic())) for future in futures]
+            seconds += sum(elapsed for elapsed, _ in timed_parts)
+            parts = [part for _, part in timed_parts]
+            if pages is None:
+                unit_type, numbers, units = parts[0]
+            else:
+                unit_type, numbers, units = 'page', pages, [page for part in parts for page in part]
+        except FutureTimeoutError:
+            status, retire = 'timeout', True
+            for future in futures:
+                future.cancel()  # only parts that have not started yet; the pool is retired for the rest
+            unit_type, numbers, units = 'document', [1], [_error_text(filename, f'timed out after {timeout:g} seconds')]
+        except Exception as e:
+            # A worker that crashes (e.g. out of memory) breaks the whole pool
+            status, retire = 'error', retire or isinstance(e, BrokenProcessPool)
+            unit_type, numbers, units = 'document', [1], [_error_text(filename, e)]
+
+        content = UNIT_SEPARATOR.join(units)
+        materials.append({'filename': filename, 'content': content, 'unit_type': unit_type,
+                          'unit_numbers': numbers, 'units': units})
+        timings.append({
+            'filename': filename,
+            'seconds': round(seconds, 3),
+            'finished_after': round(time.monotonic() - started, 3),
+            'characters': len(content),
+            'units': len(units),
+            'ranges': range_counts(ranges, numbers, units) if unit_type != 'document' else None,
+            'status': status,
+        })
+        print(f"Extracted {len(content)} characters from {filename} ({status}, {timings[-1]['seconds']}s)")
+
+    return materials, timings, retire
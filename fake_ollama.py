@@ -0,0 +1,255 @@
+"""Stand-in Ollama server for offline, repeatable load and latency tests.
+
+Implements POST /api/generate (streaming NDJSON and plain JSON) plus
+/api/tags and /api/version. The responses are canned but shaped like the
+real thing: test generation prompts get a JSON practice test with the
+requested number of questions (in the format the question parser reads),
+enhancement prompts get the transcript back as markdown notes, and anything
+else gets filler text.
+
+Latency (time to first token), tokens per second, the fraction of requests
+that fail and the status they fail with can be set from the command line,
+from FAKE_OLLAMA_* variables, or changed while running with
+POST /_fake/config. GET /_fake/stats reports request counts and the peak
+number of concurrent requests, which shows how hard the app actually leans
+on upstream.
+
+    python fake_ollama.py --port 11434 --latency 2 --tokens-per-second 40 --error-rate 0.1
+    OLLAMA_HOST=http://localhost:11434 python app.py
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import Flask, Response, jsonify, request
+
+CONFIG = {
+    'latency': float(os.getenv('FAKE_OLLAMA_LATENCY', '0.5')),              # seconds before the first token
+    'jitter': float(os.getenv('FAKE_OLLAMA_JITTER', '0')),                  # +/- seconds added to the latency
+    'tokens_per_second': float(os.getenv('FAKE_OLLAMA_TOKENS_PER_SECOND', '200')),  # 0 means no delay
+    'error_rate': float(os.getenv('FAKE_OLLAMA_ERROR_RATE', '0')),          # fraction of requests that fail
+    'error_status': int(os.getenv('FAKE_OLLAMA_ERROR_STATUS', '502')),
+    'max_concurrency': int(os.getenv('FAKE_OLLAMA_MAX_CONCURRENCY', '0')),  # answer 503 beyond this; 0 = unlimited
+    'questions': int(os.getenv('FAKE_OLLAMA_QUESTIONS', '10')),             # when the prompt doesn't ask for a number
+}
+
+ERROR_BODIES = {
+    429: 'too many requests',
+    500: 'internal server error',
+    502: 'upstream error: bad gateway',
+    503: 'service overloaded, please retry',
+    504: 'upstream timeout',
+}
+
+# "write exactly 12 questions" (chunk prompts) wins over "... 100 questions" in the user's request
+EXACT_COUNT_PATTERN = re.compile(r'write exactly (\d+) questions', re.IGNORECASE)
+REQUEST_COUNT_PATTERN = re.compile(r'IMPORTANT USER REQUEST:.*?(\d+)\s*(?:practice\s+|test\s+|exam\s+)?questions?\b',
+                                   re.IGNORECASE)
+TRANSCRIPT_PATTERN = re.compile(r'RAW TRANSCRIPT:\n(.*?)\n\nYour task:', re.DOTALL)
+
+TOPICS = ['vital signs', 'medication administration', 'infection control', 'fluid balance',
+          'wound care', 'pain assessment', 'patient safety', 'cardiac function']
+
+app = Flask(__name__)
+stats_lock = threading.Lock()
+stats = {'requests': 0, 'streamed': 0, 'errors': 0, 'rejected': 0, 'in_flight': 0, 'max_in_flight': 0,
+         'tokens': 0}
+
+
+def _count(**amounts):
+    with stats_lock:
+        for name, amount in amounts.items():
+            stats[name] += amount
+        stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+
+
+def question_count(prompt):
+    match = EXACT_COUNT_PATTERN.search(prompt) or REQUEST_COUNT_PATTERN.search(prompt)
+    return int(match.group(1)) if match else CONFIG['questions']
+
+
+def canned_test(count, rng):
+    """JSON practice test: about two thirds multiple choice, the rest true/false"""
+    choice_count = max(1, count - count // 3) if count > 1 else count
+    test = ['# Practice Test', '', f'## Multiple Choice (Questions 1-{choice_count})']
+    solutions = ['# Solution Sheet', '', '## Multiple Choice Answers']
+    for number in range(1, count + 1):
+        topic = TOPICS[(number - 1) % len(TOPICS)]
+        if number == choice_count + 1:
+            test += ['', f'## True/False (Questions {number}-{count})']
+            solutions += ['', '## True/False Answers']
+        if number <= choice_count:
+            answer = rng.choice('ABCD')
+            test += [f'{number}. Which statement about {topic} is correct (case {number})?',
+                     f'A) Option A for {topic}', f'B) Option B for {topic}',
+                     f'C) Option C for {topic}', f'D) Option D for {topic}', '']
+            solutions.append(f'{number}. Answer: {answer} - Option {answer} describes {topic} correctly.')
+        else:
+            answer = rng.choice(['True', 'False'])
+            test += [f'{number}. {topic.capitalize()} should be reassessed after every intervention '
+                     f'(case {number}). (T/F)', '']
+            solutions.append(f'{number}. Answer: {answer} - See the notes on {topic}.')
+    return json.dumps({'test': '\n'.join(test), 'solutions': '\n'.join(solutions)}, indent=2)
+
+
+def canned_notes(transcript):
+    sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', re.sub(r'\[?t\d+=\S*\]?', '', transcript)) if s.strip()]
+    paragraphs = [' '.join(sentences[i:i + 4]) for i in range(0, len(sentences), 4)] or ['(empty transcript)']
+    return '## Lecture Notes\n\n' + '\n\n'.join(paragraphs)
+
+
+def canned_response(prompt, rng):
+    if 'Format your response as JSON' in prompt:
+        return canned_test(question_count(prompt), rng)
+    match = TRANSCRIPT_PATTERN.search(prompt)
+    if match:
+        return canned_notes(match.group(1))
+    words = re.findall(r'[A-Za-z]+', prompt)[:200] or ['fake', 'ollama', 'response']
+    return ' '.join(rng.choice(words) for _ in range(120))
+
+
+def tokenize(text):
+    """Rough model tokens: each word with its leading whitespace, so joining them gives the text back"""
+    return re.findall(r'\s*\S+', text) or [text]
+
+
+def _timestamp():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _error_response():
+    status = CONFIG['error_status']
+    _count(errors=1)
+    return jsonify({'error': ERROR_BODIES.get(status, f'injected error {status}')}), status
+
+
+@app.route('/api/generate', methods=['POST'])
+def generate():
+    body = request.get_json(force=True, silent=True) or {}
+    prompt = body.get('prompt', '')
+    model = body.get('model', 'fake')
+    stream = body.get('stream', True)
+
+    with stats_lock:
+        limit = CONFIG['max_concurrency']
+        if limit and stats['in_flight'] >= limit:
+            stats['rejected'] += 1
+            return jsonify({'error': ERROR_BODIES[503]}), 503
+        stats['requests'] += 1
+        stats['in_flight'] += 1
+        stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+
+    rng = random.Random(prompt)  # same prompt, same answer
+    started = time.monotonic()
+    streaming = False
+    try:
+        time.sleep(max(0.0, CONFIG['latency'] + random.uniform(-CONFIG['jitter'], CONFIG['jitter'])))
+        if random.random() < CONFIG['error_rate']:
+            return _error_response()
+        tokens = tokenize(canned_response(prompt, rng))
+
+        if not stream:
+            if CONFIG['tokens_per_second'] > 0:
+                time.sleep(len(tokens) / CONFIG['tokens_per_second'])
+            _count(tokens=len(tokens))
+            return jsonify(_final(model, started, prompt, tokens, response=''.join(tokens)))
+
+        streaming = True
+        return Response(_stream(model, started, prompt, tokens), mimetype='application/x-ndjson')
+    finally:
+        if not streaming:
+            _count(in_flight=-1)
+
+
+def _stream(model, started, prompt, tokens):
+    try:
+        _count(streamed=1)
+        delay = 1 / CONFIG['tokens_per_second'] if CONFIG['tokens_per_second'] > 0 else 0
+        for token in tokens:
+            if delay:
+                time.sleep(delay)
+            yield json.dumps({'model': model, 'created_at': _timestamp(), 'response': token, 'done': False}) + '\n'
+        _count(tokens=len(tokens))
+        yield json.dumps(_final(model, started, prompt, tokens, response='')) + '\n'
+    finally:
+        _count(in_flight=-1)
+
+
+def _final(model, started, prompt, tokens, response):
+    elapsed_ns = int((time.monotonic() - started) * 1e9)
+    return {
+        'model': model,
+        'created_at': _timestamp(),
+        'response': response,
+        'done': True,
+        'done_reason': 'stop',
+        'total_duration': elapsed_ns,
+        'load_duration': 0,
+        'prompt_eval_count': len(tokenize(prompt)) if prompt else 0,
+        'prompt_eval_duration': int(CONFIG['latency'] * 1e9),
+        'eval_count': len(tokens),
+        'eval_duration': max(0, elapsed_ns - int(CONFIG['latency'] * 1e9)),
+    }
+
+
+@app.route('/api/tags', methods=['GET'])
+def tags():
+    return jsonify({'models': [{'name': os.getenv('OLLAMA_MODEL', 'gpt-oss:120b-cloud'), 'size': 0}]})
+
+
+@app.route('/api/version', methods=['GET'])
+def version():
+    return jsonify({'version': 'fake'})
+
+
+@app.route('/_fake/config', methods=['GET', 'POST'])
+def fake_config():
+    """Change latency, throughput or error injection without restarting"""
+    if request.method == 'POST':
+        updates = request.get_json(force=True, silent=True) or {}
+        unknown = [key for key in updates if key not in CONFIG]
+        if unknown:
+            return jsonify({'error': f"Unknown settings: {', '.join(unknown)}"}), 400
+        for key, value in updates.items():
+            CONFIG[key] = type(CONFIG[key])(value)
+    return jsonify(CONFIG)
+
+
+@app.route('/_fake/stats', methods=['GET', 'DELETE'])
+def fake_stats():
+    with stats_lock:
+        if request.method == 'DELETE':
+            in_flight = stats['in_flight']
+            stats.update({name: 0 for name in stats})
+            stats['in_flight'] = stats['max_in_flight'] = in_flight
+        return jsonify(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stand-in Ollama server for load and latency testing')
+    parser.add_argument('--host', default=os.getenv('FAKE_OLLAMA_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('FAKE_OLLAMA_PORT', '11434')))
+    parser.add_argument('--latency', type=float, help='seconds before the first token')
+    parser.add_argument('--jitter', type=float, help='random +/- seconds added to the latency')
+    parser.add_argument('--tokens-per-second', type=float, help='generation speed (0 = instant)')
+    parser.add_argument('--error-rate', type=float, help='fraction of requests that fail (0-1)')
+    parser.add_argument('--error-status', type=int, help='HTTP status of injected failures (default 502)')
+    parser.add_argument('--max-concurrency', type=int, help='answer 503 above this many concurrent requests')
+    parser.add_argument('--questions', type=int, help='questions per test when the prompt names no number')
+    args = parser.parse_args()
+
+    for key in CONFIG:
+        value = getattr(args, key)
+        if value is not None:
+            CONFIG[key] = value
+    print(f"Fake Ollama on http://{args.host}:{args.port} with {CONFIG}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
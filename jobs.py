@@ -0,0 +1,268 @@
+"""Background jobs persisted in SQLite.
+
+Slow work (test generation, transcription) is queued in the jobs table and
+the request returns a job id right away. Jobs belong to a queue: every web
+worker process runs a small dispatcher for the default queue, and dedicated
+processes (the transcription worker) serve their own. Dispatchers claim jobs
+under BEGIN IMMEDIATE, so the number of running jobs in a queue never exceeds
+its limit (JOB_CONCURRENCY for the default queue) across processes.
+Running jobs are heartbeated; a job whose heartbeat goes stale (its worker was
+killed or restarted) is put back in the queue, up to JOB_MAX_ATTEMPTS times.
+"""
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from db import connection
+
+JOB_CONCURRENCY = int(os.getenv('JOB_CONCURRENCY', '2'))
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '1'))
+JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', '120'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '2'))
+
+FINISHED_STATUSES = ('succeeded', 'failed')
+DEFAULT_QUEUE = 'default'
+# Work a request runs itself; no dispatcher serves this queue, so it never counts against one's limit
+INLINE_QUEUE = 'inline'
+
+# kind -> function(job); registered with @job_handler
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register the function that runs jobs of this kind"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+class JobFailed(Exception):
+    """Raised by a handler to fail the job with a structured error payload"""
+
+    def __init__(self, error):
+        super().__init__(error.get('error', 'Job failed'))
+        self.error = error
+
+
+class Job:
+    """What a handler sees: the payload and a way to report progress"""
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.kind = row['kind']
+        self.payload = json.loads(row['payload'] or '{}')
+        self.attempts = row['attempts']
+
+    def progress(self, fraction, message=None):
+        report_progress(self.id, fraction, message)
+
+
+def report_progress(job_id, fraction, message=None):
+    """Record progress on a running job; also counts as a heartbeat"""
+    with connection() as conn:
+        conn.execute('''
+            UPDATE jobs SET progress = ?, message = COALESCE(?, message), heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'running'
+        ''', (fraction, message, job_id))
+        conn.commit()
+
+
+def enqueue(conn, kind, payload, queue=DEFAULT_QUEUE, commit=True):
+    """Queue a job and return its id.
+
+    commit=False leaves the insert in the caller's transaction, so the job is
+    only queued if the rows that go with it are saved too.
+    """
+    cursor = conn.execute('INSERT INTO jobs (kind, queue, payload) VALUES (?, ?, ?)',
+                          (kind, queue, json.dumps(payload)))
+    if commit:
+        conn.commit()
+    return cursor.lastrowid
+
+
+def start_inline_job(conn, kind, payload):
+    """Record work the current request runs itself (e.g. a stream) as a running job.
+
+    It goes in INLINE_QUEUE, so it is never claimed by a dispatcher and does
+    not take a slot from queued jobs. Since it starts at the attempt limit, a
+    stale heartbeat fails it instead of requeueing it.
+    """
+    cursor = conn.execute('''
+        INSERT INTO jobs (kind, queue, status, payload, attempts, worker, started_at, heartbeat_at)
+        VALUES (?, ?, 'running', ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    ''', (kind, INLINE_QUEUE, json.dumps(payload), JOB_MAX_ATTEMPTS, f'{os.uname().nodename}:{os.getpid()}'))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def job_to_dict(row):
+    return {
+        'id': row['id'],
+        'kind': row['kind'],
+        'status': row['status'],
+        'progress': row['progress'],
+        'message': row['message'],
+        'result': json.loads(row['result']) if row['result'] else None,
+        'error': json.loads(row['error']) if row['error'] else None,
+        'attempts': row['attempts'],
+        'created_at': row['created_at'],
+        'started_at': row['started_at'],
+        'finished_at': row['finished_at'],
+    }
+
+
+def get_job(conn, job_id):
+    row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return job_to_dict(row) if row else None
+
+
+def wait_for_job(conn, job_id, timeout):
+    """Long-poll: return the job once it has finished or after `timeout` seconds"""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = get_job(conn, job_id)
+        if job is None or job['status'] in FINISHED_STATUSES or time.monotonic() >= deadline:
+            return job
+        time.sleep(JOB_POLL_SECONDS / 2)
+
+
+def _requeue_stale(conn):
+    """Jobs whose worker stopped heartbeating go back to the queue (or fail after too many tries)"""
+    stale = f"status = 'running' AND heartbeat_at < datetime('now', '-{JOB_STALE_SECONDS} seconds')"
+    conn.execute(f'''
+        UPDATE jobs SET status = 'failed', finished_at = CURRENT_TIMESTAMP,
+            error = json_object('error', 'Job was interrupted too many times')
+        WHERE {stale} AND attempts >= ?
+    ''', (JOB_MAX_ATTEMPTS,))
+    conn.execute(f"UPDATE jobs SET status = 'queued', message = 'Requeued after interruption' WHERE {stale}")
+
+
+def claim(conn, kinds, worker, queue=DEFAULT_QUEUE, limit=None):
+    """Atomically take the oldest queued job of the given kinds, keeping the queue within its limit"""
+    limit = JOB_CONCURRENCY if limit is None else limit
+    placeholders = ', '.join('?' for _ in kinds)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _requeue_stale(conn)
+        running = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running' AND queue = ?",
+                               (queue,)).fetchone()[0]
+        row = None
+        if running < limit:
+            row = conn.execute(f'''
+                SELECT id FROM jobs WHERE status = 'queued' AND queue = ? AND kind IN ({placeholders})
+                ORDER BY id LIMIT 1
+            ''', (queue, *kinds)).fetchone()
+        if row is not None:
+            conn.execute('''
+                UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, progress = 0,
+                    started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (worker, row['id']))
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return row
+
+
+def finish_job(job_id, status, result=None, error=None):
+    """Mark a job succeeded (with its result) or failed (with an error payload)"""
+    with connection() as conn:
+        conn.execute('''
+            UPDATE jobs SET status = ?, progress = CASE WHEN ? = 'succeeded' THEN 1 ELSE progress END,
+                result = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (status, status, json.dumps(result) if result is not None else None,
+              json.dumps(error) if error is not None else None, job_id))
+        conn.commit()
+
+
+def run_job(row):
+    """Run one claimed job with its handler and record the outcome"""
+    job = Job(row)
+    try:
+        result = HANDLERS[job.kind](job)
+    except JobFailed as e:
+        finish_job(job.id, 'failed', error=e.error)
+    except Exception as e:
+        traceback.print_exc()
+        finish_job(job.id, 'failed', error={'error': str(e)})
+    else:
+        finish_job(job.id, 'succeeded', result=result)
+
+
+class Dispatcher:
+    """Claims jobs of one queue for this process and runs them on a thread pool"""
+
+    def __init__(self, kinds=None, queue=DEFAULT_QUEUE, concurrency=None):
+        self.kinds = tuple(kinds) if kinds else None
+        self.queue = queue
+        self.concurrency = concurrency or JOB_CONCURRENCY
+        self.worker = f'{os.uname().nodename}:{os.getpid()}'
+        self._running = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f'job-{queue}')
+
+    def _heartbeat(self, conn):
+        with self._lock:
+            running = list(self._running)
+        if running:
+            placeholders = ', '.join('?' for _ in running)
+            conn.execute(f'UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE id IN ({placeholders})', running)
+            conn.commit()
+
+    def _run(self, row):
+        try:
+            run_job(row)
+        finally:
+            with self._lock:
+                self._running.discard(row['id'])
+
+    def poll_once(self):
+        """Heartbeat our jobs and start as many queued ones as we may; returns how many started"""
+        kinds = self.kinds or tuple(HANDLERS)
+        started = 0
+        with connection() as conn:
+            self._heartbeat(conn)
+            while kinds:
+                with self._lock:
+                    if len(self._running) >= self.concurrency:
+                        break
+                row = claim(conn, kinds, self.worker, self.queue, self.concurrency)
+                if row is None:
+                    break
+                with self._lock:
+                    self._running.add(row['id'])
+                self._executor.submit(self._run, row)
+                started += 1
+        return started
+
+    def run_forever(self):
+        while True:
+            try:
+                self.poll_once()
+            except Exception:
+                traceback.print_exc()
+            time.sleep(JOB_POLL_SECONDS)
+
+
+_dispatcher = None
+_dispatcher_pid = None
+_dispatcher_lock = threading.Lock()
+
+
+def start_dispatcher(kinds=None):
+    """Start this process's dispatcher thread once (again after a fork)"""
+    global _dispatcher, _dispatcher_pid
+    with _dispatcher_lock:
+        if _dispatcher is not None and _dispatcher_pid == os.getpid():
+            return _dispatcher
+        _dispatcher = Dispatcher(kinds)
+        _dispatcher_pid = os.getpid()
+        threading.Thread(target=_dispatcher.run_forever, name='job-dispatcher', daemon=True).start()
+        return _dispatcher
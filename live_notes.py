@@ -0,0 +1,134 @@
+"""Audio notes transcribed while the lecture is still being recorded.
+
+A live note is an audio_notes row with live_status 'recording'. The browser
+uploads the recording in self-contained segments (every LIVE_SEGMENT_SECONDS
+or so); each one is stored in live_segments and queued for the transcription
+worker, which transcribes it and rebuilds the note's transcript from every
+segment finished so far, in order. Finishing the note ('finishing', then
+'complete') only has to wait for the last segment or two.
+
+Segment timestamps are stored in centiseconds from the start of the
+recording, like the segments of a whole-file transcription, and the note's
+transcript_segments are rebuilt along with its transcript.
+"""
+import json
+import os
+
+from transcript_segments import store_segments
+
+LIVE_SEGMENT_SECONDS = int(os.getenv('LIVE_SEGMENT_SECONDS', '30'))
+
+RECORDING, FINISHING, COMPLETE = 'recording', 'finishing', 'complete'
+
+
+def create_live_note(conn, title, course, lecture_date, options):
+    """options ({'mode', 'language'}) apply to every segment of the recording"""
+    cursor = conn.execute('''
+        INSERT INTO audio_notes (title, transcript, lecture_date, course, is_enhanced, live_status, live_options)
+        VALUES (?, '', ?, ?, 0, ?, ?)
+    ''', (title, lecture_date, course, RECORDING, json.dumps(options)))
+    return cursor.lastrowid
+
+
+def get_live_note(conn, note_id):
+    return conn.execute('''
+        SELECT id, title, course, lecture_date, transcript, live_status, live_options FROM audio_notes
+        WHERE id = ? AND live_status IS NOT NULL
+    ''', (note_id,)).fetchone()
+
+
+def get_segment(conn, note_id, seq):
+    return conn.execute('SELECT * FROM live_segments WHERE note_id = ? AND seq = ?', (note_id, seq)).fetchone()
+
+
+def add_segment(conn, note_id, seq, start_seconds, file_path, job_id):
+    conn.execute('''
+        INSERT INTO live_segments (note_id, seq, start_seconds, file_path, job_id)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (note_id, seq, start_seconds, file_path, job_id))
+
+
+def store_segment(conn, note_id, seq, duration_seconds, segments):
+    """Save a transcribed segment and append it to the note's transcript"""
+    text = ' '.join(text for _, _, text in segments if text)
+    conn.execute('''
+        UPDATE live_segments
+        SET status = 'done', duration_seconds = ?, segments = ?, text = ?, transcribed_at = CURRENT_TIMESTAMP
+        WHERE note_id = ? AND seq = ?
+    ''', (duration_seconds, json.dumps(segments), text, note_id, seq))
+    rebuild_transcript(conn, note_id)
+    return text
+
+
+def fail_segment(conn, note_id, seq):
+    conn.execute("UPDATE live_segments SET status = 'failed' WHERE note_id = ? AND seq = ?", (note_id, seq))
+
+
+def rebuild_transcript(conn, note_id):
+    """Segments can finish out of order, so the transcript is always rebuilt in segment order"""
+    rows = conn.execute('''
+        SELECT segments FROM live_segments WHERE note_id = ? AND status = 'done' ORDER BY seq
+    ''', (note_id,)).fetchall()
+    segments = [tuple(segment) for row in rows for segment in json.loads(row['segments'])]
+    transcript = store_segments(conn, note_id, segments)
+    conn.execute('UPDATE audio_notes SET transcript = ? WHERE id = ?', (transcript, note_id))
+
+
+def backfill_transcript_segments(conn):
+    """Timestamped segments for live notes recorded before transcript_segments existed"""
+    notes = conn.execute('''
+        SELECT DISTINCT note_id FROM live_segments
+        WHERE status = 'done' AND note_id NOT IN (SELECT DISTINCT note_id FROM transcript_segments)
+    ''').fetchall()
+    for note in notes:
+        rebuild_transcript(conn, note['note_id'])
+
+
+def segments_after(conn, note_id, after):
+    """Finished segments with seq > after, in order, stopping at the first one still queued.
+
+    A client that remembers the last seq it was sent therefore never skips a
+    segment that finishes late.
+    """
+    rows = conn.execute('''
+        SELECT seq, start_seconds, duration_seconds, status, text FROM live_segments
+        WHERE note_id = ? AND seq > ?
+        ORDER BY seq
+    ''', (note_id, after)).fetchall()
+    finished = []
+    for row in rows:
+        if row['status'] == 'queued':
+            break
+        finished.append(row)
+    return finished
+
+
+def segment_counts(conn, note_id):
+    rows = conn.execute('''
+        SELECT status, COUNT(*) AS count FROM live_segments WHERE note_id = ? GROUP BY status
+    ''', (note_id,)).fetchall()
+    counts = {'queued': 0, 'done': 0, 'failed': 0}
+    counts.update({row['status']: row['count'] for row in rows})
+    return counts
+
+
+def segment_files(conn, note_id):
+    """Audio files of a note's segments in recording order"""
+    rows = conn.execute('SELECT file_path FROM live_segments WHERE note_id = ? ORDER BY seq', (note_id,))
+    return [row['file_path'] for row in rows]
+
+
+def set_live_status(conn, note_id, status):
+    conn.execute('UPDATE audio_notes SET live_status = ? WHERE id = ?', (status, note_id))
+
+
+def remove_segment_files(conn, note_id):
+    """Delete the segments' audio (once it has been joined into the note's recording)"""
+    for file_path in segment_files(conn, note_id):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def delete_segments(conn, note_id):
+    remove_segment_files(conn, note_id)
+    conn.execute('DELETE FROM live_segments WHERE note_id = ?', (note_id,))
@@ -0,0 +1,102 @@
+"""Persistent cache of Ollama responses.
+
+Entries are keyed on the SHA-256 of (model, prompt, options), so re-running
+the same enhancement or test prompt returns the stored text instead of
+spending minutes and API quota. Entries expire after LLM_CACHE_TTL_SECONDS;
+when the compressed total passes LLM_CACHE_MAX_MB the least recently used
+ones are evicted. Hit and miss counters live in the database so every
+gunicorn worker contributes to the same numbers.
+"""
+import hashlib
+import json
+import os
+import zlib
+
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+LLM_CACHE_MAX_MB = float(os.getenv('LLM_CACHE_MAX_MB', '64'))
+
+
+def cache_key(model, prompt, options):
+    material = json.dumps({'model': model, 'prompt': prompt, 'options': options or {}}, sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def _count(conn, column):
+    conn.execute(f'UPDATE llm_cache_stats SET {column} = {column} + 1 WHERE id = 1')
+
+
+def lookup(conn, key):
+    """Cached response text, or None (counted as a miss)"""
+    row = conn.execute('''
+        SELECT response FROM llm_cache WHERE key = ? AND expires_at > CURRENT_TIMESTAMP
+    ''', (key,)).fetchone()
+    if row is None:
+        _count(conn, 'misses')
+        conn.commit()
+        return None
+
+    conn.execute('''
+        UPDATE llm_cache SET hit_count = hit_count + 1, last_used_at = CURRENT_TIMESTAMP WHERE key = ?
+    ''', (key,))
+    _count(conn, 'hits')
+    conn.commit()
+    return zlib.decompress(row['response']).decode('utf-8')
+
+
+def store(conn, key, model, text):
+    blob = zlib.compress(text.encode('utf-8'))
+    conn.execute('''
+        INSERT INTO llm_cache (key, model, response, size_bytes, expires_at)
+        VALUES (?, ?, ?, ?, datetime('now', ?))
+        ON CONFLICT(key) DO UPDATE SET
+            response = excluded.response,
+            size_bytes = excluded.size_bytes,
+            created_at = CURRENT_TIMESTAMP,
+            last_used_at = CURRENT_TIMESTAMP,
+            expires_at = excluded.expires_at
+    ''', (key, model, blob, len(blob), f'+{LLM_CACHE_TTL_SECONDS} seconds'))
+    evict(conn)
+    conn.commit()
+
+
+def evict(conn, max_bytes=None):
+    """Drop expired entries, then least recently used ones until the cache fits"""
+    max_bytes = LLM_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    removed = conn.execute('DELETE FROM llm_cache WHERE expires_at <= CURRENT_TIMESTAMP').rowcount
+    removed += conn.execute('''
+        DELETE FROM llm_cache WHERE key IN (
+            SELECT key FROM (
+                SELECT key, SUM(size_bytes) OVER (ORDER BY last_used_at DESC, rowid DESC) AS running
+                FROM llm_cache
+            ) WHERE running > ?
+        )
+    ''', (max_bytes,)).rowcount
+    return removed
+
+
+def stats(conn):
+    counters = conn.execute('SELECT hits, misses FROM llm_cache_stats WHERE id = 1').fetchone()
+    entries = conn.execute('''
+        SELECT COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS total_bytes FROM llm_cache
+        WHERE expires_at > CURRENT_TIMESTAMP
+    ''').fetchone()
+    lookups = counters['hits'] + counters['misses']
+    return {
+        'enabled': LLM_CACHE_ENABLED,
+        'entries': entries['entries'],
+        'total_bytes': entries['total_bytes'],
+        'max_bytes': int(LLM_CACHE_MAX_MB * 1024 * 1024),
+        'ttl_seconds': LLM_CACHE_TTL_SECONDS,
+        'hits': counters['hits'],
+        'misses': counters['misses'],
+        'hit_rate': round(counters['hits'] / lookups, 3) if lookups else None,
+    }
+
+
+def clear(conn):
+    """Empty the cache and reset the counters"""
+    removed = conn.execute('DELETE FROM llm_cache').rowcount
+    conn.execute('UPDATE llm_cache_stats SET hits = 0, misses = 0 WHERE id = 1')
+    conn.commit()
+    return removed
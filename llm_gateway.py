@@ -0,0 +1,241 @@
+"""Every Ollama call goes through one gateway.
+
+The gateway bounds how many requests this process has in flight
+(LLM_MAX_CONCURRENCY; a caller that waits longer than LLM_QUEUE_TIMEOUT_SECONDS
+for a slot is turned away). It retries overload responses (429/5xx, timeouts,
+dropped connections) with exponential backoff and full jitter, without holding
+a slot while it sleeps. After LLM_BREAKER_THRESHOLD consecutive upstream
+failures a circuit breaker fails calls fast for LLM_BREAKER_RESET_SECONDS,
+then lets a single trial call through. Latency and token counts are recorded
+per call and served by metrics().
+
+Limits are per process: with several gunicorn workers the upstream sees at
+most workers x LLM_MAX_CONCURRENCY requests.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+from ollama import ResponseError
+
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '600'))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv('LLM_QUEUE_TIMEOUT_SECONDS', '120'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv('LLM_BACKOFF_BASE_SECONDS', '2'))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv('LLM_BACKOFF_MAX_SECONDS', '30'))
+LLM_BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', '5'))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv('LLM_BREAKER_RESET_SECONDS', '60'))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Calls kept for the latency percentiles
+LATENCY_WINDOW = 200
+
+
+class LLMUnavailable(Exception):
+    """The call was not attempted: the circuit is open or no slot became free in time"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error):
+    """Overload and transport errors are worth retrying; anything else (bad request, auth) is not"""
+    if isinstance(error, ResponseError):
+        return error.status_code in RETRYABLE_STATUS
+    if isinstance(error, (httpx.TimeoutException, httpx.TransportError)):
+        return True
+    message = str(error)
+    return '502' in message or 'upstream' in message or 'overloaded' in message
+
+
+def backoff_delay(attempt):
+    """Full jitter: uniform between 0 and the capped exponential delay for this attempt"""
+    return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=None, reset_seconds=None):
+        self.threshold = threshold or LLM_BREAKER_THRESHOLD
+        self.reset_seconds = LLM_BREAKER_RESET_SECONDS if reset_seconds is None else reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.reset_seconds else 'open'
+
+    def before_call(self):
+        """Raise LLMUnavailable while open; once the reset time has passed, admit one trial call"""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.reset_seconds - (time.monotonic() - self.opened_at)
+            if remaining > 0 or self.trial_running:
+                raise LLMUnavailable('Ollama Cloud is unavailable (circuit open)', retry_after=max(1, round(remaining)))
+            self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.trial_running = 0, None, False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def release_trial(self):
+        """A trial call ended without telling us anything about upstream (e.g. a client error)"""
+        with self.lock:
+            self.trial_running = False
+
+
+class LLMGateway:
+    def __init__(self, client, model, max_concurrency=None):
+        self.client = client
+        self.model = model
+        self.max_concurrency = max_concurrency or LLM_MAX_CONCURRENCY
+        self.slots = threading.BoundedSemaphore(self.max_concurrency)
+        self.breaker = CircuitBreaker()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.counters = {'calls': 0, 'succeeded': 0, 'failed': 0, 'retries': 0, 'rejected': 0,
+                         'prompt_tokens': 0, 'completion_tokens': 0}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.last_call = None
+
+    def _count(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                self.counters[name] += amount
+
+    def _acquire(self):
+        self.breaker.before_call()
+        if not self.slots.acquire(timeout=LLM_QUEUE_TIMEOUT_SECONDS):
+            self.breaker.release_trial()
+            raise LLMUnavailable(f'All {self.max_concurrency} LLM request slots are busy', retry_after=5)
+        with self.lock:
+            self.in_flight += 1
+
+    def _release(self):
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    def _record(self, started, response, error=None, streamed=False):
+        seconds = time.monotonic() - started
+        prompt_tokens = (response or {}).get('prompt_eval_count') or 0
+        completion_tokens = (response or {}).get('eval_count') or 0
+        with self.lock:
+            self.counters['calls'] += 1
+            self.counters['failed' if error else 'succeeded'] += 1
+            self.counters['prompt_tokens'] += prompt_tokens
+            self.counters['completion_tokens'] += completion_tokens
+            self.latencies.append(seconds)
+            self.last_call = {'seconds': round(seconds, 3), 'prompt_tokens': prompt_tokens,
+                              'completion_tokens': completion_tokens, 'streamed': streamed,
+                              'error': str(error) if error else None}
+        if error is None:
+            self.breaker.record_success()
+        elif is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release_trial()
+
+    def _should_retry(self, error, attempt):
+        if isinstance(error, LLMUnavailable) or not is_retryable(error) or attempt >= LLM_MAX_RETRIES:
+            return False
+        delay = backoff_delay(attempt)
+        print(f"LLM call failed ({error}); retry {attempt + 1} of {LLM_MAX_RETRIES} in {delay:.1f}s")
+        self._count(retries=1)
+        time.sleep(delay)
+        return True
+
+    def generate(self, prompt, options=None):
+        """Full response text for a prompt"""
+        attempt = 0
+        while True:
+            try:
+                self._acquire()
+            except LLMUnavailable:
+                self._count(rejected=1)
+                raise
+            started = time.monotonic()
+            try:
+                response = self.client.generate(model=self.model, prompt=prompt, options=options)
+            except Exception as e:
+                self._release()
+                self._record(started, None, e)
+                if self._should_retry(e, attempt):
+                    attempt += 1
+                    continue
+                raise
+            self._release()
+            self._record(started, response)
+            return response['response']
+
+    def stream(self, prompt, options=None):
+        """Yield response text pieces; only retried if nothing has been yielded yet"""
+        attempt = 0
+        while True:
+            try:
+                self._acquire()
+            except LLMUnavailable:
+                self._count(rejected=1)
+                raise
+            started = time.monotonic()
+            yielded, final = False, None
+            try:
+                for chunk in self.client.generate(model=self.model, prompt=prompt, options=options, stream=True):
+                    if chunk.get('done'):
+                        final = chunk
+                    if chunk.get('response'):
+                        yielded = True
+                        yield chunk['response']
+            except Exception as e:
+                self._release()
+                self._record(started, None, e, streamed=True)
+                if not yielded and self._should_retry(e, attempt):
+                    attempt += 1
+                    continue
+                raise
+            except GeneratorExit:
+                # The consumer went away (client disconnected); not an upstream failure
+                self._release()
+                self.breaker.release_trial()
+                raise
+            self._release()
+            self._record(started, final, streamed=True)
+            return
+
+    def metrics(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            counters = dict(self.counters)
+            in_flight, last_call = self.in_flight, self.last_call
+
+        def percentile(fraction):
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 3) if latencies else None
+
+        return {
+            'model': self.model,
+            'max_concurrency': self.max_concurrency,
+            'in_flight': in_flight,
+            'circuit': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            **counters,
+            'latency_seconds': {'p50': percentile(0.5), 'p95': percentile(0.95),
+                                'max': round(latencies[-1], 3) if latencies else None,
+                                'window': len(latencies)},
+            'last_call': last_call,
+        }
@@ -0,0 +1,139 @@
+"""Content-addressed cache of extracted study material text.
+
+Uploads are keyed by the SHA-256 of their bytes plus EXTRACTOR_VERSION, so a
+lecture deck uploaded again (under any name) skips parsing entirely. A page
+selection is part of the key ("<sha256>:4-6"). Each entry stores the
+extracted units and their page numbers as zlib-compressed JSON.
+When the stored size passes MATERIAL_CACHE_MAX_MB the least recently used
+entries are evicted.
+"""
+import hashlib
+import json
+import os
+import zlib
+
+from extraction import EXTRACTOR_VERSION, UNIT_SEPARATOR, extract_files, format_page_selection, range_counts
+
+MATERIAL_CACHE_ENABLED = os.getenv('MATERIAL_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+MATERIAL_CACHE_MAX_MB = float(os.getenv('MATERIAL_CACHE_MAX_MB', '256'))
+
+LISTED_COLUMNS = '''sha256, extractor_version, filename, unit_type, characters, size_bytes,
+                    hit_count, created_at, last_used_at'''
+
+
+def content_hash(data, ranges=None):
+    digest = hashlib.sha256(data).hexdigest()
+    return f'{digest}:{format_page_selection(ranges)}' if ranges else digest
+
+
+def _lookup(conn, digest):
+    row = conn.execute('''
+        SELECT unit_type, units FROM material_cache WHERE sha256 = ? AND extractor_version = ?
+    ''', (digest, EXTRACTOR_VERSION)).fetchone()
+    if row is None:
+        return None
+    conn.execute('''
+        UPDATE material_cache SET hit_count = hit_count + 1, last_used_at = CURRENT_TIMESTAMP
+        WHERE sha256 = ? AND extractor_version = ?
+    ''', (digest, EXTRACTOR_VERSION))
+    stored = json.loads(zlib.decompress(row['units']))
+    return row['unit_type'], stored['numbers'], stored['units']
+
+
+def _store(conn, digest, material):
+    stored = {'numbers': material['unit_numbers'], 'units': material['units']}
+    blob = zlib.compress(json.dumps(stored).encode('utf-8'))
+    conn.execute('''
+        INSERT INTO material_cache (sha256, extractor_version, filename, unit_type, units, characters, size_bytes)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(sha256, extractor_version) DO UPDATE SET last_used_at = CURRENT_TIMESTAMP
+    ''', (digest, EXTRACTOR_VERSION, material['filename'], material['unit_type'], blob,
+          len(material['content']), len(blob)))
+
+
+def evict_lru(conn, max_bytes=None):
+    """Delete least recently used entries until the cache fits; returns how many were removed"""
+    max_bytes = MATERIAL_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    # Entries from older extractors can never be hit again
+    removed = conn.execute('DELETE FROM material_cache WHERE extractor_version != ?', (EXTRACTOR_VERSION,)).rowcount
+    # Running total from the most recently used entry; everything past the limit goes
+    cursor = conn.execute('''
+        DELETE FROM material_cache WHERE rowid IN (
+            SELECT rowid FROM (
+                SELECT rowid, SUM(size_bytes) OVER (ORDER BY last_used_at DESC, rowid DESC) AS running
+                FROM material_cache
+            ) WHERE running > ?
+        )
+    ''', (max_bytes,))
+    return removed + cursor.rowcount
+
+
+def extract_with_cache(conn, files):
+    """extract_files() for (filename, bytes, page ranges) entries, served from the cache where possible.
+
+    Cached files report status 'cached' in their timings; freshly extracted
+    ones that parsed cleanly are added to the cache.
+    """
+    files = list(files)
+    if not MATERIAL_CACHE_ENABLED:
+        return extract_files(files)
+
+    digests = [content_hash(data, ranges) for _, data, ranges in files]
+    cached = {}
+    for digest in set(digests):
+        hit = _lookup(conn, digest)
+        if hit is not None:
+            cached[digest] = hit
+    conn.commit()
+
+    misses = [entry for entry, digest in zip(files, digests) if digest not in cached]
+    extracted, extracted_timings = extract_files(misses)
+    fresh = iter(zip(extracted, extracted_timings))
+
+    materials, timings, stored = [], [], False
+    for (filename, _, ranges), digest in zip(files, digests):
+        if digest in cached:
+            unit_type, numbers, units = cached[digest]
+            content = UNIT_SEPARATOR.join(units)
+            materials.append({'filename': filename, 'content': content, 'unit_type': unit_type,
+                              'unit_numbers': numbers, 'units': units})
+            timings.append({'filename': filename, 'seconds': 0.0, 'finished_after': 0.0,
+                            'characters': len(content), 'units': len(units),
+                            'ranges': range_counts(ranges, numbers, units) if unit_type != 'document' else None,
+                            'status': 'cached'})
+            print(f"Using cached text for {filename} ({len(content)} characters)")
+            continue
+
+        material, timing = next(fresh)
+        materials.append(material)
+        timings.append(timing)
+        if timing['status'] == 'ok':
+            _store(conn, digest, material)
+            stored = True
+
+    if stored:
+        evict_lru(conn)
+        conn.commit()
+    return materials, timings
+
+
+def list_materials(conn):
+    rows = conn.execute(f'SELECT {LISTED_COLUMNS} FROM material_cache ORDER BY last_used_at DESC, rowid DESC')
+    materials = [dict(row) for row in rows]
+    return {
+        'materials': materials,
+        'total_bytes': sum(material['size_bytes'] for material in materials),
+        'max_bytes': int(MATERIAL_CACHE_MAX_MB * 1024 * 1024),
+        'extractor_version': EXTRACTOR_VERSION,
+    }
+
+
+def evict_material(conn, digest=None):
+    """Remove one material (every extractor version and page selection) or, without a digest, the whole cache"""
+    if digest is None:
+        cursor = conn.execute('DELETE FROM material_cache')
+    else:
+        cursor = conn.execute("DELETE FROM material_cache WHERE sha256 = ? OR sha256 LIKE ? || ':%'",
+                              (digest, digest))
+    conn.commit()
+    return cursor.rowcount
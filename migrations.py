@@ -0,0 +1,377 @@
+"""Versioned schema migrations.
+
+init_database() creates the base tables; everything after that is an ordered
+migration recorded in schema_migrations. Each migration runs inside its own
+BEGIN IMMEDIATE transaction, so concurrent gunicorn workers starting at the
+same time apply it exactly once. Steps must be idempotent.
+"""
+from analytics import rebuild_test_stats
+from live_notes import backfill_transcript_segments
+from questions import backfill_questions
+
+
+def _add_column(table, column, declaration):
+    """ALTER TABLE ADD COLUMN step that is skipped if the column already exists"""
+    def step(conn):
+        existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+        if column not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+    return step
+
+
+def _dedupe_test_answers(conn):
+    """Keep only the latest answer per (attempt, question) before enforcing uniqueness"""
+    conn.execute('''
+        DELETE FROM test_answers
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM test_answers
+            GROUP BY attempt_id, question_number
+        )
+    ''')
+
+
+# Tables whose rows carry updated_at/row_version and leave tombstones when deleted (see sync.py)
+CHANGE_TRACKED_TABLES = {
+    # table: expression to backfill updated_at from
+    'assignments': 'created_at',
+    'clinical_shifts': 'created_at',
+    'requirements': 'created_at',
+    'goals': 'created_at',
+    'grades': 'created_at',
+    'settings': 'updated_at',
+    'flashcards': 'created_at',
+    'stress_logs': 'created_at',
+    'weekly_activities': 'created_at',
+    'saved_tests': 'created_at',
+    'test_attempts': 'COALESCE(completed_at, started_at)',
+    'audio_notes': 'created_at',
+}
+
+
+def _change_tracking_steps():
+    steps = [
+        '''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+        ''',
+        'INSERT OR IGNORE INTO sync_state (id, version) VALUES (1, 1)',
+        '''
+        CREATE TABLE IF NOT EXISTS sync_tombstones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_sync_tombstones_version ON sync_tombstones(version)',
+    ]
+
+    # Every insert/update bumps the global version and stamps the row with it;
+    # deletes leave a tombstone. The WHEN guard keeps the stamping UPDATE from
+    # re-triggering the update trigger.
+    stamp = '''
+            UPDATE sync_state SET version = version + 1 WHERE id = 1;
+            UPDATE {table} SET row_version = (SELECT version FROM sync_state WHERE id = 1),
+                               updated_at = CURRENT_TIMESTAMP
+            WHERE id = NEW.id;
+    '''
+    for table, backfill in CHANGE_TRACKED_TABLES.items():
+        steps += [
+            _add_column(table, 'updated_at', 'TIMESTAMP'),
+            _add_column(table, 'row_version', 'INTEGER'),
+            f'UPDATE {table} SET updated_at = COALESCE(updated_at, {backfill}, CURRENT_TIMESTAMP), row_version = 1',
+            f'CREATE INDEX IF NOT EXISTS idx_{table}_row_version ON {table}(row_version)',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_sync_insert AFTER INSERT ON {table}
+            BEGIN {stamp.format(table=table)} END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_sync_update AFTER UPDATE ON {table}
+            WHEN NEW.row_version IS OLD.row_version
+            BEGIN {stamp.format(table=table)} END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_sync_delete AFTER DELETE ON {table}
+            BEGIN
+                UPDATE sync_state SET version = version + 1 WHERE id = 1;
+                INSERT INTO sync_tombstones (table_name, row_id, version)
+                VALUES ('{table}', OLD.id, (SELECT version FROM sync_state WHERE id = 1));
+            END
+            ''',
+        ]
+    return steps
+
+
+# Tables with a per-table change counter in table_versions (see etag.py)
+VERSIONED_TABLES = (*CHANGE_TRACKED_TABLES, 'test_answers', 'test_stats', 'test_question_stats')
+
+
+def _table_version_steps():
+    steps = [
+        '''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+    ]
+    for table in VERSIONED_TABLES:
+        bump = f"UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';"
+        steps.append(f"INSERT OR IGNORE INTO table_versions (table_name, version) VALUES ('{table}', 1)")
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            steps.append(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()} AFTER {event} ON {table}
+                BEGIN {bump} END
+            ''')
+    return steps
+
+
+MIGRATIONS = [
+    (1, 'unique test answer per attempt question', [
+        _dedupe_test_answers,
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_test_answers_attempt_question ON test_answers(attempt_id, question_number)',
+    ]),
+    (2, 'indexes for listing and analytics queries', [
+        'CREATE INDEX IF NOT EXISTS idx_test_attempts_test_completed ON test_attempts(test_id, completed)',
+        'CREATE INDEX IF NOT EXISTS idx_assignments_due_date ON assignments(due_date)',
+        'CREATE INDEX IF NOT EXISTS idx_grades_date ON grades(date)',
+        # stress_logs(date) is already covered by its UNIQUE constraint's autoindex
+        'CREATE INDEX IF NOT EXISTS idx_audio_notes_created_at ON audio_notes(created_at)',
+    ]),
+    (3, 'indexes for keyset pagination', [
+        'CREATE INDEX IF NOT EXISTS idx_flashcards_created_at ON flashcards(created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_saved_tests_created_at ON saved_tests(created_at)',
+    ]),
+    (4, 'test statistics rollups', [
+        '''
+        CREATE TABLE IF NOT EXISTS test_stats (
+            test_id INTEGER PRIMARY KEY,
+            attempt_count INTEGER NOT NULL DEFAULT 0,
+            score_sum REAL NOT NULL DEFAULT 0,
+            best_score REAL,
+            latest_score REAL,
+            latest_completed_at TIMESTAMP,
+            FOREIGN KEY (test_id) REFERENCES saved_tests(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS test_question_stats (
+            test_id INTEGER NOT NULL,
+            question_number INTEGER NOT NULL,
+            correct_count INTEGER NOT NULL DEFAULT 0,
+            total_attempts INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (test_id, question_number),
+            FOREIGN KEY (test_id) REFERENCES saved_tests(id)
+        )
+        ''',
+        rebuild_test_stats,
+    ]),
+    (5, 'row change tracking for delta sync', _change_tracking_steps()),
+    (6, 'per-table version counters for ETags', _table_version_steps()),
+    (7, 'background job queue', [
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            payload TEXT,
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            heartbeat_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_jobs_status_kind ON jobs(status, kind)',
+    ]),
+    (8, 'extracted study material cache', [
+        '''
+        CREATE TABLE IF NOT EXISTS material_cache (
+            sha256 TEXT NOT NULL,
+            extractor_version INTEGER NOT NULL,
+            filename TEXT,
+            unit_type TEXT NOT NULL,
+            units BLOB NOT NULL,
+            characters INTEGER NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            hit_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (sha256, extractor_version)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_material_cache_last_used ON material_cache(last_used_at)',
+    ]),
+    (9, 'LLM response cache', [
+        '''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            response BLOB NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            hit_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used_at)',
+        '''
+        CREATE TABLE IF NOT EXISTS llm_cache_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        'INSERT OR IGNORE INTO llm_cache_stats (id) VALUES (1)',
+    ]),
+    (10, 'structured questions for saved tests', [
+        '''
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_id INTEGER NOT NULL,
+            number INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            stem TEXT NOT NULL,
+            options TEXT NOT NULL DEFAULT '[]',
+            answer TEXT,
+            explanation TEXT,
+            FOREIGN KEY (test_id) REFERENCES saved_tests(id)
+        )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_test_number ON questions(test_id, number)',
+        backfill_questions,
+    ]),
+    (11, 'job queues', [
+        _add_column('jobs', 'queue', "TEXT NOT NULL DEFAULT 'default'"),
+        'CREATE INDEX IF NOT EXISTS idx_jobs_queue_status ON jobs(queue, status)',
+    ]),
+    (12, 'partial transcription results', [
+        '''
+        CREATE TABLE IF NOT EXISTS transcription_chunks (
+            job_id INTEGER NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            start_seconds REAL NOT NULL,
+            end_seconds REAL NOT NULL,
+            segments TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job_id, chunk_index),
+            FOREIGN KEY (job_id) REFERENCES jobs(id)
+        )
+        ''',
+    ]),
+    (13, 'live transcription of recordings in progress', [
+        _add_column('audio_notes', 'live_status', 'TEXT'),
+        '''
+        CREATE TABLE IF NOT EXISTS live_segments (
+            note_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            start_seconds REAL NOT NULL,
+            duration_seconds REAL,
+            file_path TEXT NOT NULL,
+            job_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'queued',
+            segments TEXT,
+            text TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            transcribed_at TIMESTAMP,
+            PRIMARY KEY (note_id, seq),
+            FOREIGN KEY (note_id) REFERENCES audio_notes(id)
+        )
+        ''',
+    ]),
+    (14, 'transcription engine readiness and options', [
+        '''
+        CREATE TABLE IF NOT EXISTS transcription_workers (
+            worker TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            config TEXT,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ready_at TIMESTAMP,
+            heartbeat_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        _add_column('audio_notes', 'live_options', 'TEXT'),
+    ]),
+    (15, 'timestamped transcript segments', [
+        '''
+        CREATE TABLE IF NOT EXISTS transcript_segments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            note_id INTEGER NOT NULL,
+            t0 INTEGER NOT NULL,
+            t1 INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            char_start INTEGER NOT NULL,
+            char_end INTEGER NOT NULL,
+            FOREIGN KEY (note_id) REFERENCES audio_notes(id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_transcript_segments_note_time ON transcript_segments(note_id, t0)',
+        'CREATE INDEX IF NOT EXISTS idx_transcript_segments_note_offset ON transcript_segments(note_id, char_start)',
+        backfill_transcript_segments,
+    ]),
+    (16, 'question types the frontend knows', [
+        # Earlier parses typed questions without options as 'short-answer', which the SPA never handled
+        "UPDATE questions SET type = 'multiple-choice' WHERE type = 'short-answer'",
+    ]),
+    (17, 'live recordings on their own queue', [
+        # Live jobs queued before the worker served a separate 'live' queue
+        """UPDATE jobs SET queue = 'live'
+           WHERE queue = 'transcription' AND status = 'queued'
+             AND kind IN ('transcribe_live_segment', 'finish_live_note')""",
+    ]),
+    (18, 'audio notes remember the job that transcribed them', [
+        # A transcription job requeued after storing its note finds that note instead of adding another
+        _add_column('audio_notes', 'job_id', 'INTEGER'),
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_audio_notes_job ON audio_notes(job_id)',
+    ]),
+]
+
+
+def get_schema_version(conn):
+    row = conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn):
+    """Apply every migration newer than the database's schema version"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    for version, name, steps in MIGRATIONS:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Re-check under the write lock in case another worker got here first
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+
+            print(f"Applying migration {version}: {name}")
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+
+            conn.execute('INSERT INTO schema_migrations (version, name) VALUES (?, ?)', (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return get_schema_version(conn)
@@ -0,0 +1,112 @@
+"""The shared Ollama client and the text helpers every process uses.
+
+The web app and the transcription worker both call Ollama through one
+LLMGateway per process (concurrency limit, retries, circuit breaker), with
+responses cached in the LLM cache. Nothing here needs Flask.
+"""
+import os
+
+from ollama import Client
+
+import llm_cache
+from db import connection
+from llm_gateway import LLM_TIMEOUT_SECONDS, LLMGateway
+
+# Ollama Configuration
+OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'https://ollama.com')
+OLLAMA_API_KEY = os.getenv('OLLAMA_API_KEY', '1728cbe73f944db7afa1a3c8f52d2f41.GzEVZ8ADdcDHwIxdbvKnqbXy')
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'gpt-oss:120b-cloud')  # Cloud model
+
+# Initialize Ollama client; every call goes through the gateway (concurrency limit, retries, circuit breaker)
+ollama_client = Client(
+    host=OLLAMA_HOST,
+    headers={'Authorization': f'Bearer {OLLAMA_API_KEY}'},
+    timeout=LLM_TIMEOUT_SECONDS
+)
+llm = LLMGateway(ollama_client, OLLAMA_MODEL)
+
+ENHANCE_OPTIONS = {
+    'num_predict': 8000,
+    'temperature': 0.7
+}
+
+
+def _cached_response(key, use_cache):
+    if not (llm_cache.LLM_CACHE_ENABLED and use_cache):
+        return None
+    with connection() as conn:
+        return llm_cache.lookup(conn, key)
+
+
+def _cache_response(key, text):
+    if llm_cache.LLM_CACHE_ENABLED and text:
+        with connection() as conn:
+            llm_cache.store(conn, key, OLLAMA_MODEL, text)
+
+
+def generate_text(prompt, options, use_cache=True):
+    """Ollama response text for a prompt, from the LLM cache when possible.
+
+    use_cache=False skips the lookup but still refreshes the cached entry.
+    """
+    key = llm_cache.cache_key(OLLAMA_MODEL, prompt, options)
+    cached = _cached_response(key, use_cache)
+    if cached is not None:
+        print(f"✓ LLM cache hit: {len(cached)} characters")
+        return cached
+
+    text = llm.generate(prompt, options)
+    _cache_response(key, text)
+    return text
+
+
+def stream_ollama(prompt, options, use_cache=True):
+    """Yield response text pieces as Ollama generates them (a cached response comes as one piece)"""
+    key = llm_cache.cache_key(OLLAMA_MODEL, prompt, options)
+    cached = _cached_response(key, use_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    pieces = []
+    for text in llm.stream(prompt, options):
+        pieces.append(text)
+        yield text
+    # Only reached when the stream completed, so partial responses are never cached
+    _cache_response(key, ''.join(pieces))
+
+
+def build_enhance_prompt(transcript, course=''):
+    """Prompt asking Ollama to clean up and format a transcript"""
+    course_context = f" from the {course} lecture" if course else ""
+
+    return f"""You are a helpful transcript editor. Clean up and format this audio transcript{course_context} to make it easy to read.
+
+RAW TRANSCRIPT:
+{transcript}
+
+Your task:
+1. Remove timestamps and technical markers (t0=, t1=, etc.)
+2. Fix spelling errors and grammar mistakes
+3. Add proper punctuation and capitalization
+4. Break into clear paragraphs based on topic changes (use double line breaks between paragraphs)
+5. Use markdown formatting for better readability:
+   - Use **bold** for important terms and key concepts
+   - Use ## headings for major sections
+   - Use - bullet points for lists
+   - Use `code` formatting for technical terms, commands, or code
+   - Use ```code blocks``` for multi-line code examples
+6. Keep the original meaning and content intact
+7. Make it look professional and well-organized
+
+Return ONLY the cleaned, formatted transcript with markdown. No extra commentary or meta-text."""
+
+
+def enhance_transcript_with_ai(transcript, course='', use_cache=True):
+    """Use Ollama to clean up and format transcript into readable notes"""
+    try:
+        return generate_text(build_enhance_prompt(transcript, course), ENHANCE_OPTIONS, use_cache)
+
+    except Exception as e:
+        print(f"Error enhancing transcript: {str(e)}")
+        return None
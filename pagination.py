@@ -0,0 +1,170 @@
+"""Keyset (cursor) pagination, filters and projections for the list endpoints.
+
+A list endpoint describes its ORDER BY column and the filters it accepts;
+keyset_page() then builds the WHERE clause, seeks past the cursor and fetches
+one page. Without ?limit= or ?after= the endpoint behaves as before and
+returns every matching row, so existing clients keep working.
+"""
+import base64
+import json
+import os
+
+DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '500'))
+
+
+class PaginationError(ValueError):
+    """Raised for a malformed limit, cursor, filter or field list (reported as HTTP 400)"""
+
+
+def encode_cursor(sort_value, row_id):
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+
+def parse_bool(value):
+    lowered = value.lower()
+    if lowered in ('1', 'true', 'yes'):
+        return 1
+    if lowered in ('0', 'false', 'no'):
+        return 0
+    raise PaginationError(f'Invalid boolean: {value}')
+
+
+def date_filters(column, timestamp=False):
+    """?from=/?to= filters on a date column. For timestamp columns ?to= includes the whole day."""
+    upper = f"{column} < date(?, '+1 day')" if timestamp else f'{column} <= ?'
+    return {
+        'from': (f'{column} >= ?', str),
+        'to': (upper, str),
+    }
+
+
+def build_filters(args, spec):
+    """Turn the query-string parameters named in spec into SQL conditions.
+
+    spec maps a parameter name to (sql condition with one ?, converter).
+    """
+    clauses, params = [], []
+    for name, (condition, convert) in (spec or {}).items():
+        value = args.get(name)
+        if value is None or value == '':
+            continue
+        clauses.append(condition)
+        params.append(convert(value))
+    return clauses, params
+
+
+def _seek_condition(order_col, id_col, descending, sort_value, row_id):
+    """Rows strictly after (sort_value, row_id) in ORDER BY order_col, id_col.
+
+    SQLite sorts NULLs first ascending and last descending, so a NULL sort value
+    needs its own branch.
+    """
+    op = '<' if descending else '>'
+    if sort_value is None:
+        if descending:
+            return f'({order_col} IS NULL AND {id_col} {op} ?)', [row_id]
+        return f'(({order_col} IS NULL AND {id_col} {op} ?) OR {order_col} IS NOT NULL)', [row_id]
+
+    condition = f'({order_col} {op} ? OR ({order_col} = ? AND {id_col} {op} ?)'
+    if descending:
+        condition += f' OR {order_col} IS NULL'
+    return condition + ')', [sort_value, sort_value, row_id]
+
+
+def projection(args, available, summary, required=('id',)):
+    """SELECT list for ?view=summary or ?fields=a,b,c.
+
+    available maps each selectable field name to its SQL expression, summary
+    lists the fields returned by view=summary. Returns None when the request
+    asked for neither, so the caller keeps its full SELECT.
+    """
+    if args.get('fields'):
+        names = [name.strip() for name in args['fields'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise PaginationError(f"Unknown field(s): {', '.join(unknown)}")
+    elif args.get('view') == 'summary':
+        names = list(summary)
+    elif args.get('view') not in (None, '', 'full'):
+        raise PaginationError(f"Unknown view: {args['view']}")
+    else:
+        return None
+
+    # Keyset cursors need the id and sort columns even if not asked for
+    for name in required:
+        if name not in names:
+            names.insert(0, name)
+
+    columns = []
+    for name in dict.fromkeys(names):
+        expr = available[name]
+        columns.append(name if expr == name else f'{expr} AS {name}')
+    return ', '.join(columns)
+
+
+def is_paginated(args):
+    return 'limit' in args or 'after' in args
+
+
+def keyset_page(conn, select_sql, order_col, args, descending=False, filters=None,
+                id_col='id', group_by=''):
+    """Run select_sql with filters and keyset pagination from the request args.
+
+    Returns (rows, next_cursor). next_cursor is None on the last page or when
+    the request did not ask for pagination.
+    """
+    clauses, params = build_filters(args, filters)
+
+    paginated = is_paginated(args)
+    limit = None
+    if paginated:
+        try:
+            limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise PaginationError('limit must be an integer')
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        after = args.get('after')
+        if after:
+            condition, seek_params = _seek_condition(order_col, id_col, descending, *decode_cursor(after))
+            clauses.append(condition)
+            params.extend(seek_params)
+
+    direction = 'DESC' if descending else 'ASC'
+    sql = select_sql
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    if group_by:
+        sql += ' ' + group_by
+    sql += f' ORDER BY {order_col} {direction}, {id_col} {direction}'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[order_col.split('.')[-1]], last[id_col.split('.')[-1]])
+    return rows, next_cursor
+
+
+def page_response(rows, next_cursor, args):
+    """Legacy list when unpaginated, otherwise {'items': [...], 'next_cursor': ...}"""
+    items = [dict(row) for row in rows]
+    if not is_paginated(args):
+        return items
+    return {'items': items, 'next_cursor': next_cursor}
@@ -0,0 +1,173 @@
+"""Saved tests as structured questions, and server-side grading.
+
+A test is parsed once when it is saved: every numbered question becomes a row
+in `questions` with its type, stem, options, answer and explanation. The
+parser follows the rules the frontend has always used (numbered stems, A-F
+option lines, "(T/F)" markers, answers read from the solution sheet), so the
+questions and their answers match what the client used to compute.
+
+Attempts are graded against those rows inside SQLite: each submitted answer
+is stored together with the correct answer and whether it matched, in one
+executemany() per request.
+"""
+import json
+import re
+from collections import Counter
+
+QUESTION_PATTERN = re.compile(r'^(\d+)[.)]\s+(.+)')
+OPTION_PATTERN = re.compile(r'^[-\s]*([A-F])[).]?\s+(.+)')
+SOLUTION_NUMBER_PATTERN = re.compile(r'^(\d+)[.)]\s*(.*)')
+# Tried in order on a solution line with markdown emphasis removed
+ANSWER_PATTERNS = [
+    re.compile(r'^(\d+)[.)]\s*(?:Answer:\s*)?\s*([A-F])\b', re.IGNORECASE),
+    re.compile(r'^(\d+)[.)]\s*(?:Correct\s*)?(?:Answer|Choice):\s*([A-F])\b', re.IGNORECASE),
+    re.compile(r'^(\d+)[.)]\s*([A-F])[.)\s\-–]', re.IGNORECASE),
+    re.compile(r'^(\d+)[.)]\s*(?:Answer:\s*)?(True|False|T|F)\b', re.IGNORECASE),
+]
+TRUE_FALSE_OPTIONS = [{'letter': 'T', 'text': 'True'}, {'letter': 'F', 'text': 'False'}]
+
+QUESTION_COLUMNS = 'number, type, stem, options'
+ANSWER_COLUMNS = 'answer, explanation'
+
+
+def _parse_answer(line):
+    for pattern in ANSWER_PATTERNS:
+        match = pattern.match(line)
+        if match:
+            answer = match.group(2).upper()
+            return int(match.group(1)), 'T' if answer.startswith('T') else 'F' if answer.startswith('F') else answer
+    return None
+
+
+def parse_test(test_text, solutions_text):
+    """[{'number', 'type', 'stem', 'options', 'answer', 'explanation'}] in test order.
+
+    Numbers are unique: a test whose numbering repeats is renumbered from 1.
+    """
+    questions = []
+    current = None
+    for line in (test_text or '').splitlines():
+        line = line.strip()
+        match = QUESTION_PATTERN.match(line)
+        if match:
+            current = {'number': int(match.group(1)), 'type': 'multiple-choice', 'stem': match.group(2),
+                       'options': [], 'answer': None, 'explanation': None}
+            questions.append(current)
+            if '(T/F)' in line:
+                current['type'], current['options'] = 'true-false', list(TRUE_FALSE_OPTIONS)
+        elif current and OPTION_PATTERN.match(line):
+            match = OPTION_PATTERN.match(line)
+            current['options'].append({'letter': match.group(1), 'text': match.group(2)})
+        elif current and '(T/F)' in line:
+            current['type'], current['options'] = 'true-false', list(TRUE_FALSE_OPTIONS)
+
+    # Every answer and explanation per number, in sheet order
+    answers, explanations, number = {}, {}, None
+    for line in (solutions_text or '').splitlines():
+        clean = re.sub(r'[*_~]', '', line).strip()
+        parsed = _parse_answer(clean)
+        if parsed:
+            answers.setdefault(parsed[0], []).append(parsed[1])
+        match = SOLUTION_NUMBER_PATTERN.match(clean)
+        if match:
+            number = int(match.group(1))
+            explanations.setdefault(number, []).append([match.group(2)])
+        elif number is not None and clean and not clean.startswith('#'):
+            explanations[number][-1].append(clean)
+
+    # A number used once takes the sheet's last entry for it, as before. When
+    # the numbering restarts (a test in parts), the n-th question numbered 3
+    # takes the n-th answer numbered 3.
+    counts = Counter(question['number'] for question in questions)
+    seen = Counter()
+    for question in questions:
+        number = question['number']
+        index = seen[number] if counts[number] > 1 else -1
+        seen[number] += 1
+        question['answer'] = _nth(answers.get(number), index)
+        text = '\n'.join(_nth(explanations.get(number), index) or []).strip()
+        question['explanation'] = text or None
+
+    if len(counts) < len(questions):
+        for number, question in enumerate(questions, 1):
+            question['number'] = number
+    return questions
+
+
+def _nth(entries, index):
+    if not entries or index >= len(entries):
+        return None
+    return entries[index]
+
+
+def store_questions(conn, test_id, test_text, solutions_text):
+    """Replace a test's questions with a fresh parse; returns how many rows were stored"""
+    questions = parse_test(test_text, solutions_text)
+    conn.execute('DELETE FROM questions WHERE test_id = ?', (test_id,))
+    cursor = conn.executemany('''
+        INSERT INTO questions (test_id, number, type, stem, options, answer, explanation)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(test_id, q['number'], q['type'], q['stem'], json.dumps(q['options']), q['answer'], q['explanation'])
+          for q in questions])
+    return cursor.rowcount
+
+
+def backfill_questions(conn):
+    """Parse every saved test that has no questions yet"""
+    tests = conn.execute('''
+        SELECT id, test_content, solutions_content FROM saved_tests
+        WHERE id NOT IN (SELECT DISTINCT test_id FROM questions)
+    ''').fetchall()
+    for test in tests:
+        store_questions(conn, test['id'], test['test_content'], test['solutions_content'])
+
+
+def question_to_dict(row):
+    question = dict(row)
+    question['options'] = json.loads(question['options'])
+    return question
+
+
+def get_questions(conn, test_id, start=None, end=None, with_answers=False):
+    """Questions numbered start..end (inclusive, both optional) in order"""
+    columns = QUESTION_COLUMNS + (', ' + ANSWER_COLUMNS if with_answers else '')
+    rows = conn.execute(f'''
+        SELECT {columns} FROM questions
+        WHERE test_id = ? AND number >= COALESCE(?, number) AND number <= COALESCE(?, number)
+        ORDER BY number
+    ''', (test_id, start, end)).fetchall()
+    return [question_to_dict(row) for row in rows]
+
+
+def count_questions(conn, test_id):
+    return conn.execute('SELECT COUNT(*) FROM questions WHERE test_id = ?', (test_id,)).fetchone()[0]
+
+
+def grade_answers(conn, attempt_id, answers):
+    """Store [(question number, user answer)] for an attempt, graded against its test's questions.
+
+    Answers to questions the parser found are compared with the stored answer;
+    any other question number is kept ungraded. Returns the number stored.
+    """
+    conn.executemany('''
+        INSERT OR REPLACE INTO test_answers (attempt_id, question_number, user_answer, correct_answer, is_correct)
+        SELECT a.id, :number, :answer, q.answer,
+               CASE WHEN q.answer IS NULL THEN NULL ELSE COALESCE(:answer = q.answer, 0) END
+        FROM test_attempts a
+        LEFT JOIN questions q ON q.test_id = a.test_id AND q.number = :number
+        WHERE a.id = :attempt_id
+    ''', [{'attempt_id': attempt_id, 'number': number, 'answer': answer} for number, answer in answers])
+    return len(answers)
+
+
+def attempt_question_count(conn, attempt_id):
+    """Parsed questions in the attempt's test; 0 means it has to be graded by the client as before"""
+    return conn.execute('''
+        SELECT COUNT(*) FROM questions q JOIN test_attempts a ON a.test_id = q.test_id WHERE a.id = ?
+    ''', (attempt_id,)).fetchone()[0]
+
+
+def attempt_score(conn, attempt_id):
+    return conn.execute('''
+        SELECT COUNT(*) FROM test_answers WHERE attempt_id = ? AND is_correct = 1
+    ''', (attempt_id,)).fetchone()[0]
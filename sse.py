@@ -0,0 +1,27 @@
+"""Server-Sent Events helpers for the streaming endpoints.
+
+Each event carries one line of JSON. Streams are sent unbuffered (no proxy
+buffering, no caching) so tokens reach the browser as soon as Ollama emits
+them.
+"""
+import json
+
+from flask import Response
+
+
+def sse_event(event, data, event_id=None):
+    """One event; with an id, a reconnecting EventSource sends it back as Last-Event-ID"""
+    prefix = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{prefix}event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def sse_retry(milliseconds):
+    """Tell EventSource how long to wait before reconnecting once the stream ends"""
+    return f'retry: {int(milliseconds)}\n\n'
+
+
+def sse_response(events):
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
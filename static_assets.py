@@ -0,0 +1,86 @@
+"""In-memory, precompressed serving of the frontend document.
+
+The ~320 KB single-page app is read once (and again only when its mtime
+changes), compressed ahead of time with gzip and, when the brotli package is
+installed, brotli. Each request then just negotiates Accept-Encoding and
+answers If-None-Match, without touching the disk.
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+# How often to stat() the file for changes; the document is tiny to stat but hot to serve
+STATIC_RECHECK_SECONDS = float(os.getenv('STATIC_RECHECK_SECONDS', '2'))
+
+
+class CachedAsset:
+    """A file held in memory with identity, gzip and brotli variants"""
+
+    def __init__(self, path, mimetype, cache_control='no-cache'):
+        self.path = path
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked_at = 0
+        self._variants = {}
+        self._etag = None
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        variants = {'identity': data, 'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(data, quality=11)
+
+        self._variants = variants
+        self._etag = hashlib.sha1(data).hexdigest()
+        print(f"Loaded {os.path.basename(self.path)}: " +
+              ', '.join(f'{name} {len(body) // 1024} KB' for name, body in variants.items()))
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._stamp is not None and now - self._checked_at < STATIC_RECHECK_SECONDS:
+            return
+        with self._lock:
+            stat = os.stat(self.path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if stamp != self._stamp:
+                self._load()
+                self._stamp = stamp
+            self._checked_at = now
+
+    def _negotiate(self):
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in self._variants and accepted[encoding]:
+                return encoding
+        return 'identity'
+
+    def response(self):
+        self._refresh()
+        encoding = self._negotiate()
+        # Each encoding is a different representation, so it gets its own strong tag
+        etag = self._etag if encoding == 'identity' else f'{self._etag}-{encoding}'
+
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(self._variants[encoding], mimetype=self.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = self.cache_control
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,39 @@
+"""Shared fixtures: every test runs against its own freshly migrated database.
+
+DATABASE_PATH and the pool mode are read when db is imported, so they are set
+before the app is imported; each test then points db at a new file under
+tmp_path and runs init_database() on it.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='nursing_tests_'), 'nursing_app.db')
+# No pooling, so no connection outlives the database it was opened on
+os.environ['SQLITE_POOL_MODE'] = 'none'
+
+import app as nursing_app  # noqa: E402
+import db  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = str(tmp_path / 'nursing_app.db')
+    monkeypatch.setattr(db, 'DATABASE', path)
+    nursing_app.init_database()
+    return path
+
+
+@pytest.fixture
+def conn(database):
+    connection = db.open_connection(database)
+    yield connection
+    connection.discard()
+
+
+@pytest.fixture
+def client(database):
+    return nursing_app.app.test_client()
@@ -0,0 +1,46 @@
+from analytics import rebuild_test_stats, snapshot_test_stats
+
+TEST_TEXT = '''
+1. Which vital sign is checked first?
+A) Pulse
+B) Temperature
+2. Hand hygiene prevents infection (T/F)
+'''
+SOLUTIONS_TEXT = '''
+1. A - Pulse
+2. True
+'''
+
+
+def _assert_rollups_match_rebuild(conn):
+    incremental = snapshot_test_stats(conn)
+    rebuild_test_stats(conn)
+    assert snapshot_test_stats(conn) == incremental
+    conn.rollback()
+
+
+def test_test_stats_rollups_match_a_rebuild(client, conn):
+    test_id = client.post('/api/tests/save', json={
+        'title': 'Vitals', 'test': TEST_TEXT, 'solutions': SOLUTIONS_TEXT}).get_json()['id']
+
+    attempts = []
+    for answers in ([('A', 'T')], [('B', 'T')], [('B', 'F')]):
+        attempt_id = client.post(f'/api/tests/{test_id}/start', json={'mode': 'practice'}).get_json()['id']
+        first, second = answers[0]
+        client.post(f'/api/tests/attempts/{attempt_id}/submit', json={'answers': [
+            {'questionNumber': 1, 'userAnswer': first},
+            {'questionNumber': 2, 'userAnswer': second},
+        ]})
+        attempts.append(attempt_id)
+    _assert_rollups_match_rebuild(conn)
+
+    stats = conn.execute('SELECT attempt_count, best_score FROM test_stats WHERE test_id = ?', (test_id,)).fetchone()
+    assert tuple(stats) == (3, 100)
+
+    # Changing an answer of a completed attempt moves its contribution
+    client.put(f'/api/tests/attempts/{attempts[1]}', json={'questionNumber': 1, 'answer': 'A'})
+    _assert_rollups_match_rebuild(conn)
+
+    client.delete(f'/api/tests/attempts/{attempts[0]}')
+    _assert_rollups_match_rebuild(conn)
+    assert conn.execute('SELECT attempt_count FROM test_stats WHERE test_id = ?', (test_id,)).fetchone()[0] == 2
@@ -0,0 +1,108 @@
+import batch
+
+
+def _batch(client, operations):
+    return client.post('/api/batch', json={'operations': operations})
+
+
+def _count(conn, table):
+    return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def test_batch_applies_every_operation_in_order(client, conn):
+    response = _batch(client, [
+        {'op': 'create', 'resource': 'flashcards', 'data': {'question': 'Normal HR?', 'answer': '60-100'}},
+        {'op': 'create', 'resource': 'flashcards', 'data': {'question': 'Normal RR?', 'answer': '12-20'}},
+        {'op': 'update', 'resource': 'flashcards', 'id': 1, 'data': {'answer': '60-100 bpm'}},
+        {'op': 'delete', 'resource': 'flashcards', 'id': 2},
+    ])
+    assert response.status_code == 200
+    assert [result['status'] for result in response.get_json()['results']] == [201, 201, 200, 200]
+
+    cards = conn.execute('SELECT id, answer FROM flashcards').fetchall()
+    assert [tuple(card) for card in cards] == [(1, '60-100 bpm')]
+
+
+def test_failed_operation_rolls_back_the_whole_batch(client, conn):
+    response = _batch(client, [
+        {'op': 'create', 'resource': 'flashcards', 'data': {'question': 'Q', 'answer': 'A'}},
+        {'op': 'delete', 'resource': 'flashcards', 'id': 42},
+    ])
+    assert response.status_code == 404
+    assert response.get_json()['index'] == 1
+    assert _count(conn, 'flashcards') == 0
+
+
+def test_invalid_operation_is_rejected_before_anything_runs(client, conn):
+    response = _batch(client, [
+        {'op': 'create', 'resource': 'grades', 'data': {'course': 'NURS 101', 'assessment': 'Quiz'}},
+    ])
+    assert response.status_code == 400
+    assert response.get_json()['index'] == 0
+    assert _count(conn, 'grades') == 0
+
+
+def test_non_object_body_is_a_bad_request(client):
+    for body in ([], 'operations', 3):
+        response = client.post('/api/batch', json=body)
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+
+
+def test_batch_grade_percentage_matches_single_item_route(client, conn):
+    # 1/8 and 5/8 are 12.5% and 62.5%, where round-half-even and SQL ROUND disagree
+    grade = {'course': 'NURS 101', 'assessment': 'Quiz', 'grade': 1, 'maxPoints': 8}
+    single_id = client.post('/api/grades', json=grade).get_json()['id']
+    created = _batch(client, [{'op': 'create', 'resource': 'grades', 'data': grade}]).get_json()
+    batch_id = created['results'][0]['id']
+
+    _batch(client, [{'op': 'update', 'resource': 'grades', 'id': batch_id, 'data': {'grade': 5}}])
+    single_five = client.post('/api/grades', json=dict(grade, grade=5)).get_json()['id']
+
+    percentages = dict(conn.execute('SELECT id, percentage FROM grades').fetchall())
+    assert percentages[single_id] == 12
+    assert percentages[batch_id] == percentages[single_five] == 62
+
+
+def test_batch_update_with_invalid_grade_is_rejected(client, conn):
+    grade_id = client.post('/api/grades', json={
+        'course': 'NURS 101', 'assessment': 'Quiz', 'grade': 4, 'maxPoints': 8}).get_json()['id']
+    response = _batch(client, [{'op': 'update', 'resource': 'grades', 'id': grade_id, 'data': {'grade': 'four'}}])
+    assert response.status_code == 400
+    assert conn.execute('SELECT grade FROM grades WHERE id = ?', (grade_id,)).fetchone()[0] == 4
+
+
+def test_consecutive_creates_share_one_statement(client, conn, monkeypatch):
+    statements = []
+    apply_group = batch._apply_group
+
+    def record(conn, group, results):
+        statements.append(len(group))
+        apply_group(conn, group, results)
+
+    monkeypatch.setattr(batch, '_apply_group', record)
+
+    # A deleted row, so the new ids don't simply start at 1
+    _batch(client, [{'op': 'create', 'resource': 'flashcards', 'data': {'question': 'Old', 'answer': 'A'}}])
+    client.delete('/api/flashcards/1')
+    response = _batch(client, [
+        {'op': 'create', 'resource': 'flashcards', 'data': {'question': f'Q{number}', 'answer': 'A'}}
+        for number in range(3)
+    ])
+    assert statements[-1] == 3
+
+    results = response.get_json()['results']
+    questions = dict(conn.execute('SELECT id, question FROM flashcards').fetchall())
+    assert [questions[result['id']] for result in results] == ['Q0', 'Q1', 'Q2']
+    assert [result['status'] for result in results] == [201, 201, 201]
+
+
+def test_deleting_a_row_twice_is_not_found(client, conn):
+    _batch(client, [{'op': 'create', 'resource': 'flashcards', 'data': {'question': 'Q', 'answer': 'A'}}])
+    response = _batch(client, [
+        {'op': 'delete', 'resource': 'flashcards', 'id': 1},
+        {'op': 'delete', 'resource': 'flashcards', 'id': 1},
+    ])
+    assert response.status_code == 404
+    assert response.get_json()['index'] == 1
+    assert _count(conn, 'flashcards') == 1
@@ -0,0 +1,67 @@
+from chunked_generation import Chunk, chunk_materials, merge_parts
+
+
+def _chunk(index, filename):
+    chunk = Chunk(index)
+    chunk.add(filename, 'document', 1, 'Study notes')
+    return chunk
+
+
+def _question(number, stem, options=('Option one', 'Option two')):
+    return '\n'.join([f'{number}. {stem}'] + [f'   {letter}) {option}' for letter, option in zip('ABCD', options)])
+
+
+def _part(questions, title='# Practice Test (Questions 1-2)'):
+    test = '\n\n'.join([title] + [_question(number, *question) for number, question in enumerate(questions, 1)])
+    solutions = '\n'.join(f'{number}. Answer {stem}' for number, (stem, *_) in enumerate(questions, 1))
+    return {'test': test, 'solutions': '# Solution Sheet\n\n' + solutions}
+
+
+def test_parts_are_merged_in_chunk_order_and_renumbered():
+    first, second = _chunk(0, 'week1.txt'), _chunk(1, 'week2.txt')
+    merged = merge_parts([
+        (second, _part([('Normal RR?',), ('Normal SpO2?',)])),
+        (first, _part([('Normal HR?',), ('Normal BP?',)])),
+    ])
+
+    assert merged['question_count'] == 4 and merged['duplicates_removed'] == 0
+    test = merged['test'].splitlines()
+    assert [line for line in test if line[:1].isdigit()] == [
+        '1. Normal HR?', '2. Normal BP?', '3. Normal RR?', '4. Normal SpO2?']
+    assert test.index('## Part 1: week1.txt') < test.index('## Part 2: week2.txt')
+    # Each part's own title is dropped
+    assert test.count('# Practice Test') == 1 and 'Questions 1-2' not in merged['test']
+
+    solutions = [line for line in merged['solutions'].splitlines() if line[:1].isdigit()]
+    assert solutions == ['1. Answer Normal HR?', '2. Answer Normal BP?', '3. Answer Normal RR?', '4. Answer Normal SpO2?']
+
+
+def test_repeated_question_is_dropped_with_its_solution():
+    merged = merge_parts([
+        (_chunk(0, 'week1.txt'), _part([('Normal HR?',), ('Normal BP?',)])),
+        (_chunk(1, 'week2.txt'), _part([('**normal hr**?',), ('Normal RR?',)])),
+    ])
+
+    assert merged['question_count'] == 3 and merged['duplicates_removed'] == 1
+    assert '3. Normal RR?' in merged['test']
+    assert merged['solutions'].count('Answer Normal HR?') == 1
+    assert '3. Answer Normal RR?' in merged['solutions']
+
+
+def test_same_stem_with_different_options_is_kept():
+    stem = 'Which of the following is correct?'
+    merged = merge_parts([
+        (_chunk(0, 'week1.txt'), _part([(stem, ('HR 60-100', 'HR 20-40'))])),
+        (_chunk(1, 'week2.txt'), _part([(stem, ('RR 12-20', 'RR 40-60'))])),
+    ])
+
+    assert merged['question_count'] == 2 and merged['duplicates_removed'] == 0
+    assert '2. Which of the following is correct?' in merged['test']
+
+
+def test_materials_are_chunked_on_unit_boundaries():
+    material = {'filename': 'deck.pptx', 'content': '', 'unit_type': 'slide',
+                'unit_numbers': [1, 2, 3], 'units': ['a' * 40, 'b' * 40, 'c' * 40]}
+    chunks = chunk_materials([material], max_chars=100)
+
+    assert [chunk.label for chunk in chunks] == ['deck.pptx (slides 1-2)', 'deck.pptx (slide 3)']
@@ -0,0 +1,37 @@
+import app as nursing_app
+import db
+
+
+def test_request_connection_is_released_only_on_teardown(database, monkeypatch):
+    monkeypatch.setattr(db, 'pool', db.ConnectionPool(2))
+    with nursing_app.app.app_context():
+        conn = db.get_db_connection()
+        conn.close()  # routes still close their connection before returning
+        assert not conn._released
+
+        # Another thread (a job dispatcher, a stream) must get a different connection...
+        other = db.pool.acquire()
+        assert other is not conn
+        other.execute("INSERT INTO flashcards (question, answer) VALUES ('Q', 'A')")
+    # ...which the request's teardown leaves alone
+    assert other.in_transaction and not other._released
+    assert conn._released
+
+    other.close()
+    for idle in (db.pool.acquire(), db.pool.acquire()):
+        idle.discard()
+
+
+def test_nested_thread_local_use_keeps_the_outer_transaction(database):
+    pool = db.ThreadLocalPool()
+    outer = pool.acquire()
+    outer.execute("INSERT INTO flashcards (question, answer) VALUES ('Q', 'A')")
+
+    inner = pool.acquire()
+    assert inner is not outer
+    inner.close()
+
+    assert outer.in_transaction
+    outer.commit()
+    assert outer.execute('SELECT COUNT(*) FROM flashcards').fetchone()[0] == 1
+    outer.discard()
@@ -0,0 +1,36 @@
+def _add_flashcard(client, question='Normal HR?'):
+    return client.post('/api/flashcards', json={'question': question, 'answer': '60-100'}).get_json()['id']
+
+
+def test_matching_etag_gets_304(client):
+    _add_flashcard(client)
+    first = client.get('/api/flashcards')
+    assert first.status_code == 200 and first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    again = client.get('/api/flashcards', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+    assert again.headers['ETag'] == first.headers['ETag']
+
+
+def test_write_invalidates_the_etag(client):
+    card_id = _add_flashcard(client)
+    etag = client.get('/api/flashcards').headers['ETag']
+
+    for write in (lambda: _add_flashcard(client, 'Normal RR?'),
+                  lambda: client.delete(f'/api/flashcards/{card_id}')):
+        write()
+        response = client.get('/api/flashcards', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+        etag = response.headers['ETag']
+
+
+def test_etag_depends_on_the_query_and_other_tables_do_not_change_it(client):
+    _add_flashcard(client)
+    etag = client.get('/api/flashcards').headers['ETag']
+    assert client.get('/api/flashcards?limit=1').headers['ETag'] != etag
+
+    client.post('/api/goals', json={'title': 'Pass NCLEX', 'targetDate': '2027-06-01'})
+    assert client.get('/api/flashcards', headers={'If-None-Match': etag}).status_code == 304
@@ -0,0 +1,60 @@
+import glob
+import os
+import tempfile
+
+import pytest
+
+import extraction
+from extraction import extract_files
+
+
+def make_pdf(page_texts):
+    """A minimal PDF with one line of text per page"""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None,
+               '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for text in page_texts:
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>')
+        kids.append(f'{len(objects)} 0 R')
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    body, offsets = b'%PDF-1.4\n', []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(body))
+        body += f'{number} 0 obj\n{obj}\nendobj\n'.encode('latin-1')
+    xref = len(body)
+    body += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('latin-1')
+    body += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode('latin-1')
+    body += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode('latin-1')
+    return body
+
+
+@pytest.fixture(autouse=True)
+def small_page_groups(monkeypatch):
+    monkeypatch.setattr(extraction, 'PDF_PAGES_PER_TASK', 2)
+
+
+def _temp_pdfs():
+    return set(glob.glob(os.path.join(tempfile.gettempdir(), 'extract_*.pdf')))
+
+
+def test_pdf_pages_are_extracted_in_groups_and_in_order():
+    pdf = make_pdf([f'Page {number}' for number in range(1, 6)])
+    before = _temp_pdfs()
+    materials, timings = extract_files([('notes.pdf', pdf, [(2, 4)]), ('extra.txt', b'Hand hygiene')])
+
+    assert materials[0]['unit_numbers'] == [2, 3, 4]
+    assert [unit.strip() for unit in materials[0]['units']] == ['Page 2', 'Page 3', 'Page 4']
+    assert materials[1]['content'] == 'Hand hygiene'
+    assert [timing['status'] for timing in timings] == ['ok', 'ok']
+    # The temporary copies the tasks read from are gone
+    assert _temp_pdfs() == before
+
+
+def test_unreadable_pdf_is_reported_not_raised():
+    materials, timings = extract_files([('broken.pdf', b'not a pdf')])
+    assert timings[0]['status'] == 'error'
+    assert materials[0]['content'].startswith('Error extracting PDF')
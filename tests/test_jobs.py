@@ -0,0 +1,18 @@
+from jobs import JOB_CONCURRENCY, claim, enqueue, start_inline_job
+
+
+def test_inline_jobs_do_not_use_queue_slots(conn):
+    for _ in range(JOB_CONCURRENCY):
+        start_inline_job(conn, 'generate_test_stream', {})
+    job_id = enqueue(conn, 'generate_test', {})
+
+    row = claim(conn, ('generate_test',), 'test-worker')
+    assert row is not None and row['id'] == job_id
+
+
+def test_claim_keeps_a_queue_within_its_limit(conn):
+    for _ in range(2):
+        enqueue(conn, 'generate_test', {})
+
+    assert claim(conn, ('generate_test',), 'test-worker', limit=1) is not None
+    assert claim(conn, ('generate_test',), 'test-worker', limit=1) is None
@@ -0,0 +1,55 @@
+import io
+
+import pytest
+
+import app as nursing_app
+from live_notes import create_live_note, get_segment, store_segment
+from transcription import LIVE_QUEUE
+
+
+@pytest.fixture
+def note_id(conn, tmp_path, monkeypatch):
+    monkeypatch.setitem(nursing_app.app.config, 'AUDIO_FOLDER', str(tmp_path))
+    note_id = create_live_note(conn, 'Lecture', 'NURS 101', '2026-10-01', None)
+    conn.commit()
+    return note_id
+
+
+def _upload(client, note_id, seq):
+    return client.post(f'/api/audio/live/{note_id}/segments', content_type='multipart/form-data',
+                       data={'audio': (io.BytesIO(b'audio'), 'segment.webm'), 'seq': str(seq)})
+
+
+def test_live_jobs_use_their_own_queue(client, conn, note_id):
+    _upload(client, note_id, 0)
+    client.post(f'/api/audio/live/{note_id}/finish', json={})
+
+    queues = [row[0] for row in conn.execute('SELECT queue FROM jobs ORDER BY id')]
+    assert queues == [LIVE_QUEUE, LIVE_QUEUE]
+
+
+def test_duplicate_segment_upload_leaves_no_orphan_job(client, conn, note_id, monkeypatch):
+    first = _upload(client, note_id, 0).get_json()
+    # A concurrent upload of the same seq that passed the "already received" check before the first committed
+    lookups = iter([None, get_segment(conn, note_id, 0)])
+    monkeypatch.setattr(nursing_app, 'get_segment', lambda *args: next(lookups))
+
+    second = _upload(client, note_id, 0)
+    assert second.status_code == 200
+    assert second.get_json()['job_id'] == first['job_id']
+    assert conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0] == 1
+
+
+def test_events_send_what_is_ready_without_waiting(client, conn, note_id):
+    body = client.get(f'/api/audio/live/{note_id}/events').get_data(as_text=True)
+    assert body == 'retry: 2000\n\n'
+
+    _upload(client, note_id, 0)
+    store_segment(conn, note_id, 0, 30.0, [(0, 300, 'Check the airway')])
+    conn.commit()
+    body = client.get(f'/api/audio/live/{note_id}/events').get_data(as_text=True)
+    assert 'id: 0\nevent: segment\n' in body and 'Check the airway' in body
+
+    # A reconnect resumes after the last event it saw
+    resumed = client.get(f'/api/audio/live/{note_id}/events', headers={'Last-Event-ID': '0'})
+    assert resumed.get_data(as_text=True) == 'retry: 2000\n\n'
@@ -0,0 +1,68 @@
+import pytest
+
+import llm_cache
+import ollama_client
+from llm_cache import cache_key
+
+
+class FakeGateway:
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, prompt, options):
+        self.prompts.append(prompt)
+        return f'response {len(self.prompts)}'
+
+    def stream(self, prompt, options):
+        self.prompts.append(prompt)
+        yield 'partial '
+        raise ConnectionError('stream dropped')
+
+
+@pytest.fixture
+def gateway(database, monkeypatch):
+    monkeypatch.setattr(llm_cache, 'LLM_CACHE_ENABLED', True)
+    fake = FakeGateway()
+    monkeypatch.setattr(ollama_client, 'llm', fake)
+    return fake
+
+
+def test_key_covers_model_prompt_and_options():
+    key = cache_key('model-a', 'Explain sepsis', {'temperature': 0.7, 'num_predict': 800})
+    assert key == cache_key('model-a', 'Explain sepsis', {'num_predict': 800, 'temperature': 0.7})
+    assert key != cache_key('model-b', 'Explain sepsis', {'temperature': 0.7, 'num_predict': 800})
+    assert key != cache_key('model-a', 'Explain shock', {'temperature': 0.7, 'num_predict': 800})
+    assert key != cache_key('model-a', 'Explain sepsis', {'temperature': 0.2, 'num_predict': 800})
+    assert cache_key('model-a', 'Explain sepsis', None) == cache_key('model-a', 'Explain sepsis', {})
+
+
+def test_repeated_prompt_is_served_from_the_cache(gateway, conn):
+    options = {'temperature': 0.7}
+    assert ollama_client.generate_text('Explain sepsis', options) == 'response 1'
+    assert ollama_client.generate_text('Explain sepsis', options) == 'response 1'
+    assert ollama_client.generate_text('Explain sepsis', {'temperature': 0.2}) == 'response 2'
+    assert len(gateway.prompts) == 2
+
+    stats = llm_cache.stats(conn)
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 2)
+
+
+def test_skipping_the_cache_refreshes_the_entry(gateway):
+    ollama_client.generate_text('Explain sepsis', {})
+    assert ollama_client.generate_text('Explain sepsis', {}, use_cache=False) == 'response 2'
+    assert ollama_client.generate_text('Explain sepsis', {}) == 'response 2'
+    assert len(gateway.prompts) == 2
+
+
+def test_expired_entry_is_a_miss(gateway, conn):
+    ollama_client.generate_text('Explain sepsis', {})
+    conn.execute("UPDATE llm_cache SET expires_at = datetime('now', '-1 seconds')")
+    conn.commit()
+
+    assert ollama_client.generate_text('Explain sepsis', {}) == 'response 2'
+
+
+def test_interrupted_stream_is_not_cached(gateway, conn):
+    with pytest.raises(ConnectionError):
+        list(ollama_client.stream_ollama('Explain sepsis', {}))
+    assert llm_cache.stats(conn)['entries'] == 0
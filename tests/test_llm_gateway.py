@@ -0,0 +1,115 @@
+import pytest
+from ollama import ResponseError
+
+import llm_gateway
+from llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailable
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_gateway.time, 'monotonic', clock)
+    return clock
+
+
+def _open(breaker):
+    for _ in range(breaker.threshold):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(threshold=3, reset_seconds=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # a success in between starts the count again
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(LLMUnavailable) as raised:
+        breaker.before_call()
+    assert raised.value.retry_after == 60
+
+
+def test_half_open_breaker_admits_one_trial(clock):
+    breaker = CircuitBreaker(threshold=2, reset_seconds=60)
+    _open(breaker)
+    clock.now += 59
+    assert breaker.state == 'open'
+
+    clock.now += 1
+    assert breaker.state == 'half-open'
+    breaker.before_call()
+    with pytest.raises(LLMUnavailable):
+        breaker.before_call()  # only one trial at a time
+
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0
+    breaker.before_call()
+
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = CircuitBreaker(threshold=2, reset_seconds=60)
+    _open(breaker)
+    clock.now += 60
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == 'open'
+    clock.now += 59
+    with pytest.raises(LLMUnavailable):
+        breaker.before_call()
+    clock.now += 1
+    breaker.before_call()
+
+
+def test_released_trial_lets_the_next_call_try(clock):
+    breaker = CircuitBreaker(threshold=1, reset_seconds=60)
+    _open(breaker)
+    clock.now += 60
+    breaker.before_call()
+    breaker.release_trial()  # e.g. a bad request: says nothing about upstream
+    assert breaker.state == 'half-open'
+    breaker.before_call()
+
+
+class FlakyClient:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def generate(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ResponseError('overloaded', 503)
+        return {'response': 'Sepsis is...', 'prompt_eval_count': 10, 'eval_count': 5}
+
+
+def test_gateway_fails_fast_while_open_and_recovers(clock, monkeypatch):
+    monkeypatch.setattr(llm_gateway, 'LLM_MAX_RETRIES', 0)
+    client = FlakyClient(failures=2)
+    gateway = LLMGateway(client, 'model')
+    gateway.breaker = CircuitBreaker(threshold=2, reset_seconds=60)
+
+    for _ in range(2):
+        with pytest.raises(ResponseError):
+            gateway.generate('Explain sepsis')
+    with pytest.raises(LLMUnavailable):
+        gateway.generate('Explain sepsis')
+    assert client.calls == 2
+    assert gateway.metrics()['circuit'] == 'open' and gateway.metrics()['rejected'] == 1
+
+    clock.now += 60
+    assert gateway.generate('Explain sepsis') == 'Sepsis is...'
+    assert gateway.metrics()['circuit'] == 'closed'
@@ -0,0 +1,80 @@
+import pytest
+
+import material_cache
+from material_cache import content_hash, evict_lru, evict_material, extract_with_cache, list_materials
+
+
+@pytest.fixture
+def extracted(monkeypatch):
+    """The filenames handed to the real extractor, batch by batch"""
+    batches, extract_files = [], material_cache.extract_files
+
+    def recording(files):
+        batches.append([entry[0] for entry in files])
+        return extract_files(files)
+
+    monkeypatch.setattr(material_cache, 'extract_files', recording)
+    return batches
+
+
+def test_second_upload_is_served_from_the_cache(conn, extracted):
+    materials, timings = extract_with_cache(conn, [('week1.txt', b'Hand hygiene', None)])
+    assert timings[0]['status'] == 'ok'
+
+    # Same bytes under another name: no extraction at all
+    cached, cached_timings = extract_with_cache(conn, [('copy.txt', b'Hand hygiene', None)])
+    assert extracted == [['week1.txt'], []]
+    assert cached_timings[0]['status'] == 'cached'
+    assert cached[0]['filename'] == 'copy.txt'
+    assert cached[0]['content'] == materials[0]['content']
+
+    listed = list_materials(conn)['materials']
+    assert len(listed) == 1 and listed[0]['hit_count'] == 1
+
+
+def test_only_misses_are_extracted(conn, extracted):
+    extract_with_cache(conn, [('week1.txt', b'Hand hygiene', None)])
+    materials, timings = extract_with_cache(conn, [('week2.txt', b'Vital signs', None),
+                                                   ('week1.txt', b'Hand hygiene', None)])
+    assert extracted[-1] == ['week2.txt']
+    assert [timing['status'] for timing in timings] == ['ok', 'cached']
+    assert [material['content'] for material in materials] == ['Vital signs', 'Hand hygiene']
+
+
+def test_page_selection_and_extractor_version_are_part_of_the_key(conn, monkeypatch):
+    data = b'Hand hygiene'
+    assert content_hash(data) != content_hash(data, [(2, 4)])
+    assert content_hash(data, [(2, 4)]).startswith(content_hash(data) + ':')
+
+    extract_with_cache(conn, [('week1.txt', data, None)])
+    monkeypatch.setattr(material_cache, 'EXTRACTOR_VERSION', material_cache.EXTRACTOR_VERSION + 1)
+    _, timings = extract_with_cache(conn, [('week1.txt', data, None)])
+    assert timings[0]['status'] == 'ok'
+
+
+def test_failed_extraction_is_not_cached(conn, extracted):
+    for _ in range(2):
+        _, timings = extract_with_cache(conn, [('broken.pdf', b'not a pdf', None)])
+        assert timings[0]['status'] == 'error'
+    assert extracted == [['broken.pdf'], ['broken.pdf']]
+    assert list_materials(conn)['materials'] == []
+
+
+def test_least_recently_used_entries_are_evicted_first(conn):
+    extract_with_cache(conn, [('old.txt', b'Old notes', None)])
+    extract_with_cache(conn, [('new.txt', b'New notes', None)])
+    conn.execute("UPDATE material_cache SET last_used_at = '2026-01-01 00:00:00' WHERE filename = 'old.txt'")
+    newest = conn.execute("SELECT size_bytes FROM material_cache WHERE filename = 'new.txt'").fetchone()[0]
+
+    assert evict_lru(conn, max_bytes=newest) == 1
+    assert [material['filename'] for material in list_materials(conn)['materials']] == ['new.txt']
+
+
+def test_evicting_a_material_removes_its_page_selections(conn):
+    data = b'Hand hygiene'
+    extract_with_cache(conn, [('week1.txt', data, None)])
+    extract_with_cache(conn, [('week1.txt', data, [(1, 1)])])
+    extract_with_cache(conn, [('week2.txt', b'Vital signs', None)])
+
+    assert evict_material(conn, content_hash(data)) == 2
+    assert evict_material(conn) == 1
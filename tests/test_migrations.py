@@ -0,0 +1,38 @@
+import app as nursing_app
+from migrations import MIGRATIONS, apply_migrations, get_schema_version
+
+
+def test_fresh_database_is_fully_migrated(conn):
+    assert get_schema_version(conn) == MIGRATIONS[-1][0]
+    applied = [row[0] for row in conn.execute('SELECT version FROM schema_migrations ORDER BY version')]
+    assert applied == [version for version, _, _ in MIGRATIONS]
+
+
+def test_migrations_are_applied_once(conn):
+    version = get_schema_version(conn)
+    assert apply_migrations(conn) == version
+    assert conn.execute('SELECT COUNT(*) FROM schema_migrations').fetchone()[0] == len(MIGRATIONS)
+
+
+def test_upgrade_keeps_latest_duplicate_answer(tmp_path, monkeypatch):
+    import db
+
+    monkeypatch.setattr(db, 'DATABASE', str(tmp_path / 'old.db'))
+    # The schema as it was before migrations existed
+    monkeypatch.setattr(nursing_app, 'apply_migrations', lambda conn: 0)
+    nursing_app.init_database()
+
+    conn = db.open_connection()
+    try:
+        conn.execute("INSERT INTO saved_tests (title, test_content, solutions_content) VALUES ('t', '', '')")
+        conn.execute("INSERT INTO test_attempts (test_id, mode, total_questions) VALUES (1, 'practice', 1)")
+        conn.executemany('''
+            INSERT INTO test_answers (attempt_id, question_number, user_answer) VALUES (1, 1, ?)
+        ''', [('A',), ('B',)])
+        conn.commit()
+
+        assert apply_migrations(conn) == MIGRATIONS[-1][0]
+        answers = conn.execute('SELECT user_answer FROM test_answers WHERE attempt_id = 1').fetchall()
+        assert [row[0] for row in answers] == ['B']
+    finally:
+        conn.discard()
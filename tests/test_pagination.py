@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+from pagination import PaginationError, keyset_page
+
+# Sort keys with NULLs and ties, inserted out of order
+DUE_DATES = ['2026-11-03', None, '2026-11-01', '2026-11-03', None, '2026-11-02', '2026-11-01']
+
+
+@pytest.fixture
+def items():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, due_date TEXT)')
+    conn.executemany('INSERT INTO items (due_date) VALUES (?)', [(due,) for due in DUE_DATES])
+    yield conn
+    conn.close()
+
+
+def _walk(conn, descending, limit):
+    """Every id, page by page"""
+    ids, args = [], {'limit': str(limit)}
+    while True:
+        rows, cursor = keyset_page(conn, 'SELECT * FROM items', 'due_date', args, descending=descending)
+        ids += [row['id'] for row in rows]
+        if cursor is None:
+            return ids
+        args = {'limit': str(limit), 'after': cursor}
+
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('limit', [1, 2, 3])
+def test_pages_cover_every_row_once_in_order(items, descending, limit):
+    direction = 'DESC' if descending else 'ASC'
+    expected = [row[0] for row in items.execute(f'SELECT id FROM items ORDER BY due_date {direction}, id {direction}')]
+    assert _walk(items, descending, limit) == expected
+
+
+def test_unpaginated_request_returns_everything(items):
+    rows, cursor = keyset_page(items, 'SELECT * FROM items', 'due_date', {})
+    assert len(rows) == len(DUE_DATES) and cursor is None
+
+
+def test_invalid_cursor_is_rejected(items):
+    with pytest.raises(PaginationError):
+        keyset_page(items, 'SELECT * FROM items', 'due_date', {'after': 'not-a-cursor'})
+
+
+def test_grades_endpoint_pages_past_missing_dates(client):
+    for number, date in enumerate(['2026-10-01', None, '2026-10-02', None]):
+        client.post('/api/grades', json={'course': 'NURS 101', 'assessment': f'Quiz {number}', 'grade': 8,
+                                         'maxPoints': 10, 'date': date})
+
+    first = client.get('/api/grades?limit=3').get_json()
+    second = client.get(f"/api/grades?limit=3&after={first['next_cursor']}").get_json()
+    assert [grade['date'] for grade in first['items'] + second['items']] == ['2026-10-02', '2026-10-01', None, None]
+    assert second['next_cursor'] is None
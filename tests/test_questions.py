@@ -0,0 +1,113 @@
+import etag as etag_module
+from backup import legacy_backup
+from questions import count_questions, parse_test
+
+TEST_TEXT = '''
+# Cardiac Practice Test
+1. Which chamber pumps blood to the body?
+A) Right atrium
+B) Left ventricle
+C) Right ventricle
+2. Aspirin is an anticoagulant. (T/F)
+3. Describe the cardiac cycle.
+4) Normal adult resting heart rate?
+   - A. 40-60
+   - B. 60-100
+'''
+SOLUTIONS_TEXT = '''
+## Answer Key
+**1. Answer: B**
+The left ventricle pumps oxygenated blood into the aorta.
+2. False - aspirin is an antiplatelet.
+4) Correct Answer: b
+'''
+
+
+def _save(client):
+    return client.post('/api/tests/save', json={
+        'title': 'Cardiac', 'test': TEST_TEXT, 'solutions': SOLUTIONS_TEXT}).get_json()['id']
+
+
+def test_parse_test_reads_stems_options_and_answers():
+    questions = {question['number']: question for question in parse_test(TEST_TEXT, SOLUTIONS_TEXT)}
+    assert sorted(questions) == [1, 2, 3, 4]
+
+    assert questions[1]['type'] == 'multiple-choice'
+    assert [option['letter'] for option in questions[1]['options']] == ['A', 'B', 'C']
+    assert questions[1]['answer'] == 'B'
+    assert 'left ventricle' in questions[1]['explanation']
+
+    assert questions[2]['type'] == 'true-false'
+    assert questions[2]['answer'] == 'F'
+
+    assert questions[4]['options'][1] == {'letter': 'B', 'text': '60-100'}
+    assert questions[4]['answer'] == 'B'
+
+
+def test_questions_without_options_keep_a_frontend_type():
+    question = parse_test(TEST_TEXT, SOLUTIONS_TEXT)[2]
+    assert question['number'] == 3
+    assert question['type'] == 'multiple-choice' and question['options'] == []
+    assert question['answer'] is None
+
+
+def test_submit_is_graded_on_the_server(client, conn):
+    test_id = _save(client)
+    attempt_id = client.post(f'/api/tests/{test_id}/start', json={'mode': 'exam'}).get_json()['id']
+
+    result = client.post(f'/api/tests/attempts/{attempt_id}/submit', json={
+        # The client's score is ignored once the test has parsed questions
+        'score': 4, 'total': 4,
+        'answers': [
+            {'questionNumber': 1, 'userAnswer': 'B'},
+            {'questionNumber': 2, 'userAnswer': 'T'},
+            {'questionNumber': 3, 'userAnswer': 'It has two phases'},
+            {'questionNumber': 4, 'userAnswer': 'B'},
+        ],
+    }).get_json()
+    assert (result['score'], result['total'], result['percentage']) == (2, 4, 50)
+
+    graded = dict(conn.execute('''
+        SELECT question_number, is_correct FROM test_answers WHERE attempt_id = ?
+    ''', (attempt_id,)).fetchall())
+    # Question 3 has no answer on the solution sheet, so it stays ungraded
+    assert graded == {1: 1, 2: 0, 3: None, 4: 1}
+
+
+def test_saved_answer_reports_correctness(client):
+    test_id = _save(client)
+    attempt_id = client.post(f'/api/tests/{test_id}/start', json={'mode': 'practice'}).get_json()['id']
+    body = client.put(f'/api/tests/attempts/{attempt_id}', json={'questionNumber': 1, 'answer': 'A'}).get_json()
+    assert body['correctAnswer'] == 'B' and body['isCorrect'] is False
+
+
+def test_questions_are_backed_up(client, conn):
+    test_id = _save(client)
+    backup = legacy_backup(conn)
+    assert [question['number'] for question in backup['questions'] if question['test_id'] == test_id] == [1, 2, 3, 4]
+
+
+def test_restarted_numbering_is_renumbered_and_every_question_stored(client, conn):
+    test = '1. Normal HR?\nA) 60-100\nB) 20-40\n2. Normal RR? (T/F)\n# Part 2\n1. Normal SpO2?\nA) 80%\nB) 95%\n'
+    solutions = '1. A\n2. True\n## Part 2\n1. B\n'
+    questions = parse_test(test, solutions)
+    assert [(q['number'], q['answer']) for q in questions] == [(1, 'A'), (2, 'T'), (3, 'B')]
+
+    body = client.post('/api/tests/save', json={'title': 'Vitals', 'test': test, 'solutions': solutions}).get_json()
+    assert body['questionCount'] == 3
+    assert count_questions(conn, body['id']) == 3
+
+
+def test_submit_needs_only_the_users_answers(client):
+    test_id = _save(client)
+    attempt_id = client.post(f'/api/tests/{test_id}/start', json={'mode': 'exam'}).get_json()['id']
+    result = client.post(f'/api/tests/attempts/{attempt_id}/submit', json={
+        'timeSpent': 60, 'answers': [{'questionNumber': 1, 'userAnswer': 'B'}]}).get_json()
+    assert (result['score'], result['total'], result['percentage']) == (1, 4, 25)
+
+
+def test_questions_etag_changes_with_the_etag_format(client, monkeypatch):
+    test_id = _save(client)
+    etag = client.get(f'/api/tests/{test_id}/questions').headers['ETag']
+    monkeypatch.setattr(etag_module, 'ETAG_FORMAT', etag_module.ETAG_FORMAT + 1)
+    assert client.get(f'/api/tests/{test_id}/questions', headers={'If-None-Match': etag}).status_code == 200
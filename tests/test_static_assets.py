@@ -0,0 +1,64 @@
+import gzip
+
+import pytest
+
+import app as nursing_app
+import static_assets
+from static_assets import CachedAsset
+
+DOCUMENT = b'<!DOCTYPE html><title>Nursing</title>' + b'<p>Study plan</p>' * 200
+
+
+@pytest.fixture
+def asset(tmp_path, monkeypatch):
+    monkeypatch.setattr(static_assets, 'STATIC_RECHECK_SECONDS', 0)
+    path = tmp_path / 'index.html'
+    path.write_bytes(DOCUMENT)
+    return CachedAsset(str(path), 'text/html')
+
+
+def _get(asset, **headers):
+    with nursing_app.app.test_request_context('/', headers=headers):
+        return asset.response()
+
+
+def test_each_encoding_is_served_from_its_own_variant(asset):
+    plain = _get(asset)
+    assert plain.get_data() == DOCUMENT and 'Content-Encoding' not in plain.headers
+
+    zipped = _get(asset, **{'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.get_data()) == DOCUMENT
+
+    if static_assets.brotli is not None:
+        compressed = _get(asset, **{'Accept-Encoding': 'gzip, br'})
+        assert compressed.headers['Content-Encoding'] == 'br'
+        assert static_assets.brotli.decompress(compressed.get_data()) == DOCUMENT
+
+    assert 'Accept-Encoding' in zipped.headers['Vary']
+    assert len({plain.headers['ETag'], zipped.headers['ETag']}) == 2
+
+
+def test_matching_etag_gets_304(asset):
+    etag = _get(asset, **{'Accept-Encoding': 'gzip'}).headers['ETag']
+    response = _get(asset, **{'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304 and response.get_data() == b''
+
+    # The tag of one encoding doesn't validate another
+    assert _get(asset, **{'If-None-Match': etag}).status_code == 200
+
+
+def test_changed_file_is_reloaded(asset):
+    etag = _get(asset).headers['ETag']
+    with open(asset.path, 'ab') as f:
+        f.write(b'<p>Updated</p>')
+
+    response = _get(asset, **{'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_data().endswith(b'<p>Updated</p>')
+
+
+def test_frontend_route_serves_the_document(client):
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200 and response.mimetype == 'text/html'
+    assert b'<html' in gzip.decompress(response.get_data()).lower()
@@ -0,0 +1,112 @@
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+
+from backup import current_watermark, write_snapshot
+from live_notes import add_segment, create_live_note
+from transcript_segments import store_segments
+
+
+def _add_assignments(client, count):
+    return [client.post('/api/assignments', json={
+        'title': f'Care plan {number}', 'course': 'NURS 101', 'dueDate': '2026-11-01'}).get_json()['id']
+        for number in range(count)]
+
+
+def _tomorrow(conn):
+    # A watermark no existing row has changed since
+    return conn.execute("SELECT date('now', '+1 day')").fetchone()[0]
+
+
+@contextmanager
+def _snapshot(since):
+    path = write_snapshot(since)
+    try:
+        snapshot = sqlite3.connect(path)
+        try:
+            yield snapshot
+        finally:
+            snapshot.close()
+    finally:
+        os.remove(path)
+
+
+def test_sync_returns_changes_and_deletes_since_token(client):
+    first, second = _add_assignments(client, 2)
+    token = client.get('/api/sync?tables=assignments').get_json()['token']
+
+    client.put(f'/api/assignments/{first}', json={'title': 'Edited', 'course': 'NURS 101', 'dueDate': '2026-11-02'})
+    client.delete(f'/api/assignments/{second}')
+
+    delta = client.get(f'/api/sync?since={token}&tables=assignments').get_json()
+    assert [row['title'] for row in delta['changes']['assignments']] == ['Edited']
+    assert delta['deleted']['assignments'] == [second]
+    assert delta['token'] > token
+
+    unchanged = client.get(f"/api/sync?since={delta['token']}&tables=assignments").get_json()
+    assert unchanged['changes']['assignments'] == [] and unchanged['deleted']['assignments'] == []
+
+
+def test_sync_token_newer_than_database_resets(client):
+    _add_assignments(client, 1)
+    delta = client.get('/api/sync?since=999999&tables=assignments').get_json()
+    assert delta['reset'] is True
+    assert len(delta['changes']['assignments']) == 1
+
+
+def test_incremental_snapshot_of_unchanged_database_has_no_tombstones(client, conn):
+    _add_assignments(client, 3)
+    version = conn.execute('SELECT version FROM sync_state').fetchone()[0]
+
+    with _snapshot(_tomorrow(conn)) as snapshot:
+        assert snapshot.execute('SELECT COUNT(*) FROM assignments').fetchone()[0] == 0
+        assert snapshot.execute('SELECT COUNT(*) FROM sync_tombstones').fetchone()[0] == 0
+        assert snapshot.execute('SELECT version FROM sync_state').fetchone()[0] == version
+
+
+def test_incremental_snapshot_keeps_real_deletions(client, conn):
+    first, second = _add_assignments(client, 2)
+    since = current_watermark(conn)
+    client.delete(f'/api/assignments/{first}')
+
+    with _snapshot(since) as snapshot:
+        tombstones = snapshot.execute('SELECT table_name, row_id FROM sync_tombstones').fetchall()
+        assert tombstones == [('assignments', first)]
+        assert [row[0] for row in snapshot.execute('SELECT id FROM assignments')] == [second]
+
+
+def test_incremental_ndjson_backup_carries_only_changes(client, conn):
+    _add_assignments(client, 2)
+    response = client.get(f'/api/backup?format=ndjson&since={_tomorrow(conn)}')
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert lines[0]['type'] == 'backup' and lines[-1]['type'] == 'end'
+    assert not [line for line in lines if 'row' in line]
+    assert response.headers['X-Backup-Watermark']
+
+
+def test_backup_covers_transcript_and_live_segments(client, conn):
+    note_id = create_live_note(conn, 'Lecture', 'NURS 101', '2026-10-01', None)
+    store_segments(conn, note_id, [(0, 300, 'Check the airway.'), (300, 600, 'Then breathing.')])
+    add_segment(conn, note_id, 0, 0.0, 'live_1_00000.webm', None)
+    conn.commit()
+
+    def backed_up(since=''):
+        response = client.get(f'/api/backup?format=ndjson&since={since}')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        return {table: sum(1 for line in lines if line.get('table') == table)
+                for table in ('transcript_segments', 'live_segments')}
+
+    assert backed_up() == {'transcript_segments': 2, 'live_segments': 1}
+    assert backed_up(_tomorrow(conn)) == {'transcript_segments': 0, 'live_segments': 0}
+
+
+def test_sync_covers_the_tables_the_frontend_loads(client):
+    client.post('/api/initialize', json={})
+    tables = 'assignments,clinical_shifts,requirements,goals,grades,flashcards,stress_logs,settings'
+    delta = client.get(f'/api/sync?since=0&tables={tables}').get_json()
+
+    assert delta['since'] == 0
+    assert {row['key'] for row in delta['changes']['settings']} >= {'currentSemester'}
+    assert len(delta['changes']['requirements']) == 7
@@ -0,0 +1,34 @@
+import pytest
+
+from transcript_segments import store_segments
+
+SEGMENTS = [(0, 400, 'Check the airway'), (400, 1000, 'then the breathing')]
+
+
+@pytest.fixture
+def note_id(conn):
+    cursor = conn.execute("INSERT INTO audio_notes (title, transcript) VALUES ('Lecture', '')")
+    transcript = store_segments(conn, cursor.lastrowid, SEGMENTS)
+    conn.execute('UPDATE audio_notes SET transcript = ? WHERE id = ?', (transcript, cursor.lastrowid))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def _note(client, note_id):
+    return client.get(f'/api/audio/notes/{note_id}').get_json()
+
+
+def test_position_is_interpolated_within_a_segment(client, note_id):
+    body = client.get(f'/api/audio/notes/{note_id}/position?offset=17').get_json()
+    assert body['segment']['text'] == 'then the breathing'
+    assert body['seconds'] == 4.0
+
+
+def test_editing_the_transcript_drops_its_segments(client, conn, note_id):
+    note = _note(client, note_id)
+    client.put(f'/api/audio/notes/{note_id}', json={**note, 'title': 'Airway lecture'})
+    assert client.get(f'/api/audio/notes/{note_id}/position?offset=0').status_code == 200
+
+    client.put(f'/api/audio/notes/{note_id}', json={**note, 'transcript': 'Check the airway first'})
+    assert conn.execute('SELECT COUNT(*) FROM transcript_segments WHERE note_id = ?', (note_id,)).fetchone()[0] == 0
+    assert client.get(f'/api/audio/notes/{note_id}/position?offset=0').status_code == 404
@@ -0,0 +1,47 @@
+from transcription import plan_chunks, segments_to_text, stitch, trim_overlap
+
+
+def test_plan_chunks_prefers_a_nearby_silence():
+    assert plan_chunks(700, [290, 310, 580], chunk_seconds=300) == [(0.0, 290), (290, 580), (580, 700)]
+
+
+def test_plan_chunks_cuts_at_the_target_without_a_silence():
+    assert plan_chunks(650, [], chunk_seconds=300) == [(0.0, 300.0), (300.0, 650)]
+
+
+def test_plan_chunks_keeps_a_short_recording_whole():
+    # The last part may run up to a quarter over rather than leave a tiny tail
+    assert plan_chunks(370, [300], chunk_seconds=300) == [(0.0, 370)]
+
+
+def test_trim_overlap_drops_the_repeated_words():
+    assert trim_overlap('check the patient\'s blood pressure', 'Blood pressure, then the pulse.') == 'then the pulse.'
+
+
+def test_trim_overlap_keeps_text_without_a_repeat():
+    assert trim_overlap('check the blood pressure', 'Then the pulse.') == 'Then the pulse.'
+
+
+def test_stitch_orders_parts_and_drops_the_overlap():
+    # Timestamps are in centiseconds; the parts meet at 10s and each is padded by 2s of its neighbour
+    chunks = {
+        1: (10, 20, [(800, 1150, 'and then the pulse'), (1150, 1900, 'and the temperature')]),
+        0: (0, 10, [(0, 600, 'First check the airway'), (600, 1150, 'then the breathing and then')]),
+    }
+    merged = stitch(chunks)
+    assert [segment[:2] for segment in merged] == [(0, 600), (600, 1150), (1150, 1900)]
+    assert segments_to_text(merged) == 'First check the airway then the breathing and then and the temperature'
+
+
+def test_stitch_keeps_segments_past_the_end_of_the_last_part():
+    chunks = {0: (0, 10, [(0, 500, 'one')]), 1: (10, 20, [(1000, 1500, 'two'), (1900, 2200, 'three')])}
+    assert segments_to_text(stitch(chunks)) == 'one two three'
+
+
+def test_stitch_only_trims_the_start_of_a_part_against_the_previous_part():
+    chunks = {
+        0: (0, 10, [(0, 1000, 'Check the pulse')]),
+        # "and then" is said twice within the part; only the opening segment is compared with part 0
+        1: (10, 20, [(1000, 1400, 'the pulse and then'), (1400, 1700, 'and then the temperature')]),
+    }
+    assert segments_to_text(stitch(chunks)) == 'Check the pulse and then and then the temperature'
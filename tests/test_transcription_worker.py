@@ -0,0 +1,61 @@
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import transcription_worker
+from transcription_worker import transcribe_audio_job, transcribe_live_segment_job
+
+
+class FakeJob:
+    def __init__(self, job_id, payload):
+        self.id = job_id
+        self.payload = payload
+
+    def progress(self, fraction, message=None):
+        pass
+
+
+@pytest.fixture
+def upload(tmp_path):
+    path = tmp_path / 'lecture.webm'
+    path.write_bytes(b'audio')
+    return {'file_path': str(path), 'filename': 'lecture.webm', 'file_size_mb': 1.0, 'title': 'Cardiac',
+            'lecture_date': '2026-10-01', 'course': 'NURS 101', 'enhance': False}
+
+
+def test_requeued_job_returns_the_note_it_already_stored(database, conn, upload, monkeypatch):
+    runs = []
+
+    def transcribe(*args):
+        runs.append(args)
+        return [(0, 300, 'Check the airway')]
+
+    monkeypatch.setattr(transcription_worker, 'transcribe_file', transcribe)
+    first = transcribe_audio_job(FakeJob(7, upload))
+    # The job is requeued after the note was committed, e.g. the worker died before marking it done
+    second = transcribe_audio_job(FakeJob(7, upload))
+
+    assert len(runs) == 1
+    assert second == first and second['transcript'] == 'Check the airway'
+    assert conn.execute('SELECT COUNT(*) FROM audio_notes WHERE job_id = 7').fetchone()[0] == 1
+    assert conn.execute('SELECT COUNT(*) FROM transcript_segments WHERE note_id = ?', (first['id'],)).fetchone()[0] == 1
+
+
+def test_dead_model_process_stops_the_worker(database, conn, upload, monkeypatch):
+    def transcribe(*args, **kwargs):
+        raise BrokenProcessPool('A process in the process pool was terminated abruptly')
+
+    def exit_process(status):
+        raise SystemExit(status)
+
+    monkeypatch.setattr(transcription_worker, 'transcribe_file', transcribe)
+    monkeypatch.setattr(transcription_worker, '_worker', 'host:1')
+    monkeypatch.setattr(transcription_worker.os, '_exit', exit_process)
+
+    for handler, payload in ((transcribe_audio_job, upload),
+                             (transcribe_live_segment_job, {'note_id': 1, 'seq': 0, 'file_path': upload['file_path'],
+                                                            'start_seconds': 0})):
+        with pytest.raises(SystemExit):
+            handler(FakeJob(8, payload))
+        state = conn.execute("SELECT state FROM transcription_workers WHERE worker = 'host:1'").fetchone()[0]
+        assert state == 'stopped'
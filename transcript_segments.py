@@ -0,0 +1,97 @@
+"""Timestamped transcript segments.
+
+Every transcribed note keeps whisper's segments in transcript_segments: t0
+and t1 in centiseconds from the start of the recording, the text, and where
+that text sits in audio_notes.transcript (char_start/char_end; the transcript
+is the segments joined with single spaces, as segments_to_text builds it).
+A player can then fetch just the part of a long transcript around the
+playback position, and a position in the text maps back to a time to seek to.
+
+Offsets refer to the transcript as transcribed, so editing it by hand
+deletes the note's segments rather than leave them pointing at the wrong text.
+"""
+SEGMENT_COLUMNS = 't0, t1, text, char_start, char_end'
+# whisper never emits a segment longer than its 30 second window
+MAX_SEGMENT_CENTISECONDS = 3000
+MAX_WINDOW_SEGMENTS = 500
+
+
+def store_segments(conn, note_id, segments):
+    """Replace a note's segments [(t0, t1, text)]; returns the transcript text they make up"""
+    rows, pieces, offset = [], [], 0
+    for t0, t1, text in segments:
+        if not text:
+            continue
+        if pieces:
+            offset += 1  # the joining space
+        rows.append((note_id, t0, t1, text, offset, offset + len(text)))
+        pieces.append(text)
+        offset += len(text)
+    conn.execute('DELETE FROM transcript_segments WHERE note_id = ?', (note_id,))
+    conn.executemany('''
+        INSERT INTO transcript_segments (note_id, t0, t1, text, char_start, char_end)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return ' '.join(pieces)
+
+
+def delete_transcript_segments(conn, note_id):
+    conn.execute('DELETE FROM transcript_segments WHERE note_id = ?', (note_id,))
+
+
+def segment_to_dict(row):
+    segment = dict(row)
+    segment['start_seconds'] = row['t0'] / 100
+    segment['end_seconds'] = row['t1'] / 100
+    return segment
+
+
+def segments_in_window(conn, note_id, start, end, limit=MAX_WINDOW_SEGMENTS):
+    """Segments overlapping [start, end) (centiseconds), in time order, at most limit of them"""
+    rows = conn.execute(f'''
+        SELECT {SEGMENT_COLUMNS} FROM transcript_segments
+        WHERE note_id = :note_id AND t0 > :earliest AND t0 < :end AND t1 > :start
+        ORDER BY t0
+        LIMIT :limit
+    ''', {'note_id': note_id, 'earliest': start - MAX_SEGMENT_CENTISECONDS, 'start': start, 'end': end,
+          'limit': limit}).fetchall()
+    return [segment_to_dict(row) for row in rows]
+
+
+def next_segment_start(conn, note_id, after):
+    """t0 of the first segment starting at or after `after` (centiseconds), or None"""
+    return conn.execute('''
+        SELECT MIN(t0) FROM transcript_segments WHERE note_id = ? AND t0 >= ?
+    ''', (note_id, after)).fetchone()[0]
+
+
+def transcript_timing(conn, note_id):
+    """(segment count, end of the last segment in centiseconds) for a note"""
+    row = conn.execute('''
+        SELECT COUNT(*), MAX(t1) FROM transcript_segments WHERE note_id = ?
+    ''', (note_id,)).fetchone()
+    return row[0], row[1]
+
+
+def position_for_offset(conn, note_id, offset):
+    """The segment containing character `offset` of the transcript and the time it is spoken (seconds).
+
+    Inside a segment the time is interpolated by character position. None if
+    the note has no segments.
+    """
+    row = conn.execute(f'''
+        SELECT {SEGMENT_COLUMNS} FROM transcript_segments
+        WHERE note_id = ? AND char_start <= ?
+        ORDER BY char_start DESC
+        LIMIT 1
+    ''', (note_id, offset)).fetchone()
+    if row is None:
+        row = conn.execute(f'''
+            SELECT {SEGMENT_COLUMNS} FROM transcript_segments WHERE note_id = ? ORDER BY char_start LIMIT 1
+        ''', (note_id,)).fetchone()
+        if row is None:
+            return None
+    length = max(1, row['char_end'] - row['char_start'])
+    fraction = min(1.0, max(0.0, (offset - row['char_start']) / length))
+    seconds = (row['t0'] + (row['t1'] - row['t0']) * fraction) / 100
+    return {'seconds': round(seconds, 2), 'segment': segment_to_dict(row)}
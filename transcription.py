@@ -0,0 +1,344 @@
+"""Whisper transcription for the transcription worker.
+
+The web workers only queue transcription jobs (TRANSCRIBE_KIND on
+TRANSCRIBE_QUEUE); whisper.cpp is only ever imported inside the model
+processes started by start_pool(), which only transcription_worker.py calls.
+
+A recording is cut into parts of about TRANSCRIBE_CHUNK_SECONDS at silences
+that ffmpeg's silencedetect finds, each part padded with
+TRANSCRIBE_OVERLAP_SECONDS of its neighbours. The parts are transcribed
+concurrently by TRANSCRIBE_WORKERS processes, each holding one model that
+uses WHISPER_THREADS threads, then stitched back in order. A segment belongs
+to the part its midpoint falls in, and words repeated across a cut are
+dropped.
+
+How whisper decodes is set per job by a mode from TRANSCRIBE_MODES:
+'standard' follows the engine settings (WHISPER_STRATEGY, WHISPER_BEAM_SIZE,
+WHISPER_BEST_OF, WHISPER_LANGUAGE), 'draft' is greedy with a single
+candidate, and 'accurate' is beam search. Draft and accurate can also use
+their own model size (WHISPER_DRAFT_MODEL, WHISPER_ACCURATE_MODEL). Every
+model a mode needs is loaded, and run once on silence, when the model
+processes start, so no job pays for loading or the first inference.
+"""
+import json
+import multiprocessing
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+WHISPER_MODEL = os.getenv('WHISPER_MODEL', 'base')
+WHISPER_THREADS = int(os.getenv('WHISPER_THREADS', '4'))
+WHISPER_STRATEGY = os.getenv('WHISPER_STRATEGY', 'greedy')  # greedy or beam
+WHISPER_BEAM_SIZE = int(os.getenv('WHISPER_BEAM_SIZE', '5'))
+WHISPER_BEST_OF = int(os.getenv('WHISPER_BEST_OF', '5'))
+WHISPER_LANGUAGE = os.getenv('WHISPER_LANGUAGE', 'en')  # 'auto' detects the language of each part
+WHISPER_DRAFT_MODEL = os.getenv('WHISPER_DRAFT_MODEL') or WHISPER_MODEL
+WHISPER_ACCURATE_MODEL = os.getenv('WHISPER_ACCURATE_MODEL') or WHISPER_MODEL
+# Model processes; together they use TRANSCRIBE_WORKERS x WHISPER_THREADS cores (unset or empty: all of them)
+TRANSCRIBE_WORKERS = int(os.getenv('TRANSCRIBE_WORKERS') or max(1, (os.cpu_count() or 1) // WHISPER_THREADS))
+TRANSCRIBE_CHUNK_SECONDS = float(os.getenv('TRANSCRIBE_CHUNK_SECONDS', '300'))
+TRANSCRIBE_OVERLAP_SECONDS = float(os.getenv('TRANSCRIBE_OVERLAP_SECONDS', '2'))
+TRANSCRIBE_SILENCE_DB = float(os.getenv('TRANSCRIBE_SILENCE_DB', '-35'))
+TRANSCRIBE_SILENCE_SECONDS = float(os.getenv('TRANSCRIBE_SILENCE_SECONDS', '0.4'))
+TRANSCRIBE_START_METHOD = os.getenv('TRANSCRIBE_START_METHOD') or None
+
+# mode -> model and decoding settings
+TRANSCRIBE_MODES = {
+    'draft': {'model': WHISPER_DRAFT_MODEL, 'strategy': 'greedy', 'best_of': 1, 'beam_size': 1},
+    'standard': {'model': WHISPER_MODEL, 'strategy': WHISPER_STRATEGY, 'best_of': WHISPER_BEST_OF,
+                 'beam_size': WHISPER_BEAM_SIZE},
+    'accurate': {'model': WHISPER_ACCURATE_MODEL, 'strategy': 'beam', 'best_of': WHISPER_BEST_OF,
+                 'beam_size': max(WHISPER_BEAM_SIZE, 5)},
+}
+TRANSCRIBE_MODE = os.getenv('TRANSCRIBE_MODE', 'standard')
+LANGUAGE_PATTERN = re.compile(r'^(auto|[a-z]{2,3})$')
+
+TRANSCRIBE_QUEUE = 'transcription'
+TRANSCRIBE_KIND = 'transcribe_audio'
+# Live recordings (see live_notes.py): one job per uploaded segment, then one to close the note.
+# They have their own queue so a lecture being recorded never waits behind whole-file jobs.
+LIVE_QUEUE = 'live'
+LIVE_SEGMENT_KIND = 'transcribe_live_segment'
+LIVE_FINISH_KIND = 'finish_live_note'
+# Saved recordings, shared by the web app and the worker
+AUDIO_FOLDER = os.path.join(os.path.dirname(__file__), 'audio_storage')
+# A transcription worker that hasn't heartbeated for this long is gone
+TRANSCRIBER_STALE_SECONDS = 60
+
+SAMPLE_RATE = 16000
+SILENCE_PATTERN = re.compile(r'silence_(start|end): (-?[\d.]+)')
+# Longest run of words looked for on both sides of a cut
+MAX_OVERLAP_WORDS = 20
+
+
+def resolve_options(mode=None, language=None):
+    """Decoding options for a job: {'mode', 'language'}; raises ValueError for unknown values"""
+    mode = mode or TRANSCRIBE_MODE
+    if mode not in TRANSCRIBE_MODES:
+        raise ValueError(f"mode must be one of: {', '.join(TRANSCRIBE_MODES)}")
+    language = (language or WHISPER_LANGUAGE).lower()
+    if not LANGUAGE_PATTERN.match(language):
+        raise ValueError("language must be a language code such as 'en', or 'auto'")
+    return {'mode': mode, 'language': language}
+
+
+def engine_config():
+    """The engine settings, as reported by the transcription workers"""
+    return {
+        'threads': WHISPER_THREADS,
+        'workers': TRANSCRIBE_WORKERS,
+        'language': WHISPER_LANGUAGE,
+        'default_mode': TRANSCRIBE_MODE,
+        'modes': TRANSCRIBE_MODES,
+    }
+
+
+def decode_params(mode, language):
+    """pywhispercpp transcribe() parameters for a mode; all of them, since the model keeps what it was last given"""
+    import _pywhispercpp as pw
+
+    settings = TRANSCRIBE_MODES[mode]
+    beam = settings['strategy'] == 'beam'
+    return {
+        'strategy': (pw.whisper_sampling_strategy.WHISPER_SAMPLING_BEAM_SEARCH if beam
+                     else pw.whisper_sampling_strategy.WHISPER_SAMPLING_GREEDY),
+        'greedy': {'best_of': settings['best_of']},
+        'beam_search': {'beam_size': settings['beam_size'], 'patience': -1.0},
+        'language': language,
+    }
+
+
+_models = {}
+
+
+def load_model(name=None):
+    """This process's copy of a Whisper model, loaded on the first call"""
+    name = name or WHISPER_MODEL
+    if name not in _models:
+        from pywhispercpp.model import Model
+
+        print(f"[{os.getpid()}] Loading Whisper model '{name}' with {WHISPER_THREADS} threads...")
+        started = time.monotonic()
+        _models[name] = Model(name, n_threads=WHISPER_THREADS, print_progress=False)
+        print(f"[{os.getpid()}] Whisper model '{name}' loaded in {time.monotonic() - started:.1f}s")
+    return _models[name]
+
+
+def configured_models():
+    return sorted({settings['model'] for settings in TRANSCRIBE_MODES.values()})
+
+
+def audio_duration(file_path):
+    """Length of an audio file in seconds (via ffprobe), or None if it can't be read"""
+    try:
+        output = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', file_path],
+            capture_output=True, text=True, timeout=30, check=True
+        ).stdout
+        return float(json.loads(output)['format']['duration'])
+    except (OSError, subprocess.SubprocessError, ValueError, KeyError):
+        return None
+
+
+def find_silences(file_path):
+    """Midpoints (seconds) of the silences ffmpeg detects; empty if detection fails"""
+    try:
+        stderr = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-nostats', '-i', file_path, '-af',
+             f'silencedetect=noise={TRANSCRIBE_SILENCE_DB}dB:d={TRANSCRIBE_SILENCE_SECONDS}', '-f', 'null', '-'],
+            capture_output=True, text=True, timeout=600
+        ).stderr
+    except (OSError, subprocess.SubprocessError):
+        return []
+    midpoints, start = [], None
+    for kind, value in SILENCE_PATTERN.findall(stderr):
+        if kind == 'start':
+            start = max(0.0, float(value))
+        elif start is not None:
+            midpoints.append((start + float(value)) / 2)
+            start = None
+    return midpoints
+
+
+def plan_chunks(duration, silences, chunk_seconds=None):
+    """[(start, end)] cut points covering the recording, preferring a silence near each target cut"""
+    chunk_seconds = chunk_seconds or TRANSCRIBE_CHUNK_SECONDS
+    cuts = [0.0]
+    while duration - cuts[-1] > chunk_seconds * 1.25:
+        target = cuts[-1] + chunk_seconds
+        window = [s for s in silences if abs(s - target) <= chunk_seconds / 4]
+        cuts.append(min(window, key=lambda s: abs(s - target)) if window else target)
+    cuts.append(duration)
+    return list(zip(cuts, cuts[1:]))
+
+
+def decode_audio(file_path, start=0.0, duration=None):
+    """16 kHz mono float32 samples of (part of) a file, decoded by ffmpeg"""
+    import numpy as np
+
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-ss', f'{start:.3f}', '-i', file_path]
+    if duration is not None:
+        command += ['-t', f'{duration:.3f}']
+    command += ['-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), '-']
+    raw = subprocess.run(command, capture_output=True, check=True).stdout
+    return np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def concat_audio(file_paths, output_path):
+    """Join recordings of the same format into one file without re-encoding; False if ffmpeg fails"""
+    list_path = output_path + '.txt'
+    with open(list_path, 'w') as f:
+        for path in file_paths:
+            f.write("file '%s'\n" % os.path.abspath(path).replace("'", "'\\''"))
+    try:
+        subprocess.run(['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-f', 'concat', '-safe', '0',
+                        '-i', list_path, '-c', 'copy', output_path], capture_output=True, timeout=600, check=True)
+        return True
+    except (OSError, subprocess.SubprocessError):
+        return False
+    finally:
+        os.remove(list_path)
+
+
+def _init_worker():
+    """Load every configured model and run each once, so the first real job runs at full speed"""
+    import numpy as np
+
+    for name in configured_models():
+        started = time.monotonic()
+        load_model(name).transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32))
+        print(f"[{os.getpid()}] Whisper model '{name}' warmed up in {time.monotonic() - started:.1f}s")
+
+
+def _worker_ready():
+    time.sleep(0.2)  # long enough that every warm-up task lands in a different process
+    return os.getpid()
+
+
+def transcribe_range(file_path, start, end, options=None):
+    """Segments [(t0, t1, text)] of file_path between start and end seconds; runs in a model process.
+
+    Timestamps are whisper's centiseconds, relative to the whole recording.
+    options come from resolve_options().
+    """
+    options = options or resolve_options()
+    model = load_model(TRANSCRIBE_MODES[options['mode']]['model'])
+    audio = decode_audio(file_path, start, end - start)
+    if audio.size == 0:
+        return []
+    offset = int(round(start * 100))
+    segments = model.transcribe(audio, **decode_params(options['mode'], options['language']))
+    return [(seg.t0 + offset, seg.t1 + offset, seg.text.strip()) for seg in segments]
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def start_pool(workers=None, on_started=None):
+    """Start the model processes and wait until each has loaded and warmed up its models.
+
+    on_started() is called once the processes exist but before the wait, so a
+    caller can start its own threads without them being forked into the
+    model processes.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            workers = _pool_workers = workers or TRANSCRIBE_WORKERS
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                        mp_context=multiprocessing.get_context(TRANSCRIBE_START_METHOD))
+            futures = [_pool.submit(_worker_ready) for _ in range(workers)]
+            if on_started:
+                on_started()
+            pids = {future.result() for future in futures}
+            print(f"{len(pids)} Whisper model process(es) ready")
+        return _pool
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def trim_overlap(previous_text, text):
+    """Drop the words at the start of text that repeat the end of previous_text"""
+    before, after = _words(previous_text)[-MAX_OVERLAP_WORDS:], _words(text)
+    for size in range(min(len(before), len(after), MAX_OVERLAP_WORDS), 1, -1):
+        if before[-size:] == after[:size]:
+            # Cut the original text after the size-th word so punctuation and case survive
+            matches = list(re.finditer(r"[A-Za-z0-9']+", text))
+            return text[matches[size - 1].end():].lstrip(' ,.;:!?-') if len(matches) >= size else ''
+    return text
+
+
+def stitch(chunks):
+    """Merge {index: (start, end, segments)} into one ordered list of segments without the overlaps"""
+    merged = []
+    for index in sorted(chunks):
+        start, end, segments = chunks[index]
+        # Only the part's opening segments, up to the end of the previous part's last one, can repeat it
+        tail = merged[-1] if merged else None
+        for t0, t1, text in segments:
+            middle = (t0 + t1) / 200  # seconds
+            if not start <= middle < end and not (index == max(chunks) and middle >= end):
+                continue  # this stretch belongs to the neighbouring part
+            if tail is not None and t0 < tail[1] + 100:
+                text = trim_overlap(tail[2], text)
+            else:
+                tail = None
+            if text:
+                merged.append((t0, t1, text))
+    return merged
+
+
+def segments_to_text(segments):
+    return ' '.join(text for _, _, text in segments if text)
+
+
+def transcribe_file(file_path, on_progress=None, on_chunk=None, completed=None, options=None):
+    """Transcribe an audio file on the model processes; returns its segments [(t0, t1, text)].
+
+    options ({'mode', 'language'}, see resolve_options) default to the engine settings.
+
+    completed maps part index -> segments already transcribed (a resumed job)
+    and those parts are skipped; on_chunk(index, start, end, segments) is
+    called as each remaining part finishes, and on_progress(fraction, message)
+    after it.
+    """
+    pool = start_pool()
+    duration = audio_duration(file_path)
+    if duration is None:
+        raise ValueError('Could not read the audio file (is ffmpeg installed?)')
+
+    plan = plan_chunks(duration, find_silences(file_path) if duration > TRANSCRIBE_CHUNK_SECONDS * 1.25 else [])
+    completed = completed or {}
+    chunks = {index: (start, end, completed[index]) for index, (start, end) in enumerate(plan) if index in completed}
+    pending = [(index, start, end) for index, (start, end) in enumerate(plan) if index not in completed]
+    print(f"Transcribing {duration / 60:.1f} minutes in {len(plan)} part(s), {len(pending)} to go")
+
+    running = {}
+    while pending or running:
+        # At most one part per model process, so a live segment submitted meanwhile
+        # waits for the parts already running rather than the rest of the recording
+        while pending and len(running) < _pool_workers:
+            index, start, end = pending.pop(0)
+            future = pool.submit(transcribe_range, file_path, max(0.0, start - TRANSCRIBE_OVERLAP_SECONDS),
+                                 min(duration, end + TRANSCRIBE_OVERLAP_SECONDS), options)
+            running[future] = index
+        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+            index = running.pop(future)
+            start, end = plan[index]
+            segments = future.result()
+            chunks[index] = (start, end, segments)
+            if on_chunk:
+                on_chunk(index, start, end, segments)
+            if on_progress:
+                done = sum(chunk_end - chunk_start for chunk_start, chunk_end, _ in chunks.values())
+                on_progress(done / duration, f'Transcribed {len(chunks)} of {len(plan)} parts '
+                                             f'({done / 60:.1f} of {duration / 60:.1f} minutes)')
+    return stitch(chunks)
@@ -0,0 +1,322 @@
+"""Transcription worker process.
+
+    python transcription_worker.py
+    python transcription_worker.py --check   # container health check
+
+Starts the Whisper model processes (TRANSCRIBE_WORKERS, each loading and
+warming up its models once), then runs transcribe_audio jobs from the SQLite job queue one at
+a time, each spread over all model processes. /api/audio/transcribe only
+saves the upload and queues the job, so web workers never hold a request open
+for a whole lecture and never load a model of their own.
+
+Every finished part is saved in transcription_chunks as soon as it is done:
+/api/audio/transcribe/<job_id> shows the partial transcript, and a job that
+is requeued after a crash only transcribes the parts still missing. The note
+is stored with its job id, so a job requeued after storing it returns that
+note rather than adding a second one.
+
+If a model process dies (say it is killed for memory), the pool cannot run
+anything again, and forking a new one next to the worker's threads is not
+safe. The worker marks itself stopped and exits so the container restarts
+it; its jobs go back to the queue once their heartbeat is stale.
+
+Live recordings (live_notes.py) have their own queue, LIVE_QUEUE, served by
+a second dispatcher so they never wait behind a whole lecture: one job per
+uploaded segment, and a final job that joins the segments' audio and
+completes the note. Live jobs run one at a time in the order they were
+queued, so the final job only starts once every segment uploaded before it
+has been transcribed. Both dispatchers share the model processes.
+
+The worker does not import the Flask app: the web app creates and migrates
+the database, and the worker only needs the job queue, the transcription
+engine and the Ollama client.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures.process import BrokenProcessPool
+from functools import wraps
+
+from db import connection
+from jobs import Dispatcher, JobFailed, job_handler
+from live_notes import (COMPLETE, fail_segment, get_live_note, remove_segment_files, segment_counts, segment_files,
+                        set_live_status, store_segment)
+from ollama_client import enhance_transcript_with_ai
+from transcription import (AUDIO_FOLDER, LIVE_FINISH_KIND, LIVE_QUEUE, LIVE_SEGMENT_KIND, TRANSCRIBE_KIND,
+                           TRANSCRIBE_QUEUE, TRANSCRIBER_STALE_SECONDS, audio_duration, concat_audio, engine_config, segments_to_text,
+                           start_pool, transcribe_file)
+from transcript_segments import store_segments
+
+HEARTBEAT_SECONDS = 15
+
+# This process's row in transcription_workers; set by main()
+_worker = None
+
+
+def load_completed_chunks(job_id):
+    with connection() as conn:
+        rows = conn.execute('SELECT chunk_index, segments FROM transcription_chunks WHERE job_id = ?', (job_id,))
+        return {row['chunk_index']: [tuple(segment) for segment in json.loads(row['segments'])] for row in rows}
+
+
+def save_chunk(job_id, index, start, end, segments):
+    with connection() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO transcription_chunks (job_id, chunk_index, start_seconds, end_seconds, segments, text)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (job_id, index, start, end, json.dumps(segments), segments_to_text(segments)))
+        conn.commit()
+
+
+def stop_on_broken_pool(handler):
+    """Wrap a job handler so that a dead model process stops the worker instead of failing the job"""
+    @wraps(handler)
+    def wrapper(job):
+        try:
+            return handler(job)
+        except BrokenProcessPool:
+            traceback.print_exc()
+            print(f"A model process died during job {job.id}; stopping so the worker is restarted")
+            set_worker_state(_worker, 'stopped')
+            os._exit(1)
+    return wrapper
+
+
+def note_result(note_id, transcript, enhanced_notes, transcription_time, file_size_mb):
+    return {
+        'id': note_id,
+        'transcript': transcript,
+        'enhanced_notes': enhanced_notes,
+        'transcription_time_seconds': transcription_time,
+        'file_size_mb': round(file_size_mb, 2),
+        'success': True
+    }
+
+
+@job_handler(TRANSCRIBE_KIND)
+@stop_on_broken_pool
+def transcribe_audio_job(job):
+    """Transcribe a saved upload, optionally enhance it, and store the audio note.
+
+    The result is the body /api/audio/transcribe used to return.
+    """
+    payload = job.payload
+    with connection() as conn:
+        note = conn.execute('''
+            SELECT id, transcript, enhanced_notes, transcription_time_seconds, file_size_mb
+            FROM audio_notes WHERE job_id = ?
+        ''', (job.id,)).fetchone()
+    if note is not None:
+        # An earlier run stored the note but was interrupted before the job was marked done
+        print(f"Job {job.id} already stored note {note['id']}")
+        return note_result(*note)
+
+    file_path = payload['file_path']
+    if not os.path.exists(file_path):
+        raise JobFailed({'error': 'Audio file is missing', 'details': payload['filename']})
+
+    print(f"=== Starting transcription of {payload['filename']} ({payload['file_size_mb']:.2f} MB) ===")
+    job.progress(0.05, 'Transcribing audio')
+    start_time = time.time()
+
+    def on_progress(fraction, message):
+        job.progress(0.05 + 0.85 * fraction, message)
+
+    def on_chunk(index, start, end, segments):
+        save_chunk(job.id, index, start, end, segments)
+
+    completed = load_completed_chunks(job.id)
+    if completed:
+        print(f"Resuming with {len(completed)} part(s) already transcribed")
+    try:
+        segments = transcribe_file(file_path, on_progress, on_chunk, completed, payload.get('options'))
+    except ValueError as e:
+        raise JobFailed({'error': 'Transcription failed', 'details': str(e)})
+    transcript = segments_to_text(segments)
+    transcription_time = int(time.time() - start_time)
+    print(f"✓ Transcription completed in {transcription_time}s")
+    print(f"Transcript length: {len(transcript)} characters")
+
+    # Enhance with AI if requested
+    enhanced_notes = None
+    if payload['enhance']:
+        job.progress(0.9, 'Enhancing notes with AI')
+        enhanced_notes = enhance_transcript_with_ai(transcript, payload['course'])
+
+    with connection() as conn:
+        cursor = conn.execute('''
+            INSERT INTO audio_notes (title, audio_file_path, transcript, enhanced_notes,
+                                    file_size_mb, transcription_time_seconds, lecture_date,
+                                    course, is_enhanced, job_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(job_id) DO NOTHING
+        ''', (payload['title'], payload['filename'], transcript, enhanced_notes, payload['file_size_mb'],
+              transcription_time, payload['lecture_date'], payload['course'], payload['enhance'], job.id))
+        if cursor.rowcount:
+            note_id = cursor.lastrowid
+            store_segments(conn, note_id, segments)
+        else:
+            # Another run of this job stored it first (the job was requeued while still running)
+            note_id = conn.execute('SELECT id FROM audio_notes WHERE job_id = ?', (job.id,)).fetchone()['id']
+        # The note now holds the transcript; the parts were only kept for progress and resuming
+        conn.execute('DELETE FROM transcription_chunks WHERE job_id = ?', (job.id,))
+        conn.commit()
+
+    return note_result(note_id, transcript, enhanced_notes, transcription_time, payload['file_size_mb'])
+
+
+@job_handler(LIVE_SEGMENT_KIND)
+@stop_on_broken_pool
+def transcribe_live_segment_job(job):
+    """Transcribe one segment of a recording in progress and add it to the note's transcript"""
+    payload = job.payload
+    note_id, seq, file_path = payload['note_id'], payload['seq'], payload['file_path']
+    try:
+        if not os.path.exists(file_path):
+            raise ValueError('Audio segment is missing')
+        segments = transcribe_file(file_path, options=payload.get('options'))
+    except ValueError as e:
+        with connection() as conn:
+            fail_segment(conn, note_id, seq)
+            conn.commit()
+        raise JobFailed({'error': 'Transcription failed', 'details': str(e), 'note_id': note_id, 'seq': seq})
+
+    # Timestamps relative to the start of the lecture, not of this segment
+    offset = int(round(payload['start_seconds'] * 100))
+    segments = [(t0 + offset, t1 + offset, text) for t0, t1, text in segments]
+    with connection() as conn:
+        text = store_segment(conn, note_id, seq, audio_duration(file_path), segments)
+        conn.commit()
+    print(f"Live note {note_id}: segment {seq} transcribed ({len(text)} characters)")
+    return {'note_id': note_id, 'seq': seq, 'text': text}
+
+
+@job_handler(LIVE_FINISH_KIND)
+def finish_live_note_job(job):
+    """Join a live note's segments into one recording, optionally enhance it, and mark it complete.
+
+    The result is the body transcribe_audio jobs return.
+    """
+    payload = job.payload
+    note_id = payload['note_id']
+    start_time = time.time()
+    with connection() as conn:
+        note = get_live_note(conn, note_id)
+        if note is None:
+            raise JobFailed({'error': 'Live note not found', 'note_id': note_id})
+        files = [path for path in segment_files(conn, note_id) if os.path.exists(path)]
+        duration = conn.execute('''
+            SELECT MAX(start_seconds + COALESCE(duration_seconds, 0)) FROM live_segments WHERE note_id = ?
+        ''', (note_id,)).fetchone()[0]
+        counts = segment_counts(conn, note_id)
+
+    job.progress(0.2, 'Joining the recorded segments')
+    filename = f'live_{note_id}.webm'
+    audio_path = os.path.join(AUDIO_FOLDER, filename)
+    if files and concat_audio(files, audio_path):
+        file_size_mb = os.path.getsize(audio_path) / (1024 * 1024)
+    else:
+        # Keep the segments rather than lose the audio
+        filename, file_size_mb = None, sum(os.path.getsize(path) for path in files) / (1024 * 1024)
+
+    enhanced_notes = None
+    if payload['enhance'] and note['transcript']:
+        job.progress(0.5, 'Enhancing notes with AI')
+        enhanced_notes = enhance_transcript_with_ai(note['transcript'], note['course'] or '')
+
+    transcription_time = int(time.time() - start_time)
+    with connection() as conn:
+        conn.execute('''
+            UPDATE audio_notes
+            SET audio_file_path = ?, enhanced_notes = ?, is_enhanced = ?, duration_seconds = ?,
+                file_size_mb = ?, transcription_time_seconds = ?
+            WHERE id = ?
+        ''', (filename, enhanced_notes, enhanced_notes is not None, int(duration or 0), file_size_mb,
+              transcription_time, note_id))
+        set_live_status(conn, note_id, COMPLETE)
+        if filename:
+            remove_segment_files(conn, note_id)
+        conn.commit()
+    print(f"Live note {note_id} complete: {counts['done']} segment(s), {counts['failed']} failed")
+
+    return {
+        'id': note_id,
+        'transcript': note['transcript'],
+        'enhanced_notes': enhanced_notes,
+        'transcription_time_seconds': transcription_time,
+        'file_size_mb': round(file_size_mb, 2),
+        'failed_segments': counts['failed'],
+        'success': True
+    }
+
+
+def set_worker_state(worker, state):
+    """Record this worker in transcription_workers, which /api/audio/engine reports"""
+    with connection() as conn:
+        conn.execute('''
+            INSERT INTO transcription_workers (worker, state, config, ready_at, heartbeat_at)
+            VALUES (?, ?, ?, CASE WHEN ? = 'ready' THEN CURRENT_TIMESTAMP END, CURRENT_TIMESTAMP)
+            ON CONFLICT(worker) DO UPDATE SET state = excluded.state, config = excluded.config,
+                ready_at = excluded.ready_at, heartbeat_at = CURRENT_TIMESTAMP
+        ''', (worker, state, json.dumps(engine_config()), state))
+        conn.commit()
+
+
+def heartbeat(worker):
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        try:
+            with connection() as conn:
+                conn.execute('''
+                    UPDATE transcription_workers SET heartbeat_at = CURRENT_TIMESTAMP WHERE worker = ?
+                ''', (worker,))
+                conn.commit()
+        except Exception as e:
+            print(f"Transcription worker heartbeat failed: {e}")
+
+
+def check_health():
+    """Exit status for the container health check: 0 while a worker on this host is heartbeating"""
+    with connection() as conn:
+        row = conn.execute(f'''
+            SELECT 1 FROM transcription_workers
+            WHERE worker LIKE ? AND heartbeat_at >= datetime('now', '-{TRANSCRIBER_STALE_SECONDS} seconds')
+        ''', (f'{os.uname().nodename}:%',)).fetchone()
+    return 0 if row else 1
+
+
+def main():
+    global _worker
+    # CPU-only whisper.cpp, set before any model process starts (the Docker image sets these too)
+    os.environ.setdefault('GGML_CUDA_NO_PINNED', '1')
+    os.environ.setdefault('WHISPER_NO_GPU', '1')
+
+    dispatcher = Dispatcher(kinds=(TRANSCRIBE_KIND,), queue=TRANSCRIBE_QUEUE, concurrency=1)
+    live_dispatcher = Dispatcher(kinds=(LIVE_SEGMENT_KIND, LIVE_FINISH_KIND), queue=LIVE_QUEUE, concurrency=1)
+    _worker = dispatcher.worker
+    set_worker_state(_worker, 'loading')
+
+    def start_heartbeat():
+        # Only once the model processes are forked, so none of them inherits the thread
+        threading.Thread(target=heartbeat, args=(dispatcher.worker,), daemon=True).start()
+
+    try:
+        start_pool(on_started=start_heartbeat)
+        set_worker_state(dispatcher.worker, 'ready')
+        threading.Thread(target=live_dispatcher.run_forever, name='live-dispatcher', daemon=True).start()
+        print(f"Transcription worker {os.getpid()} waiting for jobs on the '{TRANSCRIBE_QUEUE}' "
+              f"and '{LIVE_QUEUE}' queues")
+        dispatcher.run_forever()
+    finally:
+        with connection() as conn:
+            conn.execute('DELETE FROM transcription_workers WHERE worker = ?', (dispatcher.worker,))
+            conn.commit()
+
+
+if __name__ == '__main__':
+    if '--check' in sys.argv[1:]:
+        sys.exit(check_health())
+    main()